@@ -1,4 +1,3 @@
-import logging
 import sys
 
 __version__ = "0.3.0"
@@ -6,5 +5,3 @@ __version__ = "0.3.0"
 if sys.version_info[0] == 2:
     print("Python v3 is needed!")
     sys.exit(-1)
-
-logging.basicConfig(level=logging.DEBUG)
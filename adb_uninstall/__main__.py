@@ -1,6 +1,18 @@
 #!/usr/bin/env python3
 
-from adb_uninstall.gui import main
+"""
+    Without arguments: start the GUI
+    With arguments: the headless command line interface, see: adb_uninstall/cli.py
+"""
+
+import sys
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        from adb_uninstall.cli import main
+
+        sys.exit(main())
+    else:
+        from adb_uninstall.gui import main
+
+        main()
@@ -0,0 +1,98 @@
+import logging
+
+from adb_uninstall.adb_client import AdbClient, AdbServerUnavailable
+from adb_uninstall.adb_policy import default_policy
+from adb_uninstall.adb_shell import AdbShellSession
+from adb_uninstall.metrics import command_kind, registry
+from adb_uninstall.utils.subprocess2 import verbose_check_output, verbose_iter_output
+
+log = logging.getLogger(__name__)
+
+
+class AdbBackend:
+    """
+    Execute adb commands for one device (or the only one, if serial is None)
+    in the fastest available way:
+
+     1. directly via the adb server socket
+     2. 'adb shell ...' commands via a long-lived 'adb shell' session
+     3. call the 'adb' binary
+
+    The latency of all calls is recorded in the metrics registry.
+    Timeouts, retries and the circuit breaker of the device are handled by the command policy.
+    """
+
+    def __init__(self, *, serial=None, client=None, use_client=True, metrics=registry, policy=default_policy):
+        self.serial = serial
+        self.metrics = metrics
+        self.policy = policy
+        self.owns_client = client is None
+        if client is None and use_client:
+            client = AdbClient()
+        self.client = client
+        self.shell_session = AdbShellSession(serial=serial)
+
+    def check_output(self, *args, timeout=10):
+        """
+        Drop-in for verbose_check_output()
+        """
+        return self.policy.call(
+            self._measured_check_output, args, serial=self.serial, kind=command_kind(args), timeout=timeout
+        )
+
+    def _measured_check_output(self, *args, timeout):
+        with self.metrics.measure(command_kind(args), self.serial):
+            return self._check_output(*args, timeout=timeout)
+
+    def _check_output(self, *args, timeout=10):
+        assert args[0] == "adb", "Only adb commands are supported, not: %r" % args[0]
+
+        if self.client is not None and self.client.supports(args):
+            try:
+                return self.client.check_output(*args, serial=self.serial, timeout=timeout)
+            except AdbServerUnavailable as err:
+                log.warning("%s - fallback to 'adb' binary", err)
+
+        if args[1] == "shell":
+            return self.shell_session.check_output(*args[2:], timeout=timeout)
+
+        if self.serial:
+            args = (args[0], "-s", self.serial) + args[1:]
+        return verbose_check_output(*args, timeout=timeout)
+
+    def iter_output(self, *args, timeout=10):
+        """
+        Streaming version of check_output(): Yields the output lines as soon as they arrive.
+        """
+        yield from self.policy.iter_call(
+            self._measured_iter_output, args, serial=self.serial, kind=command_kind(args), timeout=timeout
+        )
+
+    def _measured_iter_output(self, *args, timeout):
+        with self.metrics.measure(command_kind(args), self.serial):
+            yield from self._iter_output(*args, timeout=timeout)
+
+    def _iter_output(self, *args, timeout=10):
+        assert args[0] == "adb", "Only adb commands are supported, not: %r" % args[0]
+
+        if self.client is not None and self.client.supports(args):
+            try:
+                self.client.connect().close()
+            except AdbServerUnavailable as err:
+                log.warning("%s - fallback to 'adb' binary", err)
+            else:
+                yield from self.client.iter_output(*args, serial=self.serial, timeout=timeout)
+                return
+
+        if args[1] == "shell":
+            yield from self.shell_session.iter_output(*args[2:], timeout=timeout)
+            return
+
+        if self.serial:
+            args = (args[0], "-s", self.serial) + args[1:]
+        yield from verbose_iter_output(*args, timeout=timeout)
+
+    def close(self):
+        self.shell_session.close()
+        if self.client is not None and self.owns_client:
+            self.client.close()
@@ -0,0 +1,221 @@
+"""
+    Run many 'pm' commands with one 'adb shell' call.
+
+    All commands for a list of packages are joined into one device side shell script.
+    After each command a marker line with the package name and the exit code is printed,
+    so the output can be split back into per-package results.
+"""
+
+import logging
+import re
+import subprocess
+
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+PM_UNINSTALL = ("pm", "uninstall", "--user", "0")
+PM_DISABLE_USER = ("pm", "disable-user")
+
+# Reverse the commands above, see: journal.py
+PM_INSTALL_EXISTING = ("cmd", "package", "install-existing", "--user", "0")
+PM_ENABLE = ("pm", "enable")
+
+BATCH_MARKER = "__ADB_UNINSTALL_RESULT__"
+
+# Old adb server/daemon versions limit the shell command line to 4KB:
+BATCH_MAX_SCRIPT_LENGTH = 3500
+
+# Only these chars are valid in package names, so no shell quoting is needed:
+PACKAGE_NAME_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+
+
+class BatchResult:
+    def __init__(self, *, package_name, exit_code, message):
+        self.package_name = package_name
+        self.exit_code = exit_code
+        self.message = message
+
+    @property
+    def success(self):
+        return self.exit_code == 0
+
+    def __str__(self):
+        return "%s: exit code %r: %s" % (self.package_name, self.exit_code, self.message)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+def build_batch_script(command, package_names):
+    """
+    >>> script = build_batch_script(PM_DISABLE_USER, ["com.foo", "com.bar"])
+    >>> print(script.replace(";pm", ";\\npm"))
+    pm disable-user com.foo 2>&1;echo "__ADB_UNINSTALL_RESULT__ com.foo $?";
+    pm disable-user com.bar 2>&1;echo "__ADB_UNINSTALL_RESULT__ com.bar $?"
+    """
+    parts = []
+    for package_name in package_names:
+        if not PACKAGE_NAME_RE.match(package_name):
+            raise ValueError("Invalid package name: %r" % package_name)
+
+        parts.append(
+            '%s %s 2>&1;echo "%s %s $?"' % (" ".join(command), package_name, BATCH_MARKER, package_name)
+        )
+    return ";".join(parts)
+
+
+def build_batch_scripts(command, package_names, max_length=BATCH_MAX_SCRIPT_LENGTH):
+    """
+    Split the packages into as few scripts as possible, each not longer than max_length.
+
+    >>> scripts = build_batch_scripts(PM_UNINSTALL, ["com.foo%i" % i for i in range(100)])
+    >>> len(scripts)
+    3
+    >>> all(len(script) <= BATCH_MAX_SCRIPT_LENGTH for script in scripts)
+    True
+    """
+    scripts = []
+    chunk = []
+    length = 0
+    for package_name in package_names:
+        part_length = len(build_batch_script(command, [package_name])) + 1
+        if chunk and length + part_length > max_length:
+            scripts.append(build_batch_script(command, chunk))
+            chunk = []
+            length = 0
+        chunk.append(package_name)
+        length += part_length
+
+    if chunk:
+        scripts.append(build_batch_script(command, chunk))
+
+    return scripts
+
+
+def parse_batch_output(output):
+    """
+    Split the output of a batch script into BatchResult instances.
+
+    >>> output = (
+    ...     "Success\\n"
+    ...     "__ADB_UNINSTALL_RESULT__ com.foo 0\\n"
+    ...     "Failure [not installed for 0]\\n"
+    ...     "__ADB_UNINSTALL_RESULT__ com.bar 1\\n"
+    ... )
+    >>> for result in parse_batch_output(output):
+    ...     print(result)
+    com.foo: exit code 0: Success
+    com.bar: exit code 1: Failure [not installed for 0]
+    """
+    results = []
+    lines = []
+    for line in output.splitlines():
+        if line.startswith(BATCH_MARKER):
+            try:
+                package_name, exit_code = line[len(BATCH_MARKER):].split()
+                exit_code = int(exit_code)
+            except ValueError:
+                log.error("Can't parse result line: %r", line)
+                continue
+
+            results.append(
+                BatchResult(package_name=package_name, exit_code=exit_code, message="\n".join(lines).strip())
+            )
+            lines = []
+        else:
+            lines.append(line)
+
+    return results
+
+
+def parse_package_list(output):
+    """
+    Returns the package names from 'pm list packages' output as a set.
+
+    >>> sorted(parse_package_list("package:com.foo\\npackage:com.bar\\n\\n"))
+    ['com.bar', 'com.foo']
+    """
+    package_names = set()
+    for line in output.splitlines():
+        if line.startswith("package:"):
+            package_names.add(line[8:].strip())
+    return package_names
+
+
+def run_batch(check_output, command, package_names, timeout_per_package=3, should_stop=None):
+    """
+    Run 'command' for all packages and return a list of BatchResult instances.
+
+    'check_output' is called like verbose_check_output(*args, timeout=...)
+    'should_stop' is checked before every script, packages after a stop get no result.
+    A failed script (e.g. timeout or open circuit breaker) doesn't stop the batch:
+    the next scripts fail fast, if the device is dead.
+    """
+    results = []
+    error = None
+    for script in build_batch_scripts(command, package_names):
+        if should_stop is not None and should_stop():
+            log.info("Batch stopped.")
+            break
+
+        package_count = script.count(BATCH_MARKER)
+        try:
+            output = check_output("adb", "shell", script, timeout=max(10, package_count * timeout_per_package))
+        except subprocess.TimeoutExpired as err:
+            error = "timeout after %s" % human_duration(err.timeout)
+            log.error("Batch script with %i packages: %s", package_count, error)
+            continue
+        except subprocess.SubprocessError as err:
+            error = err
+            log.error("Batch script with %i packages: %s", package_count, error)
+            continue
+        if output:
+            results += parse_batch_output(output)
+
+    message = "no result" if error is None else "no result: %s" % error
+    missing = set(package_names) - set(result.package_name for result in results)
+    for package_name in sorted(missing):
+        results.append(BatchResult(package_name=package_name, exit_code=None, message=message))
+
+    return results
+
+
+def verify_uninstall(check_output, package_names):
+    """
+    Returns the set of packages that are still installed for the current user.
+    (or None if the package list can't be fetched)
+    """
+    output = check_output("adb", "shell", "pm", "list", "packages", "--user", "0", timeout=10)
+    if output is None:
+        return None
+    return set(package_names) & parse_package_list(output)
+
+
+def verify_disable_user(check_output, package_names):
+    """
+    Returns the set of packages that are not disabled.
+    (or None if the package list can't be fetched)
+    """
+    output = check_output("adb", "shell", "pm", "list", "packages", "-d", timeout=10)
+    if output is None:
+        return None
+    return set(package_names) - parse_package_list(output)
+
+
+def verify_restore(check_output, package_names):
+    """
+    Returns the set of packages that are not installed and enabled for the current user.
+    Only one query for reinstalled and enabled packages.
+    (or None if the package list can't be fetched)
+    """
+    output = check_output("adb", "shell", "pm", "list", "packages", "-e", "--user", "0", timeout=10)
+    if output is None:
+        return None
+    return set(package_names) - parse_package_list(output)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,359 @@
+"""
+    A pure python client for the adb server (smart-socket protocol).
+
+    Talks directly to the adb server on localhost:5037, so no 'adb' process is needed per command.
+    The protocol is described in adb's 'OVERVIEW.TXT' and 'SERVICES.TXT':
+
+     * Every request is send as 4 hex digits length + payload
+     * The server answers with "OKAY" or "FAIL" + 4 hex digits length + error message
+     * 'host:transport:<serial>' binds the connection to a device,
+       the next request is a device service, e.g.: 'shell:<command>' or 'exec:<command>'
+     * A device service uses the connection until the server closes it.
+
+    Because of the last point, a connection can't be used for more than one command.
+    The pool holds connections that are already bound to a device
+    and refills itself in the background.
+
+    >>> from adb_uninstall.utils.fake_adb_server import FakeAdbServer
+    >>> with FakeAdbServer(serials=["XYZ1234", "ABC5678"]) as server:
+    ...     client = AdbClient(port=server.port)
+    ...     print(client.version())
+    ...     print(client.devices_output())
+    ...     print(client.shell("echo 'Hello World!'", serial="XYZ1234"))
+    ...     print(client.shell("exit 3", serial="ABC5678"))
+    ...     client.close()
+    41
+    List of devices attached
+    XYZ1234                device product:fake model:Fake_1 device:fake transport_id:1
+    ABC5678                device product:fake model:Fake_2 device:fake transport_id:2
+    <BLANKLINE>
+    <BLANKLINE>
+    (0, 'Hello World!\\n')
+    (3, '')
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_uninstall.adb_shell import SentinelLines, parse_sentinel_output, sentinel_command
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+ADB_SERVER_HOST = "127.0.0.1"
+ADB_SERVER_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", 5037))
+
+
+class AdbServerError(subprocess.SubprocessError):
+    """
+    The adb server answered with "FAIL"
+    """
+
+
+class AdbServerUnavailable(AdbServerError):
+    """
+    Can't connect to the adb server, e.g.: server not started
+    """
+
+
+class AdbConnection:
+    def __init__(self, *, host, port, timeout):
+        try:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        except OSError as err:
+            raise AdbServerUnavailable("Can't connect to adb server %s:%s: %s" % (host, port, err))
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def send(self, request):
+        request = request.encode("utf-8")
+        self.sock.sendall(b"%04x%s" % (len(request), request))
+
+    def read_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise AdbServerError("Connection closed by adb server")
+            data += chunk
+        return data
+
+    def read_length_prefixed(self):
+        size = int(self.read_exactly(4), 16)
+        return self.read_exactly(size).decode("utf-8", errors="replace")
+
+    def read_status(self):
+        status = self.read_exactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbServerError(self.read_length_prefixed())
+        raise AdbServerError("Unexpected status from adb server: %r" % status)
+
+    def request(self, request):
+        self.send(request)
+        self.read_status()
+
+    def read_all(self):
+        chunks = []
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        self.sock.close()
+
+
+class AdbClient:
+    """
+    Client for the adb server with a pool of connections that are already bound to a device.
+    """
+
+    def __init__(self, *, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, pool_size=2, timeout=10):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.pool = {}  # serial -> list of AdbConnection instances
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def connect(self):
+        return AdbConnection(host=self.host, port=self.port, timeout=self.timeout)
+
+    def _transport(self, serial):
+        conn = self.connect()
+        try:
+            if serial is None:
+                conn.request("host:transport-any")
+            else:
+                conn.request("host:transport:%s" % serial)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _fill_pool(self, serial):
+        try:
+            conn = self._transport(serial)
+        except (AdbServerError, OSError) as err:
+            log.debug("Can't fill adb connection pool: %s", err)
+            return
+
+        with self.lock:
+            connections = self.pool.setdefault(serial, [])
+            if len(connections) < self.pool_size:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def _acquire(self, serial):
+        """
+        Returns a pooled connection (or None) and starts refilling the pool.
+        """
+        with self.lock:
+            connections = self.pool.get(serial)
+            conn = connections.pop() if connections else None
+
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="adb pool")
+        self.executor.submit(self._fill_pool, serial)
+        return conn
+
+    def host_request(self, request):
+        """
+        Send a 'host:...' request and returns the answer.
+        """
+        conn = self.connect()
+        try:
+            conn.request(request)
+            return conn.read_length_prefixed()
+        finally:
+            conn.close()
+
+    def version(self):
+        return int(self.host_request("host:version"), 16)
+
+    def devices_output(self):
+        """
+        Returns the same output as 'adb devices -l'
+        """
+        return "List of devices attached\n%s\n" % self.host_request("host:devices-l")
+
+    def _open_service(self, service, serial):
+        conn = self._acquire(serial)
+        if conn is not None:
+            try:
+                conn.request(service)
+            except (AdbServerError, OSError) as err:
+                # e.g.: the pooled connection was closed by the adb server
+                log.debug("Pooled connection is unusable: %s", err)
+                conn.close()
+                conn = None
+
+        if conn is None:
+            conn = self._transport(serial)
+            try:
+                conn.request(service)
+            except BaseException:
+                conn.close()
+                raise
+
+        return conn
+
+    def service(self, service, *, serial=None, timeout=None):
+        """
+        Run a device service, e.g. 'shell:...' and returns the complete output as bytes.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        conn = self._open_service(service, serial)
+        conn.settimeout(timeout)
+        try:
+            return conn.read_all()
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(service, timeout)
+        finally:
+            conn.close()
+
+    def iter_service_lines(self, service, *, serial=None, timeout=None):
+        """
+        Run a device service and yields the output lines as soon as they arrive.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        conn = self._open_service(service, serial)
+        deadline = time.monotonic() + timeout
+        rest = b""
+        try:
+            while True:
+                conn.settimeout(max(0.001, deadline - time.monotonic()))
+                try:
+                    chunk = conn.sock.recv(65536)
+                except socket.timeout:
+                    raise subprocess.TimeoutExpired(service, timeout)
+                if not chunk:
+                    break
+
+                lines = (rest + chunk).split(b"\n")
+                rest = lines.pop()
+                for line in lines:
+                    yield line.decode("utf-8", errors="replace").rstrip("\r")
+        finally:
+            conn.close()
+
+        if rest:
+            yield rest.decode("utf-8", errors="replace").rstrip("\r")
+
+    def shell(self, command, *, serial=None, timeout=None):
+        """
+        Run the command in the device shell and returns (exit_code, output)
+        """
+        shell_command, sentinel = sentinel_command(command)
+        output = self.service("shell:%s" % shell_command, serial=serial, timeout=timeout)
+        return parse_sentinel_output(output.decode("utf-8", errors="replace"), sentinel)
+
+    def iter_shell(self, command, *, serial=None, timeout=None):
+        """
+        Run the command in the device shell and yields the output lines as soon as they arrive.
+        Raise CalledProcessError at the end, if the exit code is not 0.
+        """
+        shell_command, sentinel = sentinel_command(command)
+        lines = self.iter_service_lines("shell:%s" % shell_command, serial=serial, timeout=timeout)
+        lines = SentinelLines(lines, sentinel)
+        yield from lines
+
+        if lines.exit_code is None:
+            raise AdbServerError("Connection closed before the end of: %r" % command)
+        if lines.exit_code != 0:
+            raise subprocess.CalledProcessError(lines.exit_code, command)
+
+    def exec_out(self, command, *, serial=None, timeout=None):
+        """
+        Run the command without pty and returns the raw output as bytes.
+        """
+        return self.service("exec:%s" % command, serial=serial, timeout=timeout)
+
+    def supports(self, args):
+        """
+        Can the given adb command line be handled by check_output() ?
+        """
+        if len(args) < 2 or args[0] != "adb":
+            return False
+        return (args[1] in ("shell", "exec-out") and len(args) > 2) or args[1:] in (("devices",), ("devices", "-l"))
+
+    def check_output(self, *args, serial=None, timeout=10):
+        """
+        Drop-in for verbose_check_output() for the commands that supports() accepts.
+        """
+        print("Call: %r (adb server)..." % " ".join(args), end=" ", flush=True)
+        start_time = time.time()
+
+        exit_code = 0
+        if args[1] == "shell":
+            exit_code, output = self.shell(" ".join(args[2:]), serial=serial, timeout=timeout)
+        elif args[1] == "exec-out":
+            output = self.exec_out(" ".join(args[2:]), serial=serial, timeout=timeout)
+            output = output.decode("utf-8", errors="replace")
+        elif args[1] == "devices":
+            output = self.devices_output()
+        else:
+            raise AdbServerError("Not supported: %r" % " ".join(args))
+
+        duration = time.time() - start_time
+        print("(exit code:%r after %s)" % (exit_code, human_duration(duration)))
+
+        if exit_code is None:
+            raise AdbServerError("Connection closed before the end of: %r" % " ".join(args))
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(exit_code, args, output=output)
+
+        return output
+
+    def iter_output(self, *args, serial=None, timeout=10):
+        """
+        Streaming version of check_output(): Yields the output lines as soon as they arrive.
+        """
+        print("Call: %r (adb server)..." % " ".join(args), flush=True)
+        start_time = time.time()
+
+        if args[1] == "shell":
+            yield from self.iter_shell(" ".join(args[2:]), serial=serial, timeout=timeout)
+        elif args[1] == "exec-out":
+            yield from self.iter_service_lines("exec:%s" % " ".join(args[2:]), serial=serial, timeout=timeout)
+        elif args[1] == "devices":
+            yield from self.devices_output().splitlines()
+        else:
+            raise AdbServerError("Not supported: %r" % " ".join(args))
+
+        duration = time.time() - start_time
+        print("Call: %r (exit code:0 after %s)" % (" ".join(args), human_duration(duration)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+        with self.lock:
+            for connections in self.pool.values():
+                for conn in connections:
+                    conn.close()
+            self.pool.clear()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,194 @@
+"""
+    Connect to the adb server and the devices without disturbing a healthy setup.
+
+    The running adb server is probed first ('host:version' + 'host:devices-l').
+    Only if the probe fails, the next matching step of the escalation ladder is used:
+
+     1. 'adb start-server' - if the server is not running
+     2. 'adb reconnect'    - if the devices are e.g. offline
+     3. 'adb kill-server'  - last resort, because this breaks all other tools that use the server
+
+    After each step the probe is retried until the device appears or the step's settle time is over.
+    No step is used, if the server is fine but no device is connected.
+    All steps are timed, see ConnectResult.
+"""
+
+import logging
+import subprocess
+import time
+
+from adb_uninstall.adb_client import AdbServerError
+from adb_uninstall.adb_devices import parse_devices
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+UNAUTHORIZED = "unauthorized"
+
+# Name, adb commands, max. time (in sec.) to wait for a healthy probe after the commands
+# and the ProbeResult property that must be true to use this step:
+ESCALATION_LADDER = (
+    ("probe", (), 0, None),
+    ("start-server", (("adb", "start-server"),), 2, "server_down"),
+    ("reconnect", (("adb", "reconnect"),), 5, "devices_offline"),
+    ("kill-server", (("adb", "kill-server"), ("adb", "start-server")), 5, "broken"),
+)
+PROBE_INTERVAL = 0.25  # sec.
+
+
+class ProbeResult:
+    def __init__(self, *, version=None, devices=None, error=None, duration=0):
+        self.version = version
+        self.devices = devices or []
+        self.error = error
+        self.duration = duration
+
+    @property
+    def online_devices(self):
+        return [device for device in self.devices if device.online]
+
+    @property
+    def healthy(self):
+        return bool(self.online_devices)
+
+    @property
+    def server_down(self):
+        return self.error is not None
+
+    @property
+    def devices_offline(self):
+        return self.error is None and bool(self.devices) and not self.healthy and not self.unauthorized
+
+    @property
+    def broken(self):
+        return self.server_down or self.devices_offline
+
+    @property
+    def unauthorized(self):
+        """
+        Devices are connected, but 'USB Debugging' is not authorized: Escalation will not help.
+        """
+        return bool(self.devices) and all(device.state == UNAUTHORIZED for device in self.devices)
+
+    def __str__(self):
+        if self.error is not None:
+            return "error: %s (%s)" % (self.error, human_duration(self.duration))
+        return "server version %s, %i devices, %i online (%s)" % (
+            self.version, len(self.devices), len(self.online_devices), human_duration(self.duration)
+        )
+
+
+class ConnectResult:
+    def __init__(self):
+        self.steps = []  # list of (step name, duration, ProbeResult)
+        self.probe = None
+
+    @property
+    def healthy(self):
+        return self.probe is not None and self.probe.healthy
+
+    @property
+    def devices(self):
+        return [] if self.probe is None else self.probe.devices
+
+    @property
+    def duration(self):
+        return sum(duration for name, duration, probe in self.steps)
+
+    def __str__(self):
+        return ", ".join("%s: %s" % (name, human_duration(duration)) for name, duration, probe in self.steps)
+
+
+class ConnectionManager:
+    """
+    'client' is a AdbClient instance or None: Probe via 'adb devices -l' (without version handshake)
+    'check_output' is called like verbose_check_output(*args, timeout=...)
+    'on_reset' is called before the adb server/device connection is changed, e.g.: to close pooled connections
+
+    >>> from adb_uninstall.adb_client import AdbClient
+    >>> from adb_uninstall.utils.fake_adb_server import FakeAdbServer
+    >>> with FakeAdbServer(serials=["XYZ1234"]) as server:
+    ...     manager = ConnectionManager(client=AdbClient(port=server.port), check_output=None)
+    ...     result = manager.connect()
+    >>> result.healthy, [name for name, duration, probe in result.steps], [device.serial for device in result.devices]
+    (True, ['probe'], ['XYZ1234'])
+    """
+
+    def __init__(self, *, client, check_output, on_reset=None, should_stop=None, ladder=ESCALATION_LADDER):
+        self.client = client
+        self.check_output = check_output
+        self.on_reset = on_reset
+        self.should_stop = should_stop
+        self.ladder = ladder
+
+    def probe(self):
+        start_time = time.monotonic()
+        result = ProbeResult()
+        try:
+            if self.client is not None:
+                result.version = self.client.version()
+                output = self.client.devices_output()
+            else:
+                output = self.check_output("adb", "devices", "-l", timeout=3)
+                if output is None:
+                    raise AdbServerError("'adb devices' failed")
+        except (AdbServerError, OSError, subprocess.SubprocessError) as err:
+            result.error = err
+        else:
+            result.devices = parse_devices(output)
+        result.duration = time.monotonic() - start_time
+        return result
+
+    def _wait_healthy(self, settle_time):
+        deadline = time.monotonic() + settle_time
+        while True:
+            probe = self.probe()
+            if probe.healthy or probe.unauthorized or time.monotonic() >= deadline:
+                return probe
+            if self.should_stop is not None and self.should_stop():
+                return probe
+            time.sleep(PROBE_INTERVAL)
+
+    def connect(self):
+        """
+        Walk the escalation ladder until a device is online.
+        Returns a ConnectResult with the timing of all used steps.
+        """
+        result = ConnectResult()
+        for name, commands, settle_time, condition in self.ladder:
+            if self.should_stop is not None and self.should_stop():
+                break
+            if condition is not None and not getattr(result.probe, condition):
+                continue
+
+            start_time = time.monotonic()
+            if commands and self.on_reset is not None:
+                self.on_reset()
+            for command in commands:
+                try:
+                    self.check_output(*command, timeout=10)
+                except subprocess.SubprocessError as err:
+                    log.error("%s failed: %s", " ".join(command), err)
+
+            probe = self._wait_healthy(settle_time)
+            duration = time.monotonic() - start_time
+            log.info("Connect step %r: %s", name, probe)
+            result.steps.append((name, duration, probe))
+            result.probe = probe
+
+            if probe.healthy:
+                break
+            if probe.unauthorized:
+                log.error("Device is unauthorized: Please accept 'USB Debugging' on the device.")
+                break
+            if not probe.broken:
+                log.error("No device connected. Maybe 'USB Debugging' is not enabled on device?!?")
+                break
+
+        return result
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
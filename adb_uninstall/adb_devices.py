@@ -0,0 +1,79 @@
+import re
+
+INFO_RE = re.compile(r"^([a-z_]+):(\S+)$")
+
+
+class AdbDevice:
+    ONLINE = "device"
+
+    def __init__(self, *, serial, state, info=None):
+        self.serial = serial
+        self.state = state
+        self.info = info or {}
+
+    @property
+    def online(self):
+        return self.state == self.ONLINE
+
+    @property
+    def model(self):
+        return self.info.get("model", "")
+
+    def __str__(self):
+        parts = [self.state]
+        parts += ["%s:%s" % item for item in self.info.items()]
+        return "%s - %s" % (self.serial, " ".join(parts))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+def parse_devices(output):
+    """
+    Parse the output of 'adb devices -l'
+
+    >>> output = (
+    ...     "List of devices attached\\n"
+    ...     "XYZ1234             device usb:3-10.4 product:foo model:bar device:foobar\\n"
+    ...     "ABC5678             unauthorized usb:3-10.5 transport_id:2\\n"
+    ...     "0123456789ABCDEF    no permissions (user in plugdev group); see [http://foo/bar] usb:1-2\\n"
+    ...     "\\n"
+    ... )
+    >>> for device in parse_devices(output):
+    ...     print(device)
+    XYZ1234 - device usb:3-10.4 product:foo model:bar device:foobar
+    ABC5678 - unauthorized usb:3-10.5 transport_id:2
+    0123456789ABCDEF - no permissions (user in plugdev group); see [http://foo/bar] usb:1-2
+    >>> [device.serial for device in parse_devices(output) if device.online]
+    ['XYZ1234']
+    """
+    devices = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or line.startswith("List of devices") or line.startswith("*"):
+            # skip e.g.: "* daemon started successfully"
+            continue
+
+        try:
+            serial, rest = line.split(None, 1)
+        except ValueError:
+            continue
+
+        state = []
+        info = {}
+        for token in rest.split():
+            match = INFO_RE.match(token)
+            if match and state:
+                info[match.group(1)] = match.group(2)
+            else:
+                state.append(token)
+
+        devices.append(AdbDevice(serial=serial, state=" ".join(state), info=info))
+
+    return devices
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,280 @@
+"""
+    Fetch the storage footprint (APK, data and cache size) of all packages with a constant number of adb calls.
+
+    One 'dumpsys diskstats' call returns the sizes of all packages: Four JSON arrays
+    (names, app, data and cache sizes), parsed line by line while they arrive.
+    The diskstats are updated by a daily job, so new packages may be missing
+    (and old Android versions have no package sizes at all). Only for these packages
+    the APK files are measured via one 'stat' call for many packages: The APK paths
+    are known from the inventory ('pm list packages -f'), so no 'pm path' call is needed
+    and the split APKs are covered via the "*.apk" glob of the package directory.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+
+from adb_uninstall.adb_batch import BATCH_MAX_SCRIPT_LENGTH
+
+log = logging.getLogger(__name__)
+
+DISKSTATS_COMMAND = ("dumpsys", "diskstats")
+
+# The arrays in the 'dumpsys diskstats' output (Android 8+)
+DISKSTATS_NAMES = "Package Names:"
+DISKSTATS_APP_SIZES = "App Sizes:"
+DISKSTATS_DATA_SIZES = "App Data Sizes:"
+DISKSTATS_CACHE_SIZES = "Cache Sizes:"
+DISKSTATS_ARRAYS = (DISKSTATS_NAMES, DISKSTATS_APP_SIZES, DISKSTATS_DATA_SIZES, DISKSTATS_CACHE_SIZES)
+
+# Print "<path> <size>" of all given files, missing files are ignored:
+STAT_SCRIPT_HEAD = "stat -c '%n %s'"
+STAT_SCRIPT_TAIL = " 2>/dev/null;true"
+
+# Only these chars are used without shell quoting. e.g.: /data/app/~~Ab1==/com.foo-Xy2==/base.apk
+APK_PATH_RE = re.compile(r"^/[A-Za-z0-9_.~=+/-]+\.apk$")
+
+
+class PackageFootprint:
+    def __init__(self, *, package_name, app_size=None, data_size=None, cache_size=None):
+        self.package_name = package_name
+        self.app_size = app_size  # All APK files in bytes
+        self.data_size = data_size  # None if only the APK size is known (via 'pm path')
+        self.cache_size = cache_size
+
+    @property
+    def total(self):
+        return (self.app_size or 0) + (self.data_size or 0) + (self.cache_size or 0)
+
+    def reclaimable(self, system):
+        """
+        Bytes freed by 'pm uninstall --user 0': The APK of a system app stays on the system partition.
+        """
+        if system:
+            return (self.data_size or 0) + (self.cache_size or 0)
+        return self.total
+
+    def to_dict(self):
+        return {
+            "app_size": self.app_size,
+            "data_size": self.data_size,
+            "cache_size": self.cache_size,
+            "total": self.total,
+        }
+
+    def __str__(self):
+        return "%s app:%s data:%s cache:%s" % (self.package_name, self.app_size, self.data_size, self.cache_size)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+class DiskstatsParser:
+    """
+    Parse the output of 'dumpsys diskstats' line by line: Only the package arrays are decoded.
+
+    >>> parser = DiskstatsParser()
+    >>> lines = [
+    ...     "Data-Free: 3512384K / 24831248K total = 14% free",
+    ...     "App Size: 3000",
+    ...     'Package Names: ["com.foo","com.bar"]',
+    ...     "App Sizes: [1000,2000]",
+    ...     "App Data Sizes: [300,0]",
+    ...     "Cache Sizes: [20,4]",
+    ... ]
+    >>> for line in lines:
+    ...     parser.feed(line)
+    >>> for package_name, footprint in sorted(parser.footprints().items()):
+    ...     print(footprint, footprint.total)
+    com.bar app:2000 data:0 cache:4 2004
+    com.foo app:1000 data:300 cache:20 1320
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def feed(self, line):
+        for prefix in DISKSTATS_ARRAYS:
+            if line.startswith(prefix):
+                try:
+                    self.arrays[prefix] = json.loads(line[len(prefix):])
+                except ValueError as err:
+                    log.error("Can't parse diskstats %r: %s", prefix, err)
+                return
+
+    def footprints(self):
+        """
+        Returns a dict with package name -> PackageFootprint (empty if the diskstats have no package sizes)
+        """
+        package_names = self.arrays.get(DISKSTATS_NAMES)
+        if not package_names:
+            return {}
+
+        sizes = []
+        for prefix in (DISKSTATS_APP_SIZES, DISKSTATS_DATA_SIZES, DISKSTATS_CACHE_SIZES):
+            values = self.arrays.get(prefix)
+            if values is None or len(values) != len(package_names):
+                log.error("diskstats %r doesn't match the package names", prefix)
+                values = [None] * len(package_names)
+            sizes.append(values)
+
+        return {
+            package_name: PackageFootprint(
+                package_name=package_name, app_size=app_size, data_size=data_size, cache_size=cache_size
+            )
+            for package_name, app_size, data_size, cache_size in zip(package_names, *sizes)
+        }
+
+
+def apk_globs(apk_paths):
+    """
+    Returns a dict: path (or glob) to stat -> package name.
+    The whole package directory is used, if only one package is in it (covers split APKs).
+    Old Android versions put many APK files into one directory: then only the APK file is used.
+
+    >>> sorted(apk_globs({
+    ...     "com.foo": "/data/app/com.foo-1/base.apk",
+    ...     "com.bar": "/system/app/Bar.apk",
+    ...     "com.baz": "/system/app/Baz.apk",
+    ...     "com.bad": "/data/app/$(reboot)/base.apk",
+    ... }).items())
+    [('/data/app/com.foo-1/*.apk', 'com.foo'), ('/system/app/Bar.apk', 'com.bar'), ('/system/app/Baz.apk', 'com.baz')]
+    """
+    dir_counts = {}
+    for apk_path in apk_paths.values():
+        if apk_path:
+            directory = os.path.dirname(apk_path)
+            dir_counts[directory] = dir_counts.get(directory, 0) + 1
+
+    globs = {}
+    for package_name, apk_path in apk_paths.items():
+        if not apk_path or not APK_PATH_RE.match(apk_path):
+            log.error("Skip APK path of %s: %r", package_name, apk_path)
+            continue
+        directory = os.path.dirname(apk_path)
+        if dir_counts[directory] == 1:
+            globs["%s/*.apk" % directory] = package_name
+        else:
+            globs[apk_path] = package_name
+    return globs
+
+
+def build_stat_scripts(paths, max_length=BATCH_MAX_SCRIPT_LENGTH):
+    """
+    One 'stat' call for many APK files, split into scripts not longer than max_length.
+
+    >>> build_stat_scripts(["/data/app/com.foo-1/*.apk", "/system/app/Bar.apk"])
+    ["stat -c '%n %s' /data/app/com.foo-1/*.apk /system/app/Bar.apk 2>/dev/null;true"]
+    >>> scripts = build_stat_scripts(["/data/app/com.foo%i-1/*.apk" % i for i in range(1000)])
+    >>> len(scripts), all(len(script) <= BATCH_MAX_SCRIPT_LENGTH for script in scripts)
+    (9, True)
+    """
+    max_paths_length = max_length - len(STAT_SCRIPT_HEAD) - len(STAT_SCRIPT_TAIL)
+    scripts = []
+    chunk = []
+    length = 0
+    for path in paths:
+        if chunk and length + len(path) + 1 > max_paths_length:
+            scripts.append("%s %s%s" % (STAT_SCRIPT_HEAD, " ".join(chunk), STAT_SCRIPT_TAIL))
+            chunk = []
+            length = 0
+        chunk.append(path)
+        length += len(path) + 1
+
+    if chunk:
+        scripts.append("%s %s%s" % (STAT_SCRIPT_HEAD, " ".join(chunk), STAT_SCRIPT_TAIL))
+    return scripts
+
+
+class StatParser:
+    """
+    Sum the APK sizes per package from the 'stat' output, line by line.
+
+    >>> parser = StatParser({"/data/app/com.foo-1/*.apk": "com.foo", "/system/app/Bar.apk": "com.bar"})
+    >>> for line in (
+    ...     "/data/app/com.foo-1/base.apk 1000",
+    ...     "/data/app/com.foo-1/split_config.de.apk 234",
+    ...     "/system/app/Bar.apk 42",
+    ...     "/system/app/Unknown.apk 1",
+    ... ):
+    ...     parser.feed(line)
+    >>> sorted(parser.footprints.values(), key=lambda footprint: footprint.package_name)
+    [<PackageFootprint com.bar app:42 data:None cache:None>, <PackageFootprint com.foo app:1234 data:None cache:None>]
+    """
+
+    def __init__(self, globs):
+        self.path2package = {}
+        self.dir2package = {}
+        for path, package_name in globs.items():
+            directory, _, filename = path.rpartition("/")
+            if filename == "*.apk":
+                self.dir2package[directory] = package_name
+            else:
+                self.path2package[path] = package_name
+        self.footprints = {}  # package name -> PackageFootprint with the summed APK sizes
+
+    def feed(self, line):
+        path, _, size = line.strip().rpartition(" ")
+        try:
+            size = int(size)
+        except ValueError:
+            log.error("Can't parse APK size: %r", line)
+            return
+
+        package_name = self.path2package.get(path) or self.dir2package.get(os.path.dirname(path))
+        if package_name is None:
+            log.error("Unknown APK file: %r", path)
+            return
+
+        footprint = self.footprints.get(package_name)
+        if footprint is None:
+            self.footprints[package_name] = PackageFootprint(package_name=package_name, app_size=size)
+        else:
+            footprint.app_size += size
+
+
+def fetch_footprints(iter_output, apk_paths=None, timeout=30):
+    """
+    Returns a dict with package name -> PackageFootprint (or None if the diskstats can't be fetched)
+    'iter_output' is called like AdbBackend.iter_output(*args, timeout=...)
+    'apk_paths' is a dict with package name -> APK path of the installed packages (from the inventory):
+    Packages missing in the diskstats are measured via 'stat' (without 'apk_paths': only the diskstats are used).
+    """
+    parser = DiskstatsParser()
+    try:
+        for line in iter_output("adb", "shell", *DISKSTATS_COMMAND, timeout=timeout):
+            parser.feed(line)
+    except subprocess.SubprocessError as err:
+        log.error("Can't fetch the diskstats: %s", err)
+        return None
+    footprints = parser.footprints()
+
+    missing = {
+        package_name: apk_path
+        for package_name, apk_path in (apk_paths or {}).items()
+        if package_name not in footprints
+    }
+    if not missing:
+        return footprints
+
+    log.info("%i packages are not in the diskstats: use 'stat'", len(missing))
+    # The directory counts need all APK paths: many packages may share one directory
+    globs = {path: package_name for path, package_name in apk_globs(apk_paths).items() if package_name in missing}
+    stat_parser = StatParser(globs)
+    for script in build_stat_scripts(sorted(globs)):
+        try:
+            for line in iter_output("adb", "shell", script, timeout=timeout):
+                stat_parser.feed(line)
+        except subprocess.SubprocessError as err:
+            log.error("Can't fetch the APK sizes: %s", err)
+    footprints.update(stat_parser.footprints)
+
+    return footprints
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
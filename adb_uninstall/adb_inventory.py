@@ -0,0 +1,242 @@
+"""
+    Fetch the full package state of a device in one 'adb shell' call.
+
+    One device side script runs 'pm list packages -f -i -U' and one 'pm list packages'
+    call for each of the sets: system (-s), third-party (-3), disabled (-d), enabled (-e)
+    and "with uninstalled" (-u). A marker line separates the sections.
+
+    The sets are merged into one PackageInfo per package, so the state of N packages
+    needs a constant number of device calls.
+"""
+
+import logging
+
+from adb_uninstall.adb_batch import parse_package_list
+
+log = logging.getLogger(__name__)
+
+SECTION_MARKER = "__ADB_UNINSTALL_SECTION__"
+
+SECTION_ALL = "all"
+SECTION_SYSTEM = "system"
+SECTION_THIRD_PARTY = "third-party"
+SECTION_DISABLED = "disabled"
+SECTION_ENABLED = "enabled"
+SECTION_WITH_UNINSTALLED = "with-uninstalled"
+
+INVENTORY_SECTIONS = (
+    # '-U' is not supported on old Android versions -> fallback without the UID:
+    (SECTION_ALL, "pm list packages -f -i -U 2>/dev/null || pm list packages -f -i"),
+    (SECTION_SYSTEM, "pm list packages -s"),
+    (SECTION_THIRD_PARTY, "pm list packages -3"),
+    (SECTION_DISABLED, "pm list packages -d"),
+    (SECTION_ENABLED, "pm list packages -e"),
+    (SECTION_WITH_UNINSTALLED, "pm list packages -u"),
+)
+
+
+class PackageInfo:
+    SYSTEM = "system"
+    THIRD_PARTY = "3rd party"
+
+    ENABLED = "enabled"
+    DISABLED = "disabled"
+    UNINSTALLED = "uninstalled"
+
+    def __init__(self, *, package_name, apk_path=None, installer=None, uid=None):
+        self.package_name = package_name
+        self.apk_path = apk_path
+        self.installer = installer
+        self.uid = uid
+
+        # Will be set by InventoryParser.merge():
+        self.package_type = None
+        self.state = None
+
+    DICT_KEYS = ("apk_path", "installer", "uid", "package_type", "state")
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.DICT_KEYS}
+
+    @classmethod
+    def from_dict(cls, package_name, data):
+        info = cls(package_name=package_name)
+        for key in cls.DICT_KEYS:
+            setattr(info, key, data.get(key))
+        return info
+
+    @property
+    def system(self):
+        return self.package_type == self.SYSTEM
+
+    @property
+    def installed(self):
+        return self.state in (self.ENABLED, self.DISABLED)
+
+    def __str__(self):
+        return "%s %s %s installer:%s uid:%s %s" % (
+            self.package_name, self.package_type, self.state, self.installer, self.uid, self.apk_path
+        )
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+def build_inventory_script():
+    """
+    >>> print(build_inventory_script().replace(";echo", ";\\necho"))
+    echo "__ADB_UNINSTALL_SECTION__ all";pm list packages -f -i -U 2>/dev/null || pm list packages -f -i;
+    echo "__ADB_UNINSTALL_SECTION__ system";pm list packages -s;
+    echo "__ADB_UNINSTALL_SECTION__ third-party";pm list packages -3;
+    echo "__ADB_UNINSTALL_SECTION__ disabled";pm list packages -d;
+    echo "__ADB_UNINSTALL_SECTION__ enabled";pm list packages -e;
+    echo "__ADB_UNINSTALL_SECTION__ with-uninstalled";pm list packages -u
+    """
+    return ";".join('echo "%s %s";%s' % (SECTION_MARKER, name, command) for name, command in INVENTORY_SECTIONS)
+
+
+def parse_package_line(line):
+    """
+    Parse one line of 'pm list packages -f -i -U' (the APK path may contain '=')
+
+    >>> parse_package_line("package:/data/app/~~ab==/com.foo-x==/base.apk=com.foo  installer=org.fdroid uid:10123")
+    <PackageInfo com.foo None None installer:org.fdroid uid:10123 /data/app/~~ab==/com.foo-x==/base.apk>
+    >>> parse_package_line("package:/system/app/Bar/Bar.apk=com.bar  installer=null")
+    <PackageInfo com.bar None None installer:None uid:None /system/app/Bar/Bar.apk>
+    >>> parse_package_line("Error: foo") is None
+    True
+    """
+    if not line.startswith("package:"):
+        return None
+
+    parts = line[8:].split()
+    if not parts:
+        return None
+
+    apk_path, _, package_name = parts[0].rpartition("=")
+    info = PackageInfo(package_name=package_name, apk_path=apk_path or None)
+    for part in parts[1:]:
+        if part.startswith("installer="):
+            installer = part[10:]
+            if installer != "null":
+                info.installer = installer
+        elif part.startswith("uid:"):
+            try:
+                info.uid = int(part[4:].split(",")[0])
+            except ValueError:
+                log.error("Can't parse uid in: %r", line)
+    return info
+
+
+class InventoryParser:
+    """
+    Parse the output of build_inventory_script() line by line.
+
+    >>> parser = InventoryParser()
+    >>> lines = [
+    ...     "__ADB_UNINSTALL_SECTION__ all",
+    ...     "package:/system/app/Foo/Foo.apk=com.foo  installer=null uid:1000",
+    ...     "package:/data/app/com.bar-1/base.apk=com.bar  installer=com.android.vending uid:10100",
+    ...     "__ADB_UNINSTALL_SECTION__ system", "package:com.foo", "package:com.old",
+    ...     "__ADB_UNINSTALL_SECTION__ third-party", "package:com.bar",
+    ...     "__ADB_UNINSTALL_SECTION__ disabled", "package:com.foo",
+    ...     "__ADB_UNINSTALL_SECTION__ enabled", "package:com.bar",
+    ...     "__ADB_UNINSTALL_SECTION__ with-uninstalled", "package:com.foo", "package:com.bar", "package:com.old",
+    ... ]
+    >>> [info.package_name for info in map(parser.feed, lines) if info is not None]
+    ['com.foo', 'com.bar']
+    >>> for package_name, info in sorted(parser.merge().items()):
+    ...     print(package_name, info.package_type, info.state, info.installer, info.uid)
+    com.bar 3rd party enabled com.android.vending 10100
+    com.foo system disabled None 1000
+    com.old system uninstalled None None
+    """
+
+    def __init__(self):
+        self.section = None
+        self.infos = {}
+        self.section_lines = {name: [] for name, command in INVENTORY_SECTIONS}
+
+    def feed(self, line):
+        """
+        Returns a new PackageInfo while the 'all' section is parsed, otherwise None.
+        """
+        if line.startswith(SECTION_MARKER):
+            self.section = line[len(SECTION_MARKER):].strip()
+            return None
+
+        if self.section == SECTION_ALL:
+            info = parse_package_line(line)
+            if info is not None:
+                self.infos[info.package_name] = info
+            return info
+
+        if self.section in self.section_lines:
+            self.section_lines[self.section].append(line)
+        return None
+
+    def merge(self):
+        """
+        Returns a dict with package name -> PackageInfo for all installed and uninstalled packages.
+        """
+        sets = {name: parse_package_list("\n".join(lines)) for name, lines in self.section_lines.items()}
+
+        infos = dict(self.infos)
+        installed = set(infos)
+        for package_name in sets[SECTION_WITH_UNINSTALLED] - installed:
+            infos[package_name] = PackageInfo(package_name=package_name)
+
+        for package_name, info in infos.items():
+            if package_name in sets[SECTION_SYSTEM]:
+                info.package_type = PackageInfo.SYSTEM
+            elif package_name in sets[SECTION_THIRD_PARTY]:
+                info.package_type = PackageInfo.THIRD_PARTY
+
+            if package_name not in installed:
+                info.state = PackageInfo.UNINSTALLED
+            elif package_name in sets[SECTION_DISABLED]:
+                info.state = PackageInfo.DISABLED
+            elif package_name in sets[SECTION_ENABLED]:
+                info.state = PackageInfo.ENABLED
+
+        return infos
+
+
+def diff_inventory(old_infos, new_infos):
+    """
+    Returns the added, removed and changed package names between two inventories.
+
+    >>> old = {"com.foo": PackageInfo(package_name="com.foo", uid=1), "com.bar": PackageInfo(package_name="com.bar")}
+    >>> new = {"com.foo": PackageInfo(package_name="com.foo", uid=2), "com.baz": PackageInfo(package_name="com.baz")}
+    >>> diff_inventory(old, new)
+    (['com.baz'], ['com.bar'], ['com.foo'])
+    """
+    added = sorted(set(new_infos) - set(old_infos))
+    removed = sorted(set(old_infos) - set(new_infos))
+    changed = sorted(
+        package_name
+        for package_name in set(old_infos) & set(new_infos)
+        if old_infos[package_name].to_dict() != new_infos[package_name].to_dict()
+    )
+    return added, removed, changed
+
+
+def fetch_inventory(check_output, timeout=30):
+    """
+    Returns a dict with package name -> PackageInfo (or None if the output can't be fetched)
+    'check_output' is called like verbose_check_output(*args, timeout=...)
+    """
+    output = check_output("adb", "shell", build_inventory_script(), timeout=timeout)
+    if output is None:
+        return None
+
+    parser = InventoryParser()
+    for line in output.splitlines():
+        parser.feed(line)
+    return parser.merge()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
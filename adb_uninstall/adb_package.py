@@ -1,54 +1,115 @@
+"""
+    The package list as a columnar store.
+
+    Packages keeps one column per attribute: the interned names, the rules, the infos
+    and the actions as one byte per package. A Package is only a small view
+    (the store and an index) that is created on first access and then reused.
+    So counting, filtering and "set all matching" run over the columns,
+    without a object per package, e.g. in the headless CLI.
+"""
+
+import itertools
 import logging
-import subprocess
-import webbrowser
+import sys
+from collections.abc import Mapping
 
-from adb_uninstall.constants import EXODUS_PRIVACY_URL, GOOGLE_PLAY_URL, LOCKED_APPS
+from adb_uninstall import rules
+from adb_uninstall.constants import EXODUS_PRIVACY_URL, GOOGLE_PLAY_URL
 
 log = logging.getLogger(__name__)
 
+# The action codes in Packages.action_codes:
+KEEP_CODE = 0
+REMOVE_CODE = 1
+LOCKED_CODE = 2
+DELETED_CODE = 255  # Packages.remove() was called
+
 
 class Package:
+    """
+    Flyweight view of one package in a Packages store.
+    """
+
+    __slots__ = ("packages", "index")
+
     KEEP = "keep"
     REMOVE = "remove"
     LOCKED = "locked"
 
-    def __init__(self, *, package_name, index, action=None):
-        self.package_name = package_name
+    def __init__(self, packages, index):
+        self.packages = packages
         self.index = index
 
-        if package_name in LOCKED_APPS:
-            self.action = self.LOCKED
-        elif action is None:
-            self.action = self.KEEP
-        else:
-            assert action in (self.KEEP, self.REMOVE)
-            self.action = action
+    @property
+    def package_name(self):
+        return self.packages.names[self.index]
+
+    @property
+    def rule(self):
+        return self.packages.rules[self.index]  # rules.Rule instance or None
+
+    @property
+    def info(self):
+        return self.packages.infos[self.index]  # adb_inventory.PackageInfo instance or None
+
+    @info.setter
+    def info(self, info):
+        self.packages.infos[self.index] = info
+
+    @property
+    def footprint(self):
+        return self.packages.footprints[self.index]  # adb_footprint.PackageFootprint instance or None
+
+    @property
+    def trackers(self):
+        return self.packages.trackers[self.index]  # tuple of tracker names or None if unknown, see: tracker_db.py
+
+    @property
+    def action(self):
+        code = self.packages.action_codes[self.index]
+        if code == DELETED_CODE:
+            return None
+        return ACTIONS[code]
+
+    @action.setter
+    def action(self, action):
+        assert action in (self.KEEP, self.REMOVE, self.LOCKED)
+        self.packages.action_codes[self.index] = ACTION_CODES[action]
+
+    @property
+    def warn(self):
+        rule = self.rule
+        return rule is not None and rule.severity == rules.WARN
 
     @property
     def locked(self):
-        return self.action == self.LOCKED
+        return self.packages.action_codes[self.index] == LOCKED_CODE
 
     @property
     def keep(self):
-        return self.action == self.KEEP
+        return self.packages.action_codes[self.index] == KEEP_CODE
 
     @property
     def remove(self):
-        return self.action == self.REMOVE
+        return self.packages.action_codes[self.index] == REMOVE_CODE
 
     def set_keep(self):
         self.action = self.KEEP
 
     def set_remove(self):
-        if self.action == self.LOCKED:
+        if self.locked:
             raise AssertionError("Can't remove locked app!")
 
         self.action = self.REMOVE
 
     def open_play_google(self):
+        import webbrowser  # lazy: not needed in the headless CLI
+
         webbrowser.open_new_tab(GOOGLE_PLAY_URL % self.package_name)
 
     def open_exodus_privacy(self):
+        import webbrowser  # lazy: not needed in the headless CLI
+
         webbrowser.open_new_tab(EXODUS_PRIVACY_URL % self.package_name)
 
     def __str__(self):
@@ -58,20 +119,289 @@ class Package:
         return "<%s %s>" % (self.__class__.__name__, self.__str__())
 
 
+# action code -> action name and back:
+ACTIONS = (Package.KEEP, Package.REMOVE, Package.LOCKED)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+
+class PackageMapping(Mapping):
+    """
+    Read only mapping: package name -> Package view (in insertion order)
+    """
+
+    def __init__(self, packages):
+        self.packages = packages
+
+    def __getitem__(self, package_name):
+        return self.packages.get_by_index(index=self.packages.name2index[package_name])
+
+    def __iter__(self):
+        return iter(self.packages.name2index)
+
+    def __len__(self):
+        return len(self.packages.name2index)
+
+    def __contains__(self, package_name):
+        return package_name in self.packages.name2index
+
+    def values(self):
+        get_by_index = self.packages.get_by_index
+        return [get_by_index(index=index) for index in self.packages.name2index.values()]
+
+
+class IndexMapping(Mapping):
+    """
+    Read only mapping: index -> Package view (without removed packages)
+    """
+
+    def __init__(self, packages):
+        self.packages = packages
+
+    def __getitem__(self, index):
+        return self.packages.get_by_index(index=index)
+
+    def __iter__(self):
+        return iter(sorted(self.packages.name2index.values()))
+
+    def __len__(self):
+        return len(self.packages.name2index)
+
+
 class Packages:
-    def __init__(self):
-        self.name2package = {}
-        self.index2package = {}
+    """
+    >>> packages = Packages(rule_set=rules.RuleSet())
+    >>> packages.rule_set.add_lines(["locked com.foo.locked", "recommended-remove com.foo.ads*"], origin="doctest")
+    >>> for package_name in ("com.foo.app", "com.foo.ads", "com.foo.locked", "com.bar"):
+    ...     package = packages.add(package_name=package_name)
+    >>> packages.counts()
+    {'keep': 2, 'remove': 1, 'locked': 1}
+    >>> packages.package_names(Package.REMOVE), packages.indexes(Package.KEEP)
+    (['com.foo.ads'], [0, 3])
+    >>> packages.name2package["com.bar"].set_remove()
+    >>> packages.get_by_index(index=3) is packages.name2package["com.bar"]
+    True
+    >>> packages.set_action_by_name(["com.foo.app", "com.foo.locked", "com.foo.ads"], Package.REMOVE)
+    ['com.foo.app']
+    >>> packages.action_map()
+    {'com.foo.app': 'remove', 'com.foo.ads': 'remove', 'com.bar': 'remove'}
+    >>> packages.remove("com.foo.app")
+    <Package 0 None 'com.foo.app'>
+    >>> packages.counts(), len(packages.name2package), list(packages.index2package)
+    ({'keep': 0, 'remove': 2, 'locked': 1}, 3, [1, 2, 3])
+
+    >>> from adb_uninstall.adb_footprint import PackageFootprint
+    >>> footprint = PackageFootprint(package_name="com.foo.ads", app_size=1000, data_size=200, cache_size=30)
+    >>> packages.set_footprints({"com.foo.ads": footprint})
+    >>> packages.reclaimable_size()  # bytes, packages without footprint
+    (1230, 1)
+
+    >>> packages.set_trackers({"com.bar": ("Google Ads", "Facebook Ads"), "com.foo.ads": ("Google Ads",)})
+    >>> packages.tracker_indexes(min_count=2), packages.name2package["com.foo.locked"].trackers is None
+    ([3], True)
+    """
+
+    def __init__(self, rule_set=None):
+        self.rule_set = rule_set  # loaded lazy, see add()
+
+        # The columns, the list index is Package.index:
+        self.names = []  # interned package names
+        self.rules = []  # rules.Rule instances or None
+        self.infos = []  # adb_inventory.PackageInfo instances or None
+        self.footprints = []  # adb_footprint.PackageFootprint instances or None
+        self.trackers = []  # tuples of tracker names or None
+        self.action_codes = bytearray()  # KEEP_CODE, REMOVE_CODE, LOCKED_CODE or DELETED_CODE
+        self.views = []  # cached Package views or None
+
+        self.name2index = {}
+        self.name2package = PackageMapping(self)
+        self.index2package = IndexMapping(self)
+
+    @property
+    def next_index(self):
+        return len(self.names)
+
+    def add(self, *, package_name, action=None, info=None):
+        index = self.add_index(package_name=package_name, action=action, info=info)
+        return self.get_by_index(index=index)
+
+    def add_index(self, *, package_name, action=None, info=None):
+        """
+        Like add(), but returns only the index: without a Package view, e.g. for the headless CLI.
+        """
+        if self.rule_set is None:
+            self.rule_set = rules.get_rules()
+        rule = self.rule_set.classify(package_name)
+
+        if rule is not None and rule.severity == rules.LOCKED:
+            action = Package.LOCKED
+        elif action is None:
+            if rule is not None and rule.severity == rules.RECOMMENDED_REMOVE:
+                action = Package.REMOVE
+            else:
+                action = Package.KEEP
+        else:
+            assert action in (Package.KEEP, Package.REMOVE)
+
+        old_index = self.name2index.get(package_name)
+        if old_index is not None:
+            self.action_codes[old_index] = DELETED_CODE
 
-    def add(self, *, package_name, action=None):
-        index = len(self.name2package)
+        index = len(self.names)
+        self.names.append(sys.intern(package_name))
+        self.rules.append(rule)
+        self.infos.append(info)
+        self.footprints.append(None)
+        self.trackers.append(None)
+        self.action_codes.append(ACTION_CODES[action])
+        self.views.append(None)
+        self.name2index[package_name] = index
+        return index
 
-        package = Package(package_name=package_name, index=index, action=action)
+    def remove(self, package_name):
+        index = self.name2index.pop(package_name)
+        self.action_codes[index] = DELETED_CODE
+        return self.get_by_index(index=index, deleted=True)
 
-        self.name2package[package_name] = package
-        self.index2package[index] = package
+    def clear(self):
+        self.names.clear()
+        self.rules.clear()
+        self.infos.clear()
+        self.footprints.clear()
+        self.trackers.clear()
+        self.action_codes.clear()
+        self.views.clear()
+        self.name2index.clear()
 
+    def get_by_index(self, *, index, deleted=False):
+        if not deleted and self.action_codes[index] == DELETED_CODE:
+            raise KeyError(index)
+        package = self.views[index]
+        if package is None:
+            package = self.views[index] = Package(self, index)
         return package
 
-    def get_by_index(self, *, index):
-        return self.index2package[index]
+    ###########################################################################
+    # Bulk operations: over the columns, without Package views
+
+    def count(self, action):
+        return self.action_codes.count(ACTION_CODES[action])
+
+    def counts(self):
+        return {action: self.action_codes.count(code) for code, action in enumerate(ACTIONS)}
+
+    def mask(self, action):
+        """
+        Returns bytes with 1 for every package with the given action, else 0.
+        """
+        table = bytearray(256)
+        table[ACTION_CODES[action]] = 1
+        return self.action_codes.translate(table)
+
+    def indexes(self, action):
+        """
+        Returns the indexes of all packages with the given action.
+        """
+        return list(itertools.compress(range(len(self.action_codes)), self.mask(action)))
+
+    def package_names(self, action):
+        return list(itertools.compress(self.names, self.mask(action)))
+
+    def action_map(self, with_locked=False):
+        """
+        Returns a dict: package name -> action
+        """
+        action_codes = self.action_codes
+        return {
+            package_name: ACTIONS[action_codes[index]]
+            for package_name, index in self.name2index.items()
+            if with_locked or action_codes[index] != LOCKED_CODE
+        }
+
+    def info_map(self):
+        """
+        Returns a dict: package name -> PackageInfo (only packages with info)
+        """
+        infos = self.infos
+        return {package_name: infos[index] for package_name, index in self.name2index.items() if infos[index]}
+
+    def set_footprints(self, footprints):
+        """
+        Set the PackageFootprint of all packages from a dict: package name -> PackageFootprint
+        Packages without a footprint get None.
+        """
+        names = self.names
+        self.footprints = [footprints.get(names[index]) for index in range(len(names))]
+
+    def set_trackers(self, trackers):
+        """
+        Set the trackers of all packages from a dict: package name -> tuple of tracker names
+        Packages without a report get None.
+        """
+        names = self.names
+        self.trackers = [trackers.get(names[index]) for index in range(len(names))]
+
+    def tracker_indexes(self, min_count):
+        """
+        Returns the indexes of all packages with at least 'min_count' known trackers.
+        """
+        action_codes = self.action_codes
+        return [
+            index
+            for index, trackers in enumerate(self.trackers)
+            if trackers is not None and len(trackers) >= min_count and action_codes[index] != DELETED_CODE
+        ]
+
+    def reclaimable_size(self, action=Package.REMOVE):
+        """
+        Returns the bytes freed by uninstalling all packages with the given action
+        and the number of these packages without a known footprint.
+        """
+        infos = self.infos
+        size = 0
+        unknown = 0
+        for index in self.indexes(action):
+            footprint = self.footprints[index]
+            if footprint is None:
+                unknown += 1
+            else:
+                info = infos[index]
+                size += footprint.reclaimable(system=info is not None and info.system)
+        return size, unknown
+
+    def set_action_by_index(self, indexes, action):
+        """
+        Set keep/remove for many packages in one pass: locked packages are skipped.
+        Returns the changed indexes.
+        """
+        assert action in (Package.KEEP, Package.REMOVE)
+        new_code = ACTION_CODES[action]
+        action_codes = self.action_codes
+        # Only keep <-> remove: skip locked and removed packages
+        other_code = KEEP_CODE if new_code == REMOVE_CODE else REMOVE_CODE
+        changed = [index for index in indexes if action_codes[index] == other_code]
+        for index in changed:
+            action_codes[index] = new_code
+        return changed
+
+    def set_action_by_name(self, package_names, action):
+        """
+        Returns the changed package names.
+        """
+        name2index = self.name2index
+        names = self.names
+        changed = self.set_action_by_index([name2index[package_name] for package_name in package_names], action)
+        return [names[index] for index in changed]
+
+    def set_action(self, packages, action):
+        """
+        Set keep/remove for many Package views in one pass: locked packages are skipped.
+        Returns the changed packages.
+        """
+        changed = self.set_action_by_index([package.index for package in packages], action)
+        return [self.get_by_index(index=index) for index in changed]
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,328 @@
+"""
+    Adaptive timeouts, retries and a circuit breaker per device for adb commands.
+
+    The timeout of the call site is only the start value: After a few calls
+    the timeout is derived from the observed latency of this device and command kind
+    (EWMA of the duration plus 4 times the EWMA of the deviation, like the TCP retransmit timeout).
+    So slow devices get more time and hung devices don't waste the full timeout on every call.
+
+    Transient errors (timeout, dead 'adb shell' session, adb server not reachable) are
+    retried with a jittered exponential backoff. Commands that change the device
+    (e.g. 'pm uninstall') are only retried if they never reached the device.
+
+    After 'failure_threshold' transient errors in a row the breaker of this device opens:
+    All device commands fail fast with CircuitOpenError until 'cooldown' is over.
+    Then one trial call is allowed: On success the breaker closes, otherwise it opens again.
+"""
+
+import logging
+import random
+import subprocess
+import threading
+import time
+
+from adb_uninstall.adb_batch import BATCH_MARKER
+from adb_uninstall.adb_client import AdbServerUnavailable
+from adb_uninstall.adb_shell import AdbShellSessionDied
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+# Use the adaptive timeout after this number of calls:
+MIN_SAMPLES = 3
+# The adaptive timeout is never shorter than (in sec.):
+MIN_TIMEOUT = 2.0
+# ...and never longer than the call site timeout multiplied with:
+MAX_TIMEOUT_FACTOR = 5
+DEVIATION_FACTOR = 4
+EWMA_ALPHA = 1 / 8  # Gain of the mean (the deviation uses 1/4), like RFC 6298
+EWMA_BETA = 1 / 4
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.2  # sec.
+BACKOFF_CAP = 5  # sec.
+
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30  # sec.
+
+# These kinds (see metrics.command_kind) don't change the device and can always be retried:
+IDEMPOTENT_KINDS = ("list", "inventory", "getprop", "devices")
+
+# Only these commands run on the device and use the circuit breaker:
+DEVICE_COMMANDS = ("shell", "exec-out")
+
+TRANSIENT_ERRORS = (subprocess.TimeoutExpired, AdbShellSessionDied, AdbServerUnavailable, ConnectionError)
+
+# The error never reached the device:
+NOT_SENT_ERRORS = (AdbServerUnavailable, ConnectionRefusedError)
+
+
+class CircuitOpenError(subprocess.SubprocessError):
+    def __init__(self, serial, remaining):
+        self.serial = serial
+        self.remaining = remaining
+        super().__init__(
+            "Device %s failed too often: skip adb commands for %s" % (serial or "<default>", human_duration(remaining))
+        )
+
+
+def command_units(args):
+    """
+    Number of work units of the command: a batch script counts one unit per package.
+
+    >>> command_units(("adb", "shell", "pm", "list", "packages"))
+    1
+    >>> from adb_uninstall.adb_batch import PM_UNINSTALL, build_batch_script
+    >>> command_units(("adb", "shell", build_batch_script(PM_UNINSTALL, ["com.foo", "com.bar"])))
+    2
+    """
+    return max(1, sum(arg.count(BATCH_MARKER) for arg in args))
+
+
+class LatencyEstimator:
+    """
+    EWMA of the duration per unit and its deviation.
+
+    >>> estimator = LatencyEstimator()
+    >>> estimator.timeout(10)
+    10
+    >>> for duration in (0.5, 0.6, 0.4, 0.5):
+    ...     estimator.add(duration)
+    >>> round(estimator.mean, 2), round(estimator.deviation, 2)
+    (0.5, 0.14)
+    >>> estimator.timeout(10)  # never shorter than MIN_TIMEOUT
+    2.0
+    >>> round(estimator.timeout(10, units=10), 2)
+    10.63
+    >>> estimator.timeout(1, units=100)  # never longer than call site timeout * MAX_TIMEOUT_FACTOR
+    5
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.deviation = None
+
+    def add(self, duration_per_unit):
+        self.count += 1
+        if self.mean is None:
+            self.mean = duration_per_unit
+            self.deviation = duration_per_unit / 2
+        else:
+            self.deviation += EWMA_BETA * (abs(duration_per_unit - self.mean) - self.deviation)
+            self.mean += EWMA_ALPHA * (duration_per_unit - self.mean)
+
+    def timeout(self, default_timeout, units=1):
+        if self.count < MIN_SAMPLES:
+            return default_timeout
+        timeout = (self.mean + DEVIATION_FACTOR * self.deviation) * units
+        return min(max(timeout, MIN_TIMEOUT), default_timeout * MAX_TIMEOUT_FACTOR)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, serial, *, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, clock=time.monotonic):
+        self.serial = serial
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the breaker is open.
+
+        >>> now = [0]
+        >>> breaker = CircuitBreaker("XYZ", failure_threshold=2, cooldown=10, clock=lambda: now[0])
+        >>> breaker.failure(); breaker.failure(); breaker.state
+        'open'
+        >>> breaker.before_call()
+        Traceback (most recent call last):
+            ...
+        adb_uninstall.adb_policy.CircuitOpenError: Device XYZ failed too often: skip adb commands for 10.0 sec
+        >>> now[0] = 11
+        >>> breaker.before_call(); breaker.state
+        'half-open'
+        >>> breaker.success(); breaker.state
+        'closed'
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.cooldown - self.clock()
+            if self.state == self.OPEN and remaining <= 0:
+                log.info("Circuit breaker of %s: try one call", self.serial)
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.serial, max(remaining, 0))
+
+    def success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                log.info("Circuit breaker of %s: closed", self.serial)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    log.error("Circuit breaker of %s: open after %i failures", self.serial, self.failures)
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def reset(self):
+        self.success()
+
+    @property
+    def open(self):
+        return self.state == self.OPEN
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    "Full jitter" backoff: a random delay between 0 and base * 2^attempt (at most 'cap')
+
+    >>> 0 <= backoff(0) <= BACKOFF_BASE
+    True
+    >>> backoff(100) <= BACKOFF_CAP
+    True
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CommandPolicy:
+    """
+    Shared by all backends: one estimator per device + command kind and one breaker per device.
+    """
+
+    def __init__(self, *, max_retries=MAX_RETRIES, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.max_retries = max_retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.lock = threading.Lock()
+        self.estimators = {}  # (serial, kind) -> LatencyEstimator
+        self.breakers = {}  # serial -> CircuitBreaker
+
+    def estimator(self, serial, kind):
+        with self.lock:
+            key = (serial, kind)
+            estimator = self.estimators.get(key)
+            if estimator is None:
+                estimator = self.estimators[key] = LatencyEstimator()
+            return estimator
+
+    def breaker(self, serial):
+        with self.lock:
+            breaker = self.breakers.get(serial)
+            if breaker is None:
+                breaker = self.breakers[serial] = CircuitBreaker(
+                    serial, failure_threshold=self.failure_threshold, cooldown=self.cooldown
+                )
+            return breaker
+
+    def timeout(self, serial, kind, args, default_timeout):
+        return self.estimator(serial, kind).timeout(default_timeout, command_units(args))
+
+    def _retry(self, kind, err, attempt):
+        if attempt >= self.max_retries:
+            return False
+        return kind in IDEMPOTENT_KINDS or isinstance(err, NOT_SENT_ERRORS)
+
+    def call(self, func, args, *, serial, kind, timeout):
+        """
+        Call func(*args, timeout=...) with adaptive timeout, retries and circuit breaker.
+        """
+        device_command = len(args) > 1 and args[1] in DEVICE_COMMANDS
+        breaker = self.breaker(serial) if device_command else None
+        estimator = self.estimator(serial, kind)
+        units = command_units(args)
+
+        call_timeout = estimator.timeout(timeout, units)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_call()
+
+            start_time = time.monotonic()
+            try:
+                output = func(*args, timeout=call_timeout)
+            except subprocess.CalledProcessError:
+                # The device answered: only the command failed
+                estimator.add((time.monotonic() - start_time) / units)
+                if breaker is not None:
+                    breaker.success()
+                raise
+            except TRANSIENT_ERRORS as err:
+                if breaker is not None:
+                    breaker.failure()
+                if isinstance(err, subprocess.TimeoutExpired):
+                    # The device is slower than expected: raise the estimation and the next timeout
+                    estimator.add(call_timeout / units)
+                    call_timeout = min(call_timeout * 2, timeout * MAX_TIMEOUT_FACTOR)
+
+                if not self._retry(kind, err, attempt):
+                    raise
+                delay = backoff(attempt)
+                attempt += 1
+                log.warning(
+                    "%s - retry %i/%i after %s (timeout: %s)",
+                    err, attempt, self.max_retries, human_duration(delay), human_duration(call_timeout),
+                )
+                time.sleep(delay)
+            else:
+                estimator.add((time.monotonic() - start_time) / units)
+                if breaker is not None:
+                    breaker.success()
+                return output
+
+    def iter_call(self, func, args, *, serial, kind, timeout):
+        """
+        Streaming version of call(): Adaptive timeout and circuit breaker, but no retries.
+        (The consumer has already processed the lines before the error)
+        """
+        device_command = len(args) > 1 and args[1] in DEVICE_COMMANDS
+        breaker = self.breaker(serial) if device_command else None
+        estimator = self.estimator(serial, kind)
+        units = command_units(args)
+
+        if breaker is not None:
+            breaker.before_call()
+
+        call_timeout = estimator.timeout(timeout, units)
+        start_time = time.monotonic()
+        try:
+            yield from func(*args, timeout=call_timeout)
+        except subprocess.CalledProcessError:
+            if breaker is not None:
+                breaker.success()
+            raise
+        except TRANSIENT_ERRORS as err:
+            if breaker is not None:
+                breaker.failure()
+            if isinstance(err, subprocess.TimeoutExpired):
+                estimator.add(call_timeout / units)
+            raise
+        else:
+            estimator.add((time.monotonic() - start_time) / units)
+            if breaker is not None:
+                breaker.success()
+
+
+# Used by all AdbBackend instances:
+default_policy = CommandPolicy()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
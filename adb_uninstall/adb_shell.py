@@ -0,0 +1,294 @@
+"""
+    A long-lived 'adb shell' session.
+
+    Commands are written to the stdin of one 'adb shell' process. After each command
+    a unique sentinel line with the exit code is printed, which splits the replies.
+    So only the first command pays the process and device shell startup.
+"""
+
+import logging
+import queue
+import subprocess
+import threading
+import time
+import uuid
+
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+SENTINEL_PREFIX = "__ADB_SHELL"
+
+
+class AdbShellSessionDied(subprocess.SubprocessError):
+    pass
+
+
+def sentinel_command(command):
+    """
+    Returns the shell command that prints a unique sentinel with the exit code
+    after the given command, and the sentinel.
+
+    The sentinel is assembled by printf, so it is not in a possible echo of our input.
+    The subshell protects a session against e.g. 'exit' and
+    stdin is /dev/null, so the command can't consume our next commands.
+    """
+    token = uuid.uuid4().hex
+    sentinel = "%s_%s " % (SENTINEL_PREFIX, token)
+    shell_command = "( %s\n) </dev/null 2>&1; printf '\\n%%s_%%s %%d\\n' %s %s $?\n" % (
+        command, SENTINEL_PREFIX, token
+    )
+    return shell_command, sentinel
+
+
+class SentinelLines:
+    """
+    Iterate over output lines of a sentinel_command() until the sentinel.
+    The exit code is stored in 'exit_code' (None if the lines ends without a sentinel).
+
+    >>> shell_command, sentinel = sentinel_command("echo foo")
+    >>> lines = SentinelLines(["foo", "", "", "%s1" % sentinel, "bar"], sentinel)
+    >>> list(lines), lines.exit_code
+    (['foo', ''], 1)
+    """
+
+    def __init__(self, lines, sentinel):
+        self.lines = lines
+        self.sentinel = sentinel
+        self.exit_code = None
+
+    def __iter__(self):
+        empty_line = False
+        for line in self.lines:
+            line = line.rstrip("\r")
+            pos = line.find(self.sentinel)
+            if pos != -1:
+                # The empty line from the '\n' before the sentinel is not yielded
+                self.exit_code = int(line[pos + len(self.sentinel):])
+                return
+
+            if empty_line:
+                yield ""
+            empty_line = line == ""
+            if not empty_line:
+                yield line
+
+        if empty_line:
+            # No sentinel, e.g.: connection closed
+            yield ""
+
+
+def parse_sentinel_output(text, sentinel):
+    """
+    Returns (exit_code, output) from the complete output of a sentinel_command()
+
+    >>> shell_command, sentinel = sentinel_command("echo foo")
+    >>> parse_sentinel_output("foo\\n\\n%s1\\n" % sentinel, sentinel)
+    (1, 'foo\\n')
+    >>> parse_sentinel_output("foo\\n", sentinel)
+    (None, 'foo\\n')
+    """
+    lines = SentinelLines(text.splitlines(), sentinel)
+    output = "".join("%s\n" % line for line in lines)
+    return lines.exit_code, output
+
+
+class AdbShellSession:
+    """
+    One 'adb shell' process per device.
+
+    The session is (re-)started on demand, e.g. if the 'adb shell' process died.
+
+    One shell runs one command at a time: The lock is held while iter_lines() streams,
+    so other threads wait until the output is consumed. The consumer must not call
+    the same session while it iterates: that would deadlock, so it raises RuntimeError.
+    """
+
+    def __init__(self, *, serial=None, adb="adb", start_timeout=10):
+        self.serial = serial
+        self.adb = adb
+        self.start_timeout = start_timeout
+
+        self.process = None
+        self.lines = None
+        self.lock = threading.Lock()
+        self.streaming_thread = None  # The consumer of a running iter_lines()
+
+    def args(self):
+        args = [self.adb]
+        if self.serial:
+            args += ["-s", self.serial]
+        args.append("shell")
+        return args
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_lines(self, process, lines):
+        for line in process.stdout:
+            lines.put(line.rstrip("\r\n"))
+        lines.put(None)  # EOF -> 'adb shell' process is dead
+
+    def start(self):
+        self.close()
+
+        log.debug("Start: %r", " ".join(self.args()))
+        self.process = subprocess.Popen(
+            self.args(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        self.lines = queue.Queue()
+        thread = threading.Thread(
+            target=self._read_lines, args=(self.process, self.lines), name="adb shell reader", daemon=True
+        )
+        thread.start()
+
+        # Old devices allocate a pty: disable prompts and echo of our input.
+        # The output of this first command also swallows the shell startup messages.
+        self._run("PS1='';PS2='';stty -echo 2>/dev/null", timeout=self.start_timeout)
+
+    def close(self):
+        if self.process is None:
+            return
+
+        log.debug("Close 'adb shell' session (serial: %r)", self.serial)
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def _queue_lines(self, command, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()  # We don't know the state of the shell: start a new one next time.
+                raise subprocess.TimeoutExpired(command, timeout)
+
+            if line is None:
+                self.close()
+                raise AdbShellSessionDied("'adb shell' died while running: %r" % command)
+
+            yield line
+
+    def _start_command(self, command, timeout):
+        """
+        Send the command and returns a SentinelLines instance for its output.
+        """
+        shell_command, sentinel = sentinel_command(command)
+        try:
+            self.process.stdin.write(shell_command)
+            self.process.stdin.flush()
+        except OSError as err:
+            self.close()
+            raise AdbShellSessionDied("'adb shell' is dead: %s" % err)
+
+        return SentinelLines(self._queue_lines(command, timeout), sentinel)
+
+    def _run(self, command, timeout):
+        lines = self._start_command(command, timeout)
+        output = "".join("%s\n" % line for line in lines)
+        return lines.exit_code, output
+
+    def _check_not_streaming(self, command):
+        if self.streaming_thread is threading.current_thread():
+            raise RuntimeError("Nested call %r while iter_lines() streams: would deadlock" % command)
+
+    def run(self, command, timeout=10):
+        """
+        Run the command in the device shell and returns (exit_code, output)
+        Restarts the session once, if the 'adb shell' process is dead.
+        """
+        self._check_not_streaming(command)
+        with self.lock:
+            if not self.alive:
+                self.start()
+            try:
+                return self._run(command, timeout)
+            except AdbShellSessionDied as err:
+                log.error("%s - restart session", err)
+                self.start()
+                return self._run(command, timeout)
+
+    def iter_lines(self, command, timeout=10):
+        """
+        Run the command in the device shell and yields the output lines as soon as they arrive.
+        Raise CalledProcessError at the end, if the exit code is not 0.
+        The session is locked until all lines are consumed (or the generator is closed),
+        so only one consumer can stream and it must not call this session meanwhile.
+        """
+        self._check_not_streaming(command)
+        with self.lock:
+            if not self.alive:
+                self.start()
+
+            lines = self._start_command(command, timeout)
+            finished = False
+            self.streaming_thread = threading.current_thread()
+            try:
+                yield from lines
+                finished = True
+            finally:
+                self.streaming_thread = None
+                if not finished:
+                    # Not all output consumed: The session is unusable
+                    self.close()
+
+        if lines.exit_code != 0:
+            raise subprocess.CalledProcessError(lines.exit_code, command)
+
+    def iter_output(self, *args, timeout=10):
+        """
+        'verbose' streaming version of check_output()
+        """
+        command = " ".join(args)
+        print("Shell: %r..." % command, flush=True)
+
+        start_time = time.time()
+        yield from self.iter_lines(command, timeout=timeout)
+        duration = time.time() - start_time
+        print("Shell: %r (exit code:0 after %s)" % (command, human_duration(duration)))
+
+    def check_output(self, *args, timeout=10):
+        """
+        'verbose' version of subprocess.check_output() for a command in the device shell.
+        Arguments are joined with spaces, just like 'adb shell' does.
+        """
+        command = " ".join(args)
+        print("Shell: %r..." % command, end=" ", flush=True)
+
+        start_time = time.time()
+        exit_code, output = self.run(command, timeout=timeout)
+        duration = time.time() - start_time
+        print("(exit code:%r after %s)" % (exit_code, human_duration(duration)))
+
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(exit_code, command, output=output)
+
+        return output
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
+
+    session = AdbShellSession()
+    try:
+        for no in range(3):
+            print(session.check_output("getprop", "ro.product.model"))
+        print(session.check_output("pm", "list", "packages", "|", "head", "-n", "3"))
+    finally:
+        session.close()
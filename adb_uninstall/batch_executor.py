@@ -0,0 +1,299 @@
+"""
+    Run a 'pm' batch in chunks with progress, ETA, pause and cancel.
+
+    Every chunk is one 'adb shell' call (see adb_batch.run_batch), so pause and
+    cancel take effect between two chunks. The ETA is computed from the
+    observed time per package (EWMA), so a pause doesn't distort it.
+    The same EWMA sizes the chunks: about BATCH_CHUNK_DURATION of work per call,
+    but never more packages than fit into one script.
+"""
+
+import logging
+import threading
+import time
+
+from adb_uninstall.adb_batch import (
+    BATCH_MARKER,
+    BATCH_MAX_SCRIPT_LENGTH,
+    PACKAGE_NAME_RE,
+    build_batch_scripts,
+    run_batch,
+)
+from adb_uninstall.utils.humanize import human_duration
+
+log = logging.getLogger(__name__)
+
+# Packages in the first 'adb shell' call, before the time per package is known:
+BATCH_FIRST_CHUNK_SIZE = 10
+# Work per 'adb shell' call: shorter -> finer progress and faster pause/cancel, but more round trips
+BATCH_CHUNK_DURATION = 1.0  # sec.
+# Every package in a script prints the marker: more packages never fit into one script
+BATCH_MAX_CHUNK_SIZE = BATCH_MAX_SCRIPT_LENGTH // len(BATCH_MARKER)
+EWMA_ALPHA = 0.3
+PAUSE_POLL_INTERVAL = 0.1  # sec.
+
+CANCELLED = "cancelled"
+INVALID_NAME = "invalid package name"
+
+
+class BatchProgress:
+    """
+    Immutable snapshot of a running batch.
+
+    >>> progress = BatchProgress(total=100, completed=40, failed=2, active_time=20, per_package=0.5)
+    >>> print(progress)
+    40/100 done, 2 failed, 2.0 packages/sec, ETA 30.0 sec
+    >>> progress.percent
+    40.0
+    """
+
+    def __init__(self, *, total, completed=0, failed=0, active_time=0, per_package=None, paused=False):
+        self.total = total
+        self.completed = completed
+        self.failed = failed
+        self.active_time = active_time  # sec. without pauses
+        self.per_package = per_package  # EWMA of sec. per package
+        self.paused = paused
+
+    @property
+    def percent(self):
+        return self.completed / self.total * 100 if self.total else 100.0
+
+    @property
+    def throughput(self):
+        """
+        packages per sec. (or None)
+        """
+        if not self.completed or not self.active_time:
+            return None
+        return self.completed / self.active_time
+
+    @property
+    def eta(self):
+        """
+        Estimated remaining time in sec. (or None)
+        """
+        if self.per_package is None:
+            return None
+        return (self.total - self.completed) * self.per_package
+
+    def __str__(self):
+        parts = ["%i/%i done" % (self.completed, self.total)]
+        if self.failed:
+            parts.append("%i failed" % self.failed)
+        if self.throughput is not None:
+            parts.append("%.1f packages/sec" % self.throughput)
+        if self.eta is not None:
+            parts.append("ETA %s" % human_duration(self.eta))
+        if self.paused:
+            parts.append("PAUSED")
+        return ", ".join(parts)
+
+
+class BatchSummary:
+    def __init__(self, *, results, skipped, cancelled, duration):
+        self.results = results  # list of BatchResult instances
+        self.skipped = skipped  # dict: package name -> reason
+        self.cancelled = cancelled
+        self.duration = duration
+
+    @property
+    def succeeded(self):
+        return [result.package_name for result in self.results if result.success]
+
+    @property
+    def failed(self):
+        return [result.package_name for result in self.results if not result.success]
+
+    def as_dict(self):
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": sorted(self.skipped),
+            "cancelled": self.cancelled,
+            "duration": round(self.duration, 3),
+        }
+
+    def __str__(self):
+        text = "%i succeeded, %i failed, %i skipped in %s" % (
+            len(self.succeeded), len(self.failed), len(self.skipped), human_duration(self.duration)
+        )
+        if self.cancelled:
+            text += " (cancelled)"
+        return text
+
+
+class BatchExecutor:
+    """
+    pause(), resume() and cancel() can be called from any thread.
+    'on_progress' is called with a BatchProgress instance after every chunk (in the worker thread).
+    'should_stop' is checked between the chunks, too (e.g. TaskRunner.is_cancelled)
+
+    >>> import re
+    >>> def check_output(*args, timeout):
+    ...     package_names = re.findall(r"RESULT__ (\\S+)", args[2])
+    ...     return "".join("Success\\n__ADB_UNINSTALL_RESULT__ %s 0\\n" % name for name in package_names)
+    >>> completed = []
+    >>> executor = BatchExecutor(chunk_size=2, on_progress=lambda progress: completed.append(progress.completed))
+    >>> summary = executor.run(check_output, ("pm", "uninstall", "--user", "0"), ["com.a", "com.b", "com.c"])
+    >>> completed
+    [0, 2, 3]
+    >>> summary.as_dict()["succeeded"]
+    ['com.a', 'com.b', 'com.c']
+
+    >>> executor = BatchExecutor(chunk_size=2, on_progress=lambda progress: progress.completed and executor.cancel())
+    >>> summary = executor.run(check_output, ("pm", "uninstall", "--user", "0"), ["com.a", "com.b", "com.c"])
+    >>> summary.succeeded, summary.skipped, summary.cancelled
+    (['com.a', 'com.b'], {'com.c': 'cancelled'}, True)
+
+    Invalid names are skipped before the first chunk runs:
+    >>> executor = BatchExecutor(chunk_size=2)
+    >>> summary = executor.run(check_output, ("pm", "uninstall", "--user", "0"), ["com.a", "com.b", "bad;name"])
+    >>> summary.succeeded, summary.skipped, summary.cancelled
+    (['com.a', 'com.b'], {'bad;name': 'invalid package name'}, False)
+
+    Without a fixed 'chunk_size' the chunks are sized by the time per package:
+    >>> package_names = ["com.foo%i" % i for i in range(1000)]
+    >>> executor = BatchExecutor()
+    >>> executor.next_chunk_size(("pm", "uninstall", "--user", "0"), package_names, per_package=None)
+    10
+    >>> executor.next_chunk_size(("pm", "uninstall", "--user", "0"), package_names, per_package=0.2)
+    5
+    >>> executor.next_chunk_size(("pm", "uninstall", "--user", "0"), package_names, per_package=0.001)
+    42
+    """
+
+    def __init__(self, *, chunk_size=None, on_progress=None, should_stop=None):
+        self.chunk_size = chunk_size  # None -> see next_chunk_size()
+        self.on_progress = on_progress
+        self.should_stop = should_stop
+
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+    def pause(self):
+        self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resume_event.set()  # Don't wait in a pause
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set() or (self.should_stop is not None and self.should_stop())
+
+    def _wait_while_paused(self):
+        """
+        Returns the pause duration
+        """
+        if not self.paused:
+            return 0
+        log.info("Batch paused.")
+        start_time = time.monotonic()
+        while not self.resume_event.wait(PAUSE_POLL_INTERVAL):
+            if self.cancelled:
+                break
+        log.info("Batch resumed.")
+        return time.monotonic() - start_time
+
+    def next_chunk_size(self, command, package_names, per_package):
+        """
+        Returns the number of packages for the next 'adb shell' call:
+        about BATCH_CHUNK_DURATION of work, but not more than fit into one script.
+        'per_package' is the EWMA of sec. per package (or None before the first chunk)
+        """
+        if self.chunk_size is not None:
+            return self.chunk_size
+        if per_package is None:
+            size = BATCH_FIRST_CHUNK_SIZE
+        else:
+            size = max(1, int(BATCH_CHUNK_DURATION / max(per_package, 1e-6)))
+        size = min(size, BATCH_MAX_CHUNK_SIZE)
+        first_script = build_batch_scripts(command, package_names[:size])[0]
+        return first_script.count(BATCH_MARKER)
+
+    def _report(self, progress):
+        if self.on_progress is not None:
+            self.on_progress(progress)
+
+    def run(self, check_output, command, package_names, on_results=None):
+        """
+        Returns a BatchSummary.
+        'on_results' is called with the BatchResult list of every chunk, e.g. Journal.append
+        All package names are checked before the first chunk runs: invalid names are skipped.
+        """
+        skipped = {}
+        valid_names = []
+        for package_name in package_names:
+            if PACKAGE_NAME_RE.match(package_name):
+                valid_names.append(package_name)
+            else:
+                log.error("Skip invalid package name: %r", package_name)
+                skipped[package_name] = INVALID_NAME
+        package_names = valid_names
+
+        total = len(package_names)
+        start_time = time.monotonic()
+        pause_time = 0
+        per_package = None
+        results = []
+        failed = 0
+        cancelled = False
+
+        self._report(BatchProgress(total=total))
+        start = 0
+        while start < total:
+            pause_time += self._wait_while_paused()
+            if self.cancelled:
+                log.info("Batch cancelled.")
+                cancelled = True
+                for package_name in package_names[start:]:
+                    skipped[package_name] = CANCELLED
+                break
+
+            chunk_size = self.next_chunk_size(
+                command, package_names[start:start + BATCH_MAX_CHUNK_SIZE], per_package
+            )
+            chunk = package_names[start:start + chunk_size]
+            start += len(chunk)
+            chunk_start_time = time.monotonic()
+            chunk_results = run_batch(check_output, command, chunk)
+            duration = (time.monotonic() - chunk_start_time) / len(chunk)
+            per_package = duration if per_package is None else per_package + EWMA_ALPHA * (duration - per_package)
+
+            if on_results is not None:
+                on_results(chunk_results)
+
+            results += chunk_results
+            failed += len([result for result in chunk_results if not result.success])
+            self._report(
+                BatchProgress(
+                    total=total,
+                    completed=len(results),
+                    failed=failed,
+                    active_time=time.monotonic() - start_time - pause_time,
+                    per_package=per_package,
+                    paused=self.paused,
+                )
+            )
+
+        return BatchSummary(
+            results=results,
+            skipped=skipped,
+            cancelled=cancelled,
+            duration=time.monotonic() - start_time,
+        )
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
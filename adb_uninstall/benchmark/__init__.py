@@ -0,0 +1,9 @@
+"""
+    End-to-end benchmarks against fake devices, e.g.:
+
+        $ python3 -m adb_uninstall.benchmark --packages 100,1000,20000 --output before.json
+        $ python3 -m adb_uninstall.benchmark --packages 100,1000,20000 --compare before.json
+
+    A fake 'adb' executable is put on PATH and a fake adb server is started,
+    so no device, adb binary or display is needed (the PackageTable benchmark is skipped without display).
+"""
@@ -0,0 +1,99 @@
+"""
+    Command line interface of the benchmarks, see: adb_uninstall/benchmark/__init__.py
+"""
+
+import argparse
+import json
+import sys
+
+from adb_uninstall.benchmark.harness import SCENARIOS, TRANSPORTS, compare_reports, format_result, run_benchmarks
+
+
+def comma_list(value, type=str):
+    return [type(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="python3 -m adb_uninstall.benchmark", description="Benchmarks against fake adb devices."
+    )
+    parser.add_argument(
+        "-p", "--packages", default="100,1000", help="comma separated package counts per device (default: %(default)s)"
+    )
+    parser.add_argument("-d", "--devices", type=int, default=2, help="number of fake devices (default: %(default)s)")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="sec. per 'pm uninstall/disable-user' (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.05, help="part of failing packages (default: %(default)s)"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per scenario (default: %(default)s)")
+    parser.add_argument(
+        "--batch-size", type=int, default=50, help="packages per uninstall/disable run (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--transport", default=",".join(TRANSPORTS), help="comma separated: %s" % ", ".join(TRANSPORTS)
+    )
+    parser.add_argument("--only", help="comma separated scenarios: %s" % ", ".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1, help="seed for the fake packages (default: %(default)s)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with the JSON results of a previous run")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    transports = comma_list(args.transport)
+    scenarios = comma_list(args.only) if args.only else None
+    for value, choices in ((transports, TRANSPORTS), (scenarios or [], SCENARIOS)):
+        unknown = set(value) - set(choices)
+        if unknown:
+            print("Unknown: %s (choices: %s)" % (", ".join(sorted(unknown)), ", ".join(choices)), file=sys.stderr)
+            return 2
+
+    old_report = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old_report = json.load(f)
+
+    report = run_benchmarks(
+        package_counts=comma_list(args.packages, type=int),
+        device_count=args.devices,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        repeat=args.repeat,
+        batch_size=args.batch_size,
+        transports=transports,
+        scenarios=scenarios,
+        seed=args.seed,
+        progress=lambda text: print(text, file=sys.stderr, flush=True),
+    )
+
+    print()
+    for result in report["results"]:
+        print("%-20s %-7s %6i packages: %s" % (
+            result["name"], result["transport"], result["packages"], format_result(result)
+        ))
+
+    if old_report is not None:
+        print()
+        print("Compared with %s (commit %s):" % (args.compare, old_report.get("git_commit")))
+        for name, transport, packages, old_median, new_median, change in compare_reports(old_report, report):
+            print("%-20s %-7s %6i packages: %8.1fms -> %8.1fms %s" % (
+                name, transport, packages, old_median * 1000, new_median * 1000,
+                "" if change is None else "%+.1f%%" % change
+            ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("\nResults saved to: %s" % args.output)
+
+    if any("error" in result for result in report["results"]):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+    A fake 'adb' executable for the fake devices, see: fake_device.py
+
+    Supports: [-s SERIAL] devices [-l], shell [command], exec-out command,
+    start-server, kill-server, reconnect and version.
+    'adb shell' without a command is a interactive device shell for the AdbShellSession.
+"""
+
+import os
+import sys
+
+from adb_uninstall.benchmark.fake_device import FAKE_ADB_ROOT_ENV, FakeDevices
+
+FAKE_ADB_VERSION = "1.0.41"
+
+
+def error(message):
+    print("adb: error: %s" % message, file=sys.stderr)
+    return 1
+
+
+def select_serial(devices, serial):
+    if serial is None:
+        serial = os.environ.get("ANDROID_SERIAL")
+    if serial is None:
+        if len(devices.serials) != 1:
+            return None, "more than one device/emulator" if devices.serials else "no devices/emulators found"
+        return devices.serials[0], None
+    if serial not in devices.serials:
+        return None, "device '%s' not found" % serial
+    return serial, None
+
+
+def main(argv):
+    root = os.environ.get(FAKE_ADB_ROOT_ENV)
+    if not root:
+        return error("%s is not set" % FAKE_ADB_ROOT_ENV)
+    devices = FakeDevices.from_root(root)
+
+    serial = None
+    if argv[:1] == ["-s"]:
+        serial = argv[1]
+        argv = argv[2:]
+    if not argv:
+        return error("no command")
+
+    command = argv[0]
+    if command == "devices":
+        print("List of devices attached")
+        for no, device_serial in enumerate(devices.serials, 1):
+            if "-l" in argv:
+                print(
+                    "%-22s device product:fake model:Fake_%i device:fake transport_id:%i" % (device_serial, no, no)
+                )
+            else:
+                print("%s\tdevice" % device_serial)
+        print()
+        return 0
+    elif command in ("start-server", "kill-server", "reconnect"):
+        return 0
+    elif command == "version":
+        print("Android Debug Bridge version %s (fake)" % FAKE_ADB_VERSION)
+        return 0
+    elif command in ("shell", "exec-out"):
+        serial, message = select_serial(devices, serial)
+        if serial is None:
+            return error(message)
+
+        sys.stdout.flush()
+        args = ["sh"]
+        if len(argv) > 1:
+            # Just like adb: all arguments are joined with spaces
+            args += ["-c", " ".join(argv[1:])]
+        os.execvpe("sh", args, devices.device_env(serial))
+    else:
+        return error("unknown command %s" % command)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,381 @@
+"""
+    Fake Android devices for the benchmarks.
+
+    Every device is a directory with a package list and a state log.
+    The device shell is the local 'sh' with fake 'pm', 'getprop', 'dumpsys' and 'stat' commands on PATH,
+    so the inventory script, the sentinel wrapper and the batch scripts run unchanged.
+    'pm uninstall'/'pm disable-user' (and the restores) sleep 'latency' seconds and fail for a
+    fixed ('seed' dependent) part of the packages, so runs are comparable.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as root:
+    ...     devices = FakeDevices(root, serials=["S1"], package_count=20, failure_rate=0)
+    ...     devices.create()
+    ...     output = devices.shell_handler("S1", "pm list packages -3 | head -n 2").decode()
+    ...     package_name = output.splitlines()[0][8:]
+    ...     print(devices.shell_handler("S1", "pm uninstall --user 0 %s" % package_name).decode(), end="")
+    ...     print(devices.shell_handler("S1", "pm uninstall --user 0 %s" % package_name).decode(), end="")
+    ...     print(devices.shell_handler("S1", "pm list packages | grep -c %s" % package_name).decode(), end="")
+    Success
+    Failure [not installed for 0]
+    0
+"""
+
+import json
+import os
+import random
+import shlex
+import stat
+import subprocess
+import sys
+
+FAKE_ADB_ROOT_ENV = "FAKE_ADB_ROOT"
+FAKE_DEVICE_DIR_ENV = "FAKE_DEVICE_DIR"
+
+CONFIG_FILENAME = "config.json"
+PACKAGES_FILENAME = "packages.tsv"  # name, APK path, installer, uid, system (1/0), fails (1/0)
+STATE_FILENAME = "state.log"  # name, state - the last line of a package wins
+
+ENABLED = "enabled"
+DISABLED = "disabled"
+UNINSTALLED = "uninstalled"
+
+# The first line is a header: awk's 'FNR == NR' doesn't work with an empty first file.
+STATE_HEADER = "#name\tstate\n"
+
+VENDORS = ("com.android", "com.google.android", "com.samsung.android", "com.sec.android.app", "com.facebook")
+WORDS = ("app", "service", "provider", "sync", "store", "media", "game", "ui", "cloud", "update", "daemon")
+
+PM_SCRIPT = r"""#!/bin/sh
+# 'pm' of a fake benchmark device, see: adb_uninstall/benchmark/fake_device.py
+DEVICE_DIR="${FAKE_DEVICE_DIR:?FAKE_DEVICE_DIR is not set}"
+. "$DEVICE_DIR/device.conf"
+
+package_state() {
+    # print "<state> <fails>" or nothing, if the package doesn't exist
+    awk -F '\t' -v name="$1" '
+        FNR == NR { if ($1 == name) state = $2; next }
+        $1 == name { print (state == "" ? "enabled" : state) " " $6; exit }
+    ' "$DEVICE_DIR/state.log" "$DEVICE_DIR/packages.tsv"
+}
+
+command="$1"
+shift
+case "$command" in
+list)
+    if [ "$1" != "packages" ]; then
+        echo "Error: unknown list type '$1'"
+        exit 1
+    fi
+    shift
+    exec awk -F '\t' -v flags=" $* " '
+        FNR == NR { state[$1] = $2; next }
+        {
+            name = $1
+            st = (name in state) ? state[name] : "enabled"
+            if (st == "uninstalled" && !index(flags, " -u ")) next
+            if (index(flags, " -d ") && st != "disabled") next
+            if (index(flags, " -e ") && st != "enabled") next
+            if (index(flags, " -s ") && $5 != "1") next
+            if (index(flags, " -3 ") && $5 == "1") next
+            line = "package:"
+            if (index(flags, " -f ")) line = line $2 "="
+            line = line name
+            if (index(flags, " -i ")) line = line "  installer=" $3
+            if (index(flags, " -U ")) line = line " uid:" $4
+            print line
+        }
+    ' "$DEVICE_DIR/state.log" "$DEVICE_DIR/packages.tsv"
+    ;;
+uninstall|disable-user)
+    for name; do :; done  # The package name is the last argument
+    if [ "$LATENCY" != "0" ]; then
+        sleep "$LATENCY"
+    fi
+    set -- $(package_state "$name")
+    if [ -z "$1" ] || [ "$1" = "uninstalled" ]; then
+        if [ "$command" = "uninstall" ]; then
+            echo "Failure [not installed for 0]"
+        else
+            echo "Exception occurred while executing 'disable-user':"
+            echo "java.lang.IllegalArgumentException: Unknown package: $name"
+        fi
+        exit 1
+    fi
+    if [ "$2" = "1" ]; then
+        if [ "$command" = "uninstall" ]; then
+            echo "Failure [DELETE_FAILED_INTERNAL_ERROR]"
+        else
+            echo "Exception occurred while executing 'disable-user':"
+            echo "java.lang.SecurityException: Cannot disable a protected package: $name"
+        fi
+        exit 1
+    fi
+    if [ "$command" = "uninstall" ]; then
+        printf '%s\tuninstalled\n' "$name" >> "$DEVICE_DIR/state.log"
+        echo "Success"
+    else
+        printf '%s\tdisabled\n' "$name" >> "$DEVICE_DIR/state.log"
+        echo "Package $name new state: disabled-user"
+    fi
+    ;;
+install-existing|enable)
+    for name; do :; done
+    if [ "$LATENCY" != "0" ]; then
+        sleep "$LATENCY"
+    fi
+    set -- $(package_state "$name")
+    if [ -z "$1" ] || { [ "$command" = "enable" ] && [ "$1" = "uninstalled" ]; }; then
+        echo "Exception occurred while executing '$command':"
+        echo "java.lang.IllegalArgumentException: Unknown package: $name"
+        exit 1
+    fi
+    if [ "$command" = "install-existing" ]; then
+        if [ "$1" = "uninstalled" ]; then
+            printf '%s\tenabled\n' "$name" >> "$DEVICE_DIR/state.log"
+        fi
+        echo "Package $name installed for user: 0"
+    else
+        printf '%s\tenabled\n' "$name" >> "$DEVICE_DIR/state.log"
+        echo "Package $name new state: enabled"
+    fi
+    ;;
+*)
+    echo "Error: fake pm doesn't support: $command $*"
+    exit 1
+    ;;
+esac
+"""
+
+CMD_SCRIPT = r"""#!/bin/sh
+# 'cmd' of a fake benchmark device: only 'cmd package ...' (the same as 'pm ...')
+if [ "$1" != "package" ]; then
+    echo "Can't find service: $1"
+    exit 20
+fi
+shift
+exec pm "$@"
+"""
+
+DUMPSYS_SCRIPT = r"""#!/bin/sh
+# 'dumpsys' of a fake benchmark device: only 'dumpsys diskstats'
+# Sizes are derived from the uid. Every 10th package is missing, like a new app before the daily diskstats job.
+DEVICE_DIR="${FAKE_DEVICE_DIR:?FAKE_DEVICE_DIR is not set}"
+if [ "$1" != "diskstats" ]; then
+    echo "Can't find service: $1"
+    exit 0
+fi
+echo "Latency: 1ms [512B Data Write]"
+echo "Data-Free: 3512384K / 24831248K total = 14% free"
+exec awk -F '\t' '
+    FNR == NR { state[$1] = $2; next }
+    $1 in state && state[$1] == "uninstalled" { next }
+    (FNR % 10) == 0 { next }
+    {
+        sep = (count++ ? "," : "")
+        names = names sep "\"" $1 "\""
+        apps = apps sep (($4 % 97) + 1) * 1048576
+        datas = datas sep ($4 % 13) * 262144
+        caches = caches sep ($4 % 5) * 65536
+    }
+    END {
+        print "Package Names: [" names "]"
+        print "App Sizes: [" apps "]"
+        print "App Data Sizes: [" datas "]"
+        print "Cache Sizes: [" caches "]"
+    }
+' "$DEVICE_DIR/state.log" "$DEVICE_DIR/packages.tsv"
+"""
+
+STAT_SCRIPT = r"""#!/bin/sh
+# 'stat -c "%n %s" FILE...' of a fake benchmark device: the APK files don't exist, the size is derived from the path.
+# A unmatched "DIR/*.apk" glob stands for "DIR/base.apk"
+if [ "$1" != "-c" ] || [ "$2" != "%n %s" ]; then
+    echo "stat: fake stat supports only: -c '%n %s' FILE..." >&2
+    exit 1
+fi
+shift 2
+for f; do
+    case "$f" in
+    */\*.apk) f="${f%/*.apk}/base.apk" ;;
+    esac
+    echo "$f $(( ${#f} * 100000 ))"
+done
+"""
+
+GETPROP_SCRIPT = r"""#!/bin/sh
+# 'getprop' of a fake benchmark device, see: adb_uninstall/benchmark/fake_device.py
+DEVICE_DIR="${FAKE_DEVICE_DIR:?FAKE_DEVICE_DIR is not set}"
+if [ -z "$1" ]; then
+    sed -e 's/^\([^=]*\)=\(.*\)$/[\1]: [\2]/' "$DEVICE_DIR/build.prop"
+else
+    sed -n -e "s/^$1=//p" "$DEVICE_DIR/build.prop"
+fi
+"""
+
+
+def _write_executable(filepath, content):
+    with open(filepath, "w") as f:
+        f.write(content)
+    os.chmod(filepath, os.stat(filepath).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+class FakeDevices:
+    """
+    All fake devices below 'root'.
+    """
+
+    def __init__(self, root, *, serials, package_count=1000, latency=0.0, failure_rate=0.0, seed=1):
+        self.root = os.path.abspath(root)
+        self.serials = list(serials)
+        self.package_count = package_count
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+
+        self.bin_dir = os.path.join(self.root, "bin")  # The fake 'adb'
+        self.device_bin_dir = os.path.join(self.root, "device-bin")  # 'pm', 'getprop', ...
+
+    @classmethod
+    def from_root(cls, root):
+        """
+        Load the devices that FakeDevices.create() stored in 'root'
+        """
+        with open(os.path.join(root, CONFIG_FILENAME), "r") as f:
+            config = json.load(f)
+        return cls(root, **config)
+
+    def device_dir(self, serial):
+        return os.path.join(self.root, "devices", serial)
+
+    def generate_packages(self, serial):
+        """
+        Returns a list of (name, APK path, installer, uid, system, fails) and the initial states.
+        The same seed generates the same packages.
+        """
+        rng = random.Random("%s-%s" % (self.seed, serial))
+        packages = []
+        states = {}
+        for no in range(self.package_count):
+            system = rng.random() < 0.7
+            word = rng.choice(WORDS)
+            if system:
+                name = "%s.%s%i" % (rng.choice(VENDORS), word, no)
+                apk_path = "/system/%s/%s%i/%s%i.apk" % (
+                    rng.choice(("app", "priv-app")), word.title(), no, word.title(), no
+                )
+                installer = "null"
+                uid = 1000 if rng.random() < 0.1 else 10000 + no
+            else:
+                name = "com.example%i.%s" % (no, word)
+                apk_path = "/data/app/~~%08x==/%s-%08x==/base.apk" % (rng.getrandbits(32), name, rng.getrandbits(32))
+                installer = "com.android.vending"
+                uid = 10000 + no
+
+            fails = rng.random() < self.failure_rate
+            packages.append((name, apk_path, installer, uid, int(system), int(fails)))
+
+            initial_state = rng.random()
+            if initial_state < 0.02:
+                states[name] = UNINSTALLED
+            elif initial_state < 0.07:
+                states[name] = DISABLED
+
+        return packages, states
+
+    def create(self):
+        os.makedirs(self.bin_dir, exist_ok=True)
+        os.makedirs(self.device_bin_dir, exist_ok=True)
+
+        with open(os.path.join(self.root, CONFIG_FILENAME), "w") as f:
+            json.dump(
+                {
+                    "serials": self.serials,
+                    "package_count": self.package_count,
+                    "latency": self.latency,
+                    "failure_rate": self.failure_rate,
+                    "seed": self.seed,
+                },
+                f,
+            )
+
+        _write_executable(os.path.join(self.device_bin_dir, "pm"), PM_SCRIPT)
+        _write_executable(os.path.join(self.device_bin_dir, "cmd"), CMD_SCRIPT)
+        _write_executable(os.path.join(self.device_bin_dir, "getprop"), GETPROP_SCRIPT)
+        _write_executable(os.path.join(self.device_bin_dir, "dumpsys"), DUMPSYS_SCRIPT)
+        _write_executable(os.path.join(self.device_bin_dir, "stat"), STAT_SCRIPT)
+
+        # The fake 'adb' executable must find this package:
+        python_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        _write_executable(
+            os.path.join(self.bin_dir, "adb"),
+            '#!/bin/sh\nPYTHONPATH=%s exec %s -m adb_uninstall.benchmark.fake_adb "$@"\n'
+            % (shlex.quote(python_path), shlex.quote(sys.executable)),
+        )
+
+        for no, serial in enumerate(self.serials, 1):
+            device_dir = self.device_dir(serial)
+            os.makedirs(device_dir, exist_ok=True)
+
+            with open(os.path.join(device_dir, "device.conf"), "w") as f:
+                f.write("LATENCY=%s\n" % self.latency)
+
+            with open(os.path.join(device_dir, "build.prop"), "w") as f:
+                f.write("ro.product.model=Fake_%i\n" % no)
+                f.write("ro.product.device=fake\n")
+                f.write("ro.build.fingerprint=fake/benchmark/%s:%i\n" % (serial, self.seed))
+
+            packages, states = self.generate_packages(serial)
+            with open(os.path.join(device_dir, PACKAGES_FILENAME), "w") as f:
+                for package in packages:
+                    f.write("%s\n" % "\t".join(str(value) for value in package))
+
+        self.reset()
+
+    def reset(self):
+        """
+        Restore the initial package states on all devices.
+        """
+        for serial in self.serials:
+            packages, states = self.generate_packages(serial)
+            with open(os.path.join(self.device_dir(serial), STATE_FILENAME), "w") as f:
+                f.write(STATE_HEADER)
+                for package_name, state in states.items():
+                    f.write("%s\t%s\n" % (package_name, state))
+
+    def device_env(self, serial):
+        """
+        Environment of the device shell.
+        """
+        env = dict(os.environ)
+        env["PATH"] = "%s%s%s" % (self.device_bin_dir, os.pathsep, env.get("PATH", ""))
+        env[FAKE_DEVICE_DIR_ENV] = self.device_dir(serial)
+        return env
+
+    def env(self):
+        """
+        Environment with the fake 'adb' on PATH.
+        """
+        env = dict(os.environ)
+        env["PATH"] = "%s%s%s" % (self.bin_dir, os.pathsep, env.get("PATH", ""))
+        env[FAKE_ADB_ROOT_ENV] = self.root
+        return env
+
+    def shell_handler(self, serial, command):
+        """
+        shell handler for the FakeAdbServer: run the command in the device shell.
+        """
+        completed_process = subprocess.run(
+            ["sh", "-c", command],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=self.device_env(serial),
+        )
+        return completed_process.stdout
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
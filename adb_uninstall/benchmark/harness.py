@@ -0,0 +1,621 @@
+"""
+    Run the benchmark scenarios against fake devices.
+
+    Every scenario runs per package count and adb transport:
+
+     * "server": the AdbClient talks to a in-process FakeAdbServer
+     * "binary": no adb server, only the fake 'adb' executable on PATH (and the 'adb shell' session)
+
+    The result is a JSON serializable dict, see: run_benchmarks()
+"""
+
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+
+from adb_uninstall import __version__
+from adb_uninstall.adb_backend import AdbBackend
+from adb_uninstall.adb_client import AdbClient
+from adb_uninstall.adb_devices import parse_devices
+from adb_uninstall.adb_inventory import InventoryParser, build_inventory_script
+from adb_uninstall.benchmark.fake_device import FAKE_ADB_ROOT_ENV, FakeDevices
+from adb_uninstall.engine import DISABLE, UNINSTALL, Engine
+from adb_uninstall.fleet import Fleet
+from adb_uninstall.metrics import registry
+from adb_uninstall.utils.fake_adb_server import FakeAdbServer
+
+log = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+SERVER = "server"
+BINARY = "binary"
+TRANSPORTS = (SERVER, BINARY)
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Skipped(Exception):
+    pass
+
+
+class Context:
+    def __init__(self, *, devices, transport, server, repeat, batch_size):
+        self.devices = devices
+        self.transport = transport
+        self.server = server
+        self.repeat = repeat
+        self.batch_size = batch_size
+
+    @property
+    def serial(self):
+        return self.devices.serials[0]
+
+    def client(self):
+        if self.transport == SERVER:
+            return AdbClient(port=self.server.port)
+        return None
+
+    def backend(self, serial=None):
+        if self.transport == SERVER:
+            return AdbBackend(serial=serial, client=self.client())
+        return AdbBackend(serial=serial, use_client=False)
+
+    @contextlib.contextmanager
+    def engine(self):
+        engine = Engine(
+            serial=self.serial,
+            backend=self.backend(self.serial),
+            journal_path=os.path.join(self.devices.root, "journal"),
+            tracker_db_path=os.path.join(self.devices.root, "trackers.sqlite"),
+        )
+        try:
+            connect_result = engine.connect()
+            if not connect_result.healthy:
+                raise RuntimeError("Can't connect the fake device: %s" % connect_result)
+            yield engine
+        finally:
+            engine.close()
+            if engine.backend.client is not None:
+                engine.backend.client.close()
+
+    def subprocess_env(self):
+        env = self.devices.env()
+        env["ANDROID_ADB_SERVER_PORT"] = str(self.server.port)
+        env["HOME"] = os.path.join(self.devices.root, "home")
+        env["PYTHONPATH"] = PACKAGE_ROOT
+        return env
+
+    def measure(self, func, setup=None, warmup=True):
+        """
+        Call func() 'repeat' times and returns the durations and the last return value of func()
+        setup() is called before every call, but is not measured.
+        """
+        if warmup:
+            if setup is not None:
+                setup()
+            func()
+
+        durations = []
+        extra = None
+        for no in range(self.repeat):
+            if setup is not None:
+                setup()
+            start_time = time.perf_counter()
+            extra = func()
+            durations.append(time.perf_counter() - start_time)
+        return durations, extra
+
+
+###############################################################################
+# Scenarios
+
+
+def bench_startup_cli(context):
+    """
+    'python -m adb_uninstall devices' in a new process: imports, connect and 'adb devices'
+    """
+    if context.transport != SERVER:
+        raise Skipped("the command line interface always uses the adb server")
+
+    env = context.subprocess_env()
+
+    def run():
+        subprocess.run(
+            [sys.executable, "-m", "adb_uninstall", "devices"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+    return context.measure(run, warmup=False)
+
+
+def bench_startup_gui_import(context):
+    """
+    'import adb_uninstall.gui' in a new process
+    """
+    if context.transport != SERVER:
+        raise Skipped("transport independent")
+    try:
+        import tkinter  # noqa: F401
+    except ImportError as err:
+        raise Skipped("no tkinter: %s" % err)
+
+    env = context.subprocess_env()
+
+    def run():
+        subprocess.run([sys.executable, "-c", "import adb_uninstall.gui"], env=env, check=True)
+
+    return context.measure(run, warmup=False)
+
+
+def bench_connect(context):
+    """
+    Engine.connect() with a new backend
+    """
+
+    def run():
+        backend = context.backend()
+        try:
+            Engine(backend=backend).connect()
+        finally:
+            backend.close()
+            if backend.client is not None:
+                backend.client.close()
+
+    return context.measure(run)
+
+
+def bench_fetch_inventory(context):
+    """
+    Engine.fetch_packages(): one inventory call and fill the Packages
+    """
+    with context.engine() as engine:
+
+        def run():
+            packages = engine.fetch_packages()
+            return {"packages": len(packages.name2package)}
+
+        return context.measure(run)
+
+
+def bench_fetch_footprints(context):
+    """
+    Engine.fetch_footprints(): one 'dumpsys diskstats' call + 'stat' for the packages missing in the diskstats
+    """
+    with context.engine() as engine:
+        engine.fetch_packages()
+
+        def run():
+            footprints = engine.fetch_footprints()
+            return {
+                "packages": len(footprints),
+                "apk_only": len([footprint for footprint in footprints.values() if footprint.data_size is None]),
+            }
+
+        return context.measure(run)
+
+
+def bench_fetch_package_list(context):
+    """
+    The streaming inventory of the GUI's fetch_package_list(): parse the lines as they arrive
+    """
+    with context.engine() as engine:
+
+        def run():
+            parser = InventoryParser()
+            count = 0
+            for line in engine.backend.iter_output("adb", "shell", build_inventory_script(), timeout=30):
+                if parser.feed(line) is not None:
+                    count += 1
+            parser.merge()
+            return {"packages": count}
+
+        return context.measure(run)
+
+
+def bench_package_table(context):
+    """
+    Fill the GUI PackageTable in chunks, like fetch_package_list() does.
+    """
+    try:
+        import tkinter
+    except ImportError as err:
+        raise Skipped("no tkinter: %s" % err)
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError as err:
+        raise Skipped("no display: %s" % err)
+
+    from adb_uninstall.adb_package import Packages
+    from adb_uninstall.gui import FETCH_CHUNK_SIZE, PackageTable
+
+    try:
+        root.withdraw()
+        with context.engine() as engine:
+            infos = [package.info for package in engine.fetch_packages().name2package.values()]
+
+        def run():
+            # PackageTable puts its widgets into the parent: use a new frame per run
+            frame = tkinter.Frame(root)
+            table = PackageTable(frame, Packages(), output_callback=lambda *args, **kwargs: None, actions={})
+            for start in range(0, len(infos), FETCH_CHUNK_SIZE):
+                table.add_infos(infos[start:start + FETCH_CHUNK_SIZE])
+                root.update()
+            table.sort_by_name()
+            root.update()
+            frame.destroy()
+            return {"packages": len(infos)}
+
+        return context.measure(run)
+    finally:
+        root.destroy()
+
+
+# Typed char by char in bench_package_search():
+SEARCH_QUERIES = ("com.example1", "*.update", "com.example2*", "re:^com\\.example[0-9]+\\.app$")
+
+
+def bench_package_search(context):
+    """
+    Build the PackageIndex of the filter box and type the SEARCH_QUERIES char by char
+    """
+    if context.transport != SERVER:
+        raise Skipped("no adb calls: the same as for the server transport")
+
+    from adb_uninstall.package_index import PackageIndex, QueryError
+
+    with context.engine() as engine:
+        package_names = list(engine.fetch_packages().name2package)
+
+    def run():
+        start_time = time.perf_counter()
+        index = PackageIndex(package_names)
+        build_time = time.perf_counter() - start_time
+
+        keystroke_times = []
+        for query in SEARCH_QUERIES:
+            for end in range(1, len(query) + 1):
+                start_time = time.perf_counter()
+                try:
+                    index.search(query[:end])
+                except QueryError:
+                    pass  # e.g. a incomplete regex, like in the filter box
+                keystroke_times.append(time.perf_counter() - start_time)
+        return {
+            "packages": len(index),
+            "keystrokes": len(keystroke_times),
+            "keystroke_max_ms": round(max(keystroke_times) * 1000, 3),
+            "keystroke_mean_ms": round(statistics.mean(keystroke_times) * 1000, 3),
+            "build_ms": round(build_time * 1000, 3),
+        }
+
+    return context.measure(run)
+
+
+# The tracker dump of bench_tracker_lookup() contains this many packages per device package:
+TRACKER_DUMP_FACTOR = 10
+
+
+def bench_tracker_lookup(context):
+    """
+    Engine.lookup_trackers(): open the offline tracker index and look up all packages of the device
+    """
+    if context.transport != SERVER:
+        raise Skipped("no adb calls: the same as for the server transport")
+
+    from adb_uninstall.tracker_db import import_dump
+
+    with context.engine() as engine:
+        package_names = list(engine.fetch_packages().name2package)
+
+        # Reports for 3/4 of the device packages, hidden between other packages:
+        applications = [
+            {"handle": "org.other%i.app" % no, "reports": [{"trackers": [no % 50, (no * 7) % 50]}]}
+            for no in range(len(package_names) * TRACKER_DUMP_FACTOR)
+        ]
+        applications += [
+            {"handle": package_name, "reports": [{"trackers": list(range(no % 8))}]}
+            for no, package_name in enumerate(package_names)
+            if no % 4
+        ]
+        dump_path = os.path.join(context.devices.root, "tracker_dump.json")
+        with open(dump_path, "w") as f:
+            json.dump({"applications": applications}, f)
+        import_dump(dump_path, engine.tracker_db.path)
+
+        def run():
+            engine.tracker_db.reload()  # Measure the lazy open, too
+            trackers = engine.lookup_trackers()
+            return {"packages": len(package_names), "known": len(trackers), "index_size": len(applications)}
+
+        return context.measure(run)
+
+
+def _bench_action(context, action):
+    with context.engine() as engine:
+        packages = engine.fetch_packages().name2package.values()
+        package_names = [
+            package.package_name
+            for package in packages
+            if not package.locked and package.info is not None and package.info.state == package.info.ENABLED
+        ][:context.batch_size]
+        if not package_names:
+            raise Skipped("no package for %s" % action)
+
+        def run():
+            action_result = engine.run_action(action, package_names)
+            return {
+                "packages": len(package_names),
+                "failed": len([result for result in action_result.results if not result.success]),
+                "not_done": None if action_result.not_done is None else len(action_result.not_done),
+            }
+
+        return context.measure(run, setup=context.devices.reset, warmup=False)
+
+
+def bench_action_uninstall(context):
+    """
+    Engine.run_action(): 'pm uninstall' batch + verify (the GUI's _action() uses the same)
+    """
+    return _bench_action(context, UNINSTALL)
+
+
+def bench_action_disable(context):
+    """
+    Engine.run_action(): 'pm disable-user' batch + verify
+    """
+    return _bench_action(context, DISABLE)
+
+
+def bench_action_restore(context):
+    """
+    Engine.restore(): reverse a 'pm uninstall' + 'pm disable-user' batch from the journal + verify
+    """
+    with context.engine() as engine:
+        packages = engine.fetch_packages().name2package.values()
+        package_names = [
+            package.package_name
+            for package in packages
+            if not package.locked and package.info is not None and package.info.state == package.info.ENABLED
+        ][:context.batch_size]
+        if not package_names:
+            raise Skipped("no package to restore")
+        half = len(package_names) // 2
+
+        plans = []
+
+        def setup():
+            context.devices.reset()
+            engine.run_action(UNINSTALL, package_names[:half])
+            engine.run_action(DISABLE, package_names[half:])
+            batch_ids = [batch.batch_id for batch in engine.journal().batches()[-2:]]
+            plans.append(engine.plan_restore(batch_ids=batch_ids))
+
+        def run():
+            action_result = engine.restore(plans.pop())
+            return {
+                "packages": len(action_result.results),
+                "failed": len([result for result in action_result.results if not result.success]),
+                "not_done": None if action_result.not_done is None else len(action_result.not_done),
+            }
+
+        return context.measure(run, setup=setup, warmup=False)
+
+
+def bench_fleet_fetch(context):
+    """
+    Fetch the package lists of all devices at once
+    """
+    if context.transport != SERVER:
+        raise Skipped("the fleet mode always uses the adb server")
+
+    client = context.client()
+    devices = parse_devices(client.devices_output())
+
+    def run():
+        fleet = Fleet(devices=devices, client=context.client())
+        try:
+            wait(fleet.fetch_package_lists())
+        finally:
+            fleet.shutdown()
+        return {"devices": len(fleet.fleet_devices)}
+
+    try:
+        return context.measure(run)
+    finally:
+        client.close()
+
+
+# name -> scenario function
+SCENARIOS = {
+    "startup_cli": bench_startup_cli,
+    "startup_gui_import": bench_startup_gui_import,
+    "connect": bench_connect,
+    "fetch_inventory": bench_fetch_inventory,
+    "fetch_package_list": bench_fetch_package_list,
+    "fetch_footprints": bench_fetch_footprints,
+    "package_table": bench_package_table,
+    "package_search": bench_package_search,
+    "tracker_lookup": bench_tracker_lookup,
+    "action_uninstall": bench_action_uninstall,
+    "action_disable": bench_action_disable,
+    "action_restore": bench_action_restore,
+    "fleet_fetch": bench_fleet_fetch,
+}
+
+
+###############################################################################
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_ROOT, stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.decode("ascii").strip()
+
+
+def result_dict(name, transport, package_count, durations, extra):
+    result = {
+        "name": name,
+        "transport": transport,
+        "packages": package_count,
+        "repeat": len(durations),
+        "min": round(min(durations), 6),
+        "median": round(statistics.median(durations), 6),
+        "mean": round(statistics.mean(durations), 6),
+        "max": round(max(durations), 6),
+        "extra": extra or {},
+    }
+    processed = result["extra"].get("packages")
+    if processed:
+        result["packages_per_sec"] = round(processed / result["median"], 1)
+    return result
+
+
+def run_benchmarks(
+    *,
+    package_counts=(100, 1000),
+    device_count=2,
+    latency=0.0,
+    failure_rate=0.05,
+    repeat=3,
+    batch_size=50,
+    transports=TRANSPORTS,
+    scenarios=None,
+    seed=1,
+    progress=None,
+):
+    """
+    Returns a JSON serializable report.
+    'progress' is called with a info text before/after every scenario.
+    """
+    scenarios = scenarios or list(SCENARIOS)
+    report = {
+        "report_version": REPORT_VERSION,
+        "adb_uninstall": __version__,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "package_counts": list(package_counts),
+            "device_count": device_count,
+            "latency": latency,
+            "failure_rate": failure_rate,
+            "repeat": repeat,
+            "batch_size": batch_size,
+            "seed": seed,
+        },
+        "results": [],
+    }
+    serials = ["FAKE%04i" % no for no in range(1, device_count + 1)]
+
+    for package_count in package_counts:
+        with tempfile.TemporaryDirectory(prefix="adb_uninstall_benchmark_") as root:
+            devices = FakeDevices(
+                root,
+                serials=serials,
+                package_count=package_count,
+                latency=latency,
+                failure_rate=failure_rate,
+                seed=seed,
+            )
+            devices.create()
+
+            # The 'adb' binary fallback and the 'adb shell' sessions must use the fake 'adb':
+            old_path = os.environ.get("PATH", "")
+            os.environ.update(devices.env())
+            try:
+                with FakeAdbServer(serials=serials, shell_handler=devices.shell_handler) as server:
+                    for transport in transports:
+                        context = Context(
+                            devices=devices, transport=transport, server=server, repeat=repeat, batch_size=batch_size
+                        )
+                        for name in scenarios:
+                            info = "%s %s %i packages" % (name, transport, package_count)
+                            if progress is not None:
+                                progress("%s..." % info)
+                            devices.reset()
+                            result = run_scenario(name, context, package_count)
+                            report["results"].append(result)
+                            if progress is not None:
+                                progress("%s: %s" % (info, format_result(result)))
+            finally:
+                os.environ["PATH"] = old_path
+                os.environ.pop(FAKE_ADB_ROOT_ENV, None)
+
+    report["adb_calls"] = registry.snapshot()
+    return report
+
+
+def run_scenario(name, context, package_count):
+    # All adb calls prints information: keep the benchmark output clean
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            durations, extra = SCENARIOS[name](context)
+        except Skipped as err:
+            return {"name": name, "transport": context.transport, "packages": package_count, "skipped": str(err)}
+        except (OSError, RuntimeError, subprocess.SubprocessError) as err:
+            log.exception("Benchmark %r failed", name)
+            return {"name": name, "transport": context.transport, "packages": package_count, "error": str(err)}
+    return result_dict(name, context.transport, package_count, durations, extra)
+
+
+def format_result(result):
+    if "skipped" in result:
+        return "skipped (%s)" % result["skipped"]
+    if "error" in result:
+        return "ERROR: %s" % result["error"]
+    text = "median %.1fms (min %.1fms, max %.1fms)" % (
+        result["median"] * 1000, result["min"] * 1000, result["max"] * 1000
+    )
+    if "packages_per_sec" in result:
+        text += " %.0f packages/s" % result["packages_per_sec"]
+    return text
+
+
+def result_key(result):
+    return result["name"], result["transport"], result["packages"]
+
+
+def compare_reports(old_report, new_report):
+    """
+    Returns a list of (name, transport, packages, old median, new median, change in %)
+    for all results that are in both reports.
+
+    >>> old = {"results": [{"name": "connect", "transport": "server", "packages": 100, "median": 0.2}]}
+    >>> new = {"results": [{"name": "connect", "transport": "server", "packages": 100, "median": 0.15}]}
+    >>> compare_reports(old, new)
+    [('connect', 'server', 100, 0.2, 0.15, -25.0)]
+    """
+    old_results = {result_key(result): result for result in old_report["results"] if "median" in result}
+    rows = []
+    for result in new_report["results"]:
+        old_result = old_results.get(result_key(result))
+        if old_result is None or "median" not in result:
+            continue
+        old_median = old_result["median"]
+        new_median = result["median"]
+        change = round((new_median - old_median) / old_median * 100, 1) if old_median else None
+        rows.append(result_key(result) + (old_median, new_median, change))
+    return rows
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
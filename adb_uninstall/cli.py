@@ -0,0 +1,310 @@
+"""
+    Headless command line interface, e.g.:
+
+        $ python3 -m adb_uninstall devices
+        $ python3 -m adb_uninstall list --serial XYZ1234
+        $ python3 -m adb_uninstall list --sizes
+        $ python3 -m adb_uninstall import-trackers exodus_dump.json.gz
+        $ python3 -m adb_uninstall disable com.foo.bar com.foo.baz
+        $ python3 -m adb_uninstall apply --action disable
+        $ python3 -m adb_uninstall profile my_phone.toml --dry-run
+        $ python3 -m adb_uninstall --metrics metrics.csv apply
+        $ python3 -m adb_uninstall journal
+        $ python3 -m adb_uninstall restore --since "2020-12-31 23:59" --dry-run
+
+    All results are printed as JSON to stdout, all other output goes to stderr (with --verbose).
+    tkinter is never imported and logging is only configured with --verbose.
+    The engine is imported lazy, so e.g. '--help' starts fast.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import time
+
+from adb_uninstall import __version__
+
+# Same as in adb_uninstall.engine, that is imported lazy:
+UNINSTALL = "uninstall"
+DISABLE = "disable"
+
+
+def cmd_devices(engine, args):
+    devices = engine.devices()
+    if devices is None:
+        return {"error": "Can't list devices"}
+    return {
+        "devices": [
+            {"serial": device.serial, "state": device.state, "online": device.online, "info": device.info}
+            for device in devices
+        ]
+    }
+
+
+def package_dict(package):
+    data = {
+        "package": package.package_name,
+        "action": package.action,
+        "rule": None if package.rule is None else {"severity": package.rule.severity, "pattern": package.rule.pattern},
+    }
+    if package.info is not None:
+        data.update(package.info.to_dict())
+    if package.footprint is not None:
+        data["footprint"] = package.footprint.to_dict()
+    if package.trackers is not None:
+        data["trackers"] = list(package.trackers)
+    return data
+
+
+def _executor(args):
+    """
+    Print the batch progress to stderr with --verbose
+    """
+    if not args.verbose:
+        return None
+
+    from adb_uninstall.batch_executor import BatchExecutor
+
+    return BatchExecutor(on_progress=lambda progress: print(progress, file=sys.stderr, flush=True))
+
+
+def _fetch_packages(engine):
+    package_cache = engine.package_cache()
+    actions = {} if package_cache is None else package_cache.actions
+    return engine.fetch_packages(actions=actions)
+
+
+def cmd_list(engine, args):
+    packages = _fetch_packages(engine)
+    engine.lookup_trackers()
+    result = {"serial": engine.serial}
+    if args.sizes:
+        from adb_uninstall.engine import EngineError
+
+        # The sizes are optional: the package list is usable without them
+        try:
+            engine.fetch_footprints()
+        except EngineError as err:
+            result["reclaimable"] = None
+            result["sizes_error"] = str(err)
+        else:
+            reclaimable, unknown = packages.reclaimable_size()
+            result["reclaimable"] = {"bytes": reclaimable, "unknown_packages": unknown}
+    result["packages"] = [package_dict(package) for package in packages.name2package.values()]
+    return result
+
+
+def cmd_apply(engine, args):
+    """
+    Uninstall/disable all packages that are selected for removal:
+    via the GUI (saved in the package cache) or via 'recommended-remove' rules.
+    """
+    _fetch_packages(engine)
+    package_names = engine.selected_package_names()
+    if args.dry_run:
+        return {"serial": engine.serial, "action": args.action, "dry_run": True, "packages": package_names}
+    return engine.run_action(args.action, package_names, executor=_executor(args)).as_dict()
+
+
+def package_name_type(value):
+    """
+    argparse type: reject invalid package names before any adb call
+
+    >>> package_name_type("com.foo")
+    'com.foo'
+    >>> package_name_type("bad;name")
+    Traceback (most recent call last):
+        ...
+    argparse.ArgumentTypeError: invalid package name: 'bad;name'
+    """
+    from adb_uninstall.adb_batch import PACKAGE_NAME_RE
+
+    if not PACKAGE_NAME_RE.match(value):
+        raise argparse.ArgumentTypeError("invalid package name: %r" % value)
+    return value
+
+
+def cmd_uninstall(engine, args):
+    return engine.run_action(UNINSTALL, args.packages, executor=_executor(args)).as_dict()
+
+
+def cmd_disable(engine, args):
+    return engine.run_action(DISABLE, args.packages, executor=_executor(args)).as_dict()
+
+
+def cmd_profile(engine, args):
+    """
+    Plan the profile against the device state and run it (if not --dry-run)
+    """
+    from adb_uninstall.profiles import load_profile
+
+    plan = engine.plan_profile(load_profile(args.profile))
+    result = plan.as_dict()
+    result["serial"] = engine.serial
+    result["dry_run"] = args.dry_run
+    if not args.dry_run:
+        action_results = engine.run_plan(plan, executor=_executor(args))
+        result["results"] = [action_result.as_dict() for action_result in action_results]
+        result["success"] = all(action_result.success for action_result in action_results)
+    return result
+
+
+def cmd_journal(engine, args):
+    journal = engine.journal()
+    if journal is None:
+        return {"error": "Unknown device: no journal"}
+    return {
+        "serial": engine.serial,
+        "journal": journal.filepath,
+        "batches": [batch.as_dict() for batch in journal.batches()],
+    }
+
+
+def cmd_restore(engine, args):
+    """
+    Reverse journal batches and/or everything since a point in time (if not --dry-run)
+    """
+    from adb_uninstall.journal import parse_time
+
+    try:
+        since = None if args.since is None else parse_time(args.since)
+    except ValueError as err:
+        return {"error": str(err)}
+
+    plan = engine.plan_restore(batch_ids=args.batch, since=since)
+    result = plan.as_dict()
+    result["serial"] = engine.serial
+    result["dry_run"] = args.dry_run
+    if plan and not args.dry_run:
+        action_result = engine.restore(plan, executor=_executor(args))
+        result["result"] = action_result.as_dict()
+        result["success"] = action_result.success
+    return result
+
+
+def cmd_import_trackers(engine, args):
+    """
+    Import a Exodus Privacy dump into the offline tracker index (no device needed)
+    """
+    from adb_uninstall.tracker_db import import_dump
+
+    return {"imported": import_dump(args.dump, engine.tracker_db.path)}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="adb_uninstall", description="Deinstall bloatware apps via adb without root (headless)."
+    )
+    parser.add_argument("--version", action="version", version="%(prog)s v" + __version__)
+    parser.add_argument("-s", "--serial", help="use device with given serial (default: the only connected device)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print logging and adb output to stderr")
+    parser.add_argument("--metrics", metavar="FILE", help="export the adb call latency metrics as .json or .csv")
+    parser.set_defaults(needs_device=True)
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    subparser = subparsers.add_parser("devices", help="list all connected devices")
+    subparser.set_defaults(func=cmd_devices)
+
+    subparser = subparsers.add_parser("list", help="list all packages with state and rule")
+    subparser.add_argument(
+        "--sizes", action="store_true", help="add the storage footprint and the reclaimable bytes of the selection"
+    )
+    subparser.set_defaults(func=cmd_list)
+
+    subparser = subparsers.add_parser(
+        "apply", help="uninstall/disable all packages that are selected for removal (GUI selection and rules)"
+    )
+    subparser.add_argument("--action", choices=(UNINSTALL, DISABLE), default=DISABLE)
+    subparser.add_argument("--dry-run", action="store_true", help="only print the selected packages")
+    subparser.set_defaults(func=cmd_apply)
+
+    subparser = subparsers.add_parser(
+        "profile", help="apply a debloat profile (.json or .toml): only the needed commands are run"
+    )
+    subparser.add_argument("profile", help="path to the profile file")
+    subparser.add_argument("--dry-run", action="store_true", help="only print the plan")
+    subparser.set_defaults(func=cmd_profile)
+
+    subparser = subparsers.add_parser("journal", help="list all journaled uninstall/disable/restore batches")
+    subparser.set_defaults(func=cmd_journal)
+
+    subparser = subparsers.add_parser(
+        "restore", help="reinstall/enable the packages of journal batches and/or since a point in time"
+    )
+    subparser.add_argument(
+        "-b", "--batch", action="append", metavar="ID", help="restore this batch (see: journal), can be repeated"
+    )
+    subparser.add_argument("--since", metavar="TIME", help="restore everything since e.g.: '2020-12-31 23:59'")
+    subparser.add_argument("--dry-run", action="store_true", help="only print the restore plan")
+    subparser.set_defaults(func=cmd_restore)
+
+    subparser = subparsers.add_parser(
+        "import-trackers", help="import a Exodus Privacy tracker dump (.json or .json.gz) for offline use"
+    )
+    subparser.add_argument("dump", help="path to the dump file")
+    subparser.set_defaults(func=cmd_import_trackers, needs_device=False)
+
+    for name, func in ((UNINSTALL, cmd_uninstall), (DISABLE, cmd_disable)):
+        subparser = subparsers.add_parser(name, help="%s the given packages (locked packages are skipped)" % name)
+        subparser.add_argument("packages", nargs="+", metavar="package", type=package_name_type)
+        subparser.set_defaults(func=func)
+
+    return parser
+
+
+def main(argv=None):
+    start_time = time.monotonic()
+    args = get_parser().parse_args(argv)
+
+    if args.verbose:
+        import logging
+
+        logging.basicConfig(level=logging.DEBUG, stream=sys.stderr)
+        output = sys.stderr
+    else:
+        output = io.StringIO()
+
+    # Keep stdout clean for the JSON result: the adb calls print their progress.
+    with contextlib.redirect_stdout(output):
+        from adb_uninstall.engine import Engine, EngineError
+        from adb_uninstall.profiles import ProfileError
+        from adb_uninstall.tracker_db import TrackerDBError
+
+        engine = Engine(serial=args.serial)
+        try:
+            if not args.needs_device:
+                result = args.func(engine, args)
+            else:
+                connect_result = engine.connect()
+                if args.func is not cmd_devices and not connect_result.healthy:
+                    result = {"error": "No device connected", "connect": str(connect_result)}
+                else:
+                    result = args.func(engine, args)
+        except (EngineError, ProfileError, TrackerDBError, ValueError, OSError, subprocess.SubprocessError) as err:
+            result = {"error": str(err)}
+        finally:
+            engine.close()
+
+        if args.metrics:
+            from adb_uninstall.metrics import registry
+
+            try:
+                registry.export(args.metrics)
+            except OSError as err:
+                result["error"] = "Can't export metrics: %s" % err
+
+    result["duration"] = round(time.monotonic() - start_time, 3)
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if "error" in result or result.get("success") is False:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,31 @@ EXODUS_PRIVACY_URL = "https://reports.exodus-privacy.eu.org/en/reports/search/%s
 COLOR_LIGHT_GREEN = "#e0ffe0"
 COLOR_LIGHT_RED = "#ffe0e0"
 COLOR_GREY_RED="#644747"
+COLOR_LIGHT_YELLOW = "#ffffd0"
 OUTPUT_FILE = "packages.html"
 
+# _________________________________________________________________________________________________________
+# External package rule files, see adb_uninstall/rules.py
+# A path can be a file or a directory with *.rules files.
+RULES_PATHS = ("~/.config/adb_uninstall/rules",)
+# More paths (separated with os.pathsep) can be set via this environment variable:
+RULES_ENV_NAME = "ADB_UNINSTALL_RULES"
+
+# _________________________________________________________________________________________________________
+# Per device package cache, see adb_uninstall/package_cache.py
+PACKAGE_CACHE_PATH = "~/.cache/adb_uninstall/devices"
+
+# Per device journal of all uninstall/disable/restore batches, see adb_uninstall/journal.py
+JOURNAL_PATH = "~/.cache/adb_uninstall/journal"
+
+# Offline index of the Exodus Privacy tracker reports, see adb_uninstall/tracker_db.py
+TRACKER_DB_PATH = "~/.cache/adb_uninstall/trackers.sqlite"
+
+# Optional: Mirror the GUI console output into this rotating log file (None -> disabled)
+CONSOLE_LOG_PATH = None
+# ...or opt-in via this environment variable, e.g.: ADB_UNINSTALL_CONSOLE_LOG=~/.cache/adb_uninstall/console.log
+CONSOLE_LOG_ENV_NAME = "ADB_UNINSTALL_CONSOLE_LOG"
+
 # _________________________________________________________________________________________________________
 # These apps can't be deinstalled via PyAdbUninstall
 #
@@ -0,0 +1,337 @@
+"""
+    The headless engine: connect, list devices/packages and run the batch actions.
+
+    Used by the command line interface and by the GUI.
+    This module must never import tkinter!
+"""
+
+import functools
+import logging
+import subprocess
+import time
+
+from adb_uninstall.adb_backend import AdbBackend
+from adb_uninstall.adb_batch import (
+    PM_DISABLE_USER,
+    PM_UNINSTALL,
+    verify_disable_user,
+    verify_restore,
+    verify_uninstall,
+)
+from adb_uninstall.adb_connection import ConnectionManager
+from adb_uninstall.adb_devices import parse_devices
+from adb_uninstall.adb_footprint import fetch_footprints
+from adb_uninstall.adb_inventory import fetch_inventory
+from adb_uninstall.adb_package import Package, Packages
+from adb_uninstall.batch_executor import BatchExecutor, BatchSummary
+from adb_uninstall.constants import JOURNAL_PATH, TRACKER_DB_PATH
+from adb_uninstall.journal import Journal, new_batch_id
+from adb_uninstall.journal import writer as journal_writer
+from adb_uninstall.package_cache import PackageCache, fetch_fingerprint
+from adb_uninstall.profiles import plan_profile
+from adb_uninstall.rules import get_rules
+from adb_uninstall.tracker_db import TrackerDB
+
+log = logging.getLogger(__name__)
+
+UNINSTALL = "uninstall"
+DISABLE = "disable"
+RESTORE = "restore"
+
+# action name -> (pm command, verify function)
+ACTIONS = {
+    UNINSTALL: (PM_UNINSTALL, verify_uninstall),
+    DISABLE: (PM_DISABLE_USER, verify_disable_user),
+}
+
+
+class EngineError(Exception):
+    pass
+
+
+class ActionResult:
+    def __init__(self, *, action, results, not_done, skipped, summary=None):
+        self.action = action
+        self.results = results  # list of BatchResult instances
+        self.not_done = not_done  # set of package names or None if not verified
+        self.skipped = skipped  # dict: package name -> reason (locked or cancelled)
+        self.summary = summary  # BatchSummary instance or None if nothing was run
+
+    @property
+    def cancelled(self):
+        return self.summary is not None and self.summary.cancelled
+
+    @property
+    def success(self):
+        return all(result.success for result in self.results) and not self.not_done and not self.cancelled
+
+    def as_dict(self):
+        return {
+            "action": self.action,
+            "success": self.success,
+            "cancelled": self.cancelled,
+            "results": [
+                {
+                    "package": result.package_name,
+                    "exit_code": result.exit_code,
+                    "success": result.success,
+                    "message": result.message,
+                }
+                for result in self.results
+            ],
+            "verified": self.not_done is not None,
+            "not_done": None if self.not_done is None else sorted(self.not_done),
+            "skipped": self.skipped,
+            "summary": None if self.summary is None else self.summary.as_dict(),
+        }
+
+
+class Engine:
+    """
+    All adb calls for one device (or the only one, if serial is None).
+
+    'check_output' is called like verbose_check_output(*args, timeout=...),
+    default is the check_output() of the AdbBackend.
+    'iter_output' is the streaming version, default is the iter_output() of the AdbBackend.
+    'backend' is a AdbBackend instance, default: one for the given serial.
+    'journal_path' is the directory of the device journals, see: journal.Journal
+    'tracker_db_path' is the offline tracker index, see: tracker_db.TrackerDB
+    """
+
+    def __init__(
+        self,
+        *,
+        serial=None,
+        check_output=None,
+        iter_output=None,
+        backend=None,
+        journal_path=JOURNAL_PATH,
+        tracker_db_path=TRACKER_DB_PATH
+    ):
+        self.serial = serial
+        self.journal_path = journal_path
+        self.backend = backend or AdbBackend(serial=serial)
+        self.check_output = check_output or self.backend.check_output
+        self.iter_output = iter_output or self.backend.iter_output
+        self.packages = Packages()
+        self.tracker_db = TrackerDB(path=tracker_db_path)
+
+    def connect(self, should_stop=None):
+        """
+        Connect the adb server/device, see adb_connection.ConnectionManager
+        Returns the ConnectResult.
+        """
+        connection_manager = ConnectionManager(
+            client=self.backend.client,
+            check_output=self.check_output,
+            on_reset=self.backend.close,
+            should_stop=should_stop,
+        )
+        result = connection_manager.connect()
+        log.info("Connect steps: %s", result)
+        if result.healthy:
+            # A new connection: give a device with open circuit breaker a new chance
+            self.backend.policy.breaker(self.backend.serial).reset()
+
+        if self.serial is None:
+            online_devices = [device for device in result.devices if device.online]
+            if len(online_devices) == 1:
+                self.serial = online_devices[0].serial
+
+        return result
+
+    def devices(self):
+        """
+        Returns a list of all AdbDevice instances (or None if 'adb devices' failed)
+        """
+        output = self.check_output("adb", "devices", "-l", timeout=3)
+        if not output or "attached" not in output:
+            return None
+        return parse_devices(output)
+
+    def package_cache(self):
+        """
+        Returns the loaded PackageCache of the current device (or None if the device is unknown)
+        """
+        if self.serial is None:
+            return None
+        package_cache = PackageCache(serial=self.serial, fingerprint=fetch_fingerprint(self.check_output))
+        package_cache.load()
+        return package_cache
+
+    def fetch_packages(self, actions=None):
+        """
+        Fetch the package inventory and fill self.packages.
+        'actions' is a dict package name -> keep/remove e.g.: from the PackageCache
+        """
+        infos = fetch_inventory(self.check_output)
+        if infos is None:
+            raise EngineError("Can't fetch the package list")
+
+        actions = actions or {}
+        self.packages.clear()
+        for package_name in sorted(infos):
+            self.packages.add_index(
+                package_name=package_name, action=actions.get(package_name), info=infos[package_name]
+            )
+        return self.packages
+
+    def fetch_footprints(self):
+        """
+        Fetch the storage footprint of all installed packages and set it in self.packages:
+        one 'dumpsys diskstats' call + one 'stat' call per chunk of packages missing in the diskstats.
+        Returns the dict package name -> PackageFootprint.
+        """
+        apk_paths = {
+            package_name: info.apk_path for package_name, info in self.packages.info_map().items() if info.installed
+        }
+        footprints = fetch_footprints(self.iter_output, apk_paths)
+        if footprints is None:
+            raise EngineError("Can't fetch the package sizes")
+        self.packages.set_footprints(footprints)
+        return footprints
+
+    def lookup_trackers(self):
+        """
+        Set the trackers of all packages from the offline tracker index (no adb call, no network access)
+        Returns the dict package name -> tuple of tracker names (empty if nothing was imported)
+        """
+        trackers = self.tracker_db.lookup(self.packages.name2package)
+        self.packages.set_trackers(trackers)
+        return trackers
+
+    def journal(self):
+        """
+        Returns the Journal of the current device (or None if the device is unknown)
+        """
+        if self.serial is None:
+            return None
+        return Journal(serial=self.serial, path=self.journal_path)
+
+    def _journal_callback(self, command):
+        """
+        Returns the 'on_results' callback for BatchExecutor.run(): journal all chunks as one batch.
+        """
+        journal = self.journal()
+        if journal is None:
+            log.warning("Unknown device serial: %s is not journaled!", " ".join(command))
+            return None
+        return functools.partial(journal.append, new_batch_id(), command)
+
+    def selected_package_names(self):
+        return self.packages.package_names(Package.REMOVE)
+
+    def run_action(self, action, package_names, should_stop=None, executor=None):
+        """
+        Run the uninstall/disable batch and verify the device state.
+        Locked packages and invalid package names are never touched.
+        'executor' is a BatchExecutor instance, e.g. for progress, pause and cancel.
+        Returns a ActionResult instance.
+        """
+        try:
+            command, verify_func = ACTIONS[action]
+        except KeyError:
+            raise EngineError("Unknown action %r (must be one of: %s)" % (action, ", ".join(ACTIONS)))
+
+        rule_set = self.packages.rule_set or get_rules()
+        skipped = {}
+        selected = []
+        for package_name in package_names:
+            rule = rule_set.classify(package_name)
+            if rule is not None and rule.locked:
+                skipped[package_name] = "locked by rule: %s" % rule
+            else:
+                selected.append(package_name)
+
+        if not selected:
+            return ActionResult(action=action, results=[], not_done=set(), skipped=skipped)
+
+        executor = executor or BatchExecutor(should_stop=should_stop)
+        summary = executor.run(self.check_output, command, selected, on_results=self._journal_callback(command))
+        summary.skipped.update(skipped)
+        skipped = summary.skipped
+
+        not_done = set()
+        done = [result.package_name for result in summary.results]
+        if done:
+            try:
+                not_done = verify_func(self.check_output, done)
+            except subprocess.SubprocessError as err:
+                log.error("Can't verify %s: %s", action, err)
+                not_done = None
+
+        return ActionResult(
+            action=action, results=summary.results, not_done=not_done, skipped=skipped, summary=summary
+        )
+
+    def plan_profile(self, profile):
+        """
+        Compare the profile with the device state: Costs one inventory fetch.
+        Returns a profiles.Plan instance.
+        """
+        infos = fetch_inventory(self.check_output)
+        if infos is None:
+            raise EngineError("Can't fetch the package list")
+        return plan_profile(profile, infos, rule_set=self.packages.rule_set or get_rules())
+
+    def run_plan(self, plan, should_stop=None, executor=None):
+        """
+        Run all commands of the plan. Returns a list of ActionResult instances.
+        """
+        action_results = []
+        for action, package_names in plan.actions.items():
+            if package_names:
+                action_results.append(
+                    self.run_action(action, package_names, should_stop=should_stop, executor=executor)
+                )
+        return action_results
+
+    def plan_restore(self, batch_ids=None, since=None):
+        """
+        Reverse the given journal batches and/or everything since the given epoch time.
+        Returns a journal.RestorePlan instance.
+        """
+        journal = self.journal()
+        if journal is None:
+            raise EngineError("Unknown device: no journal")
+        try:
+            return journal.plan_restore(batch_ids=batch_ids, since=since)
+        except ValueError as err:
+            raise EngineError(err)
+
+    def restore(self, plan, should_stop=None, executor=None):
+        """
+        Run the restore plan in batches and verify all packages with one state query.
+        Returns a ActionResult instance.
+        """
+        executor = executor or BatchExecutor(should_stop=should_stop)
+        start_time = time.monotonic()
+        results = []
+        skipped = {}
+        cancelled = False
+        for command, package_names in plan.steps:
+            summary = executor.run(
+                self.check_output, command, package_names, on_results=self._journal_callback(command)
+            )
+            results += summary.results
+            skipped.update(summary.skipped)
+            cancelled = cancelled or summary.cancelled
+        summary = BatchSummary(
+            results=results, skipped=skipped, cancelled=cancelled, duration=time.monotonic() - start_time
+        )
+
+        not_done = set()
+        done = sorted(set(result.package_name for result in results))
+        if done:
+            try:
+                not_done = verify_restore(self.check_output, done)
+            except subprocess.SubprocessError as err:
+                log.error("Can't verify restore: %s", err)
+                not_done = None
+
+        return ActionResult(action=RESTORE, results=results, not_done=not_done, skipped=skipped, summary=summary)
+
+    def close(self):
+        self.backend.close()
+        self.tracker_db.close()
+        journal_writer.flush()
@@ -0,0 +1,172 @@
+"""
+    Run package list fetching and uninstall/deactivate batches
+    on many devices at once.
+
+    All devices share one adb server client, every device gets its own 'adb shell'
+    session and the 'adb' binary is called with '-s <serial>'.
+    A bounded thread pool runs the devices in parallel,
+    so the total time is near to the time of the slowest device.
+"""
+
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_uninstall.adb_backend import AdbBackend
+from adb_uninstall.adb_batch import parse_package_list, run_batch
+from adb_uninstall.adb_client import AdbClient
+from adb_uninstall.adb_shell import AdbShellSessionDied
+from adb_uninstall.journal import Journal, new_batch_id
+from adb_uninstall.utils.humanize import human_duration
+from adb_uninstall.utils.redirect import RedirectStdoutStderr
+
+log = logging.getLogger(__name__)
+
+FLEET_MAX_WORKERS = 8
+
+
+class FleetDevice:
+    IDLE = "idle"
+    RUNNING = "running"
+    DONE = "done"
+    ERROR = "error"
+
+    def __init__(self, *, device, client=None):
+        self.device = device
+        self.serial = device.serial
+        self.backend = AdbBackend(serial=device.serial, client=client)
+
+        self.package_names = set()
+        self.output = []  # captured stdout/stderr of the last task
+
+        self.state = self.IDLE
+        self.progress = ""
+        self.result = ""
+        self.duration = None
+
+    def check_output(self, *args, timeout=10):
+        """
+        Drop-in for verbose_check_output() that runs the command on this device.
+        """
+        return self.backend.check_output(*args, timeout=timeout)
+
+    def write_output(self, text):
+        self.output.append(text)
+
+    def set_progress(self, progress):
+        log.debug("%s: %s", self.serial, progress)
+        self.progress = progress
+
+    def close(self):
+        self.backend.close()
+
+    def __str__(self):
+        return "%s %s %s %s" % (self.serial, self.state, self.progress, self.result)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+class Fleet:
+    def __init__(self, *, devices, max_workers=FLEET_MAX_WORKERS, client=None):
+        self.client = client or AdbClient()
+        self.fleet_devices = [FleetDevice(device=device, client=self.client) for device in devices if device.online]
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fleet")
+        self.lock = threading.Lock()
+        self.futures = []
+
+    @property
+    def running(self):
+        return any(not future.done() for future in self.futures)
+
+    def _run(self, fleet_device, func, *args):
+        fleet_device.state = FleetDevice.RUNNING
+        fleet_device.result = ""
+        fleet_device.output = []
+        start_time = time.time()
+        try:
+            # Capture the output per device, without mixing it with the other devices:
+            with RedirectStdoutStderr(
+                stdout_write=fleet_device.write_output, stderr_write=fleet_device.write_output, tee=False
+            ):
+                fleet_device.result = func(fleet_device, *args)
+        except (subprocess.SubprocessError, AdbShellSessionDied) as err:
+            log.error("%s: %s", fleet_device.serial, err)
+            fleet_device.state = FleetDevice.ERROR
+            fleet_device.result = "ERROR: %s" % err
+        except Exception as err:
+            # e.g.: OSError if 'adb' is missing: Never leave the device in state "running"
+            log.exception("%s: %s", fleet_device.serial, err)
+            fleet_device.state = FleetDevice.ERROR
+            fleet_device.result = "ERROR: %s: %s" % (err.__class__.__name__, err)
+        else:
+            fleet_device.state = FleetDevice.DONE
+        fleet_device.duration = time.time() - start_time
+        fleet_device.set_progress("%s after %s" % (fleet_device.state, human_duration(fleet_device.duration)))
+
+    def submit(self, func, *args, serials=None):
+        """
+        Call func(fleet_device, *args) in the thread pool for all (or the given) devices.
+        """
+        with self.lock:
+            if self.running:
+                raise RuntimeError("Fleet is busy!")
+
+            self.futures = [
+                self.executor.submit(self._run, fleet_device, func, *args)
+                for fleet_device in self.fleet_devices
+                if serials is None or fleet_device.serial in serials
+            ]
+        return self.futures
+
+    def fetch_package_lists(self, serials=None):
+        return self.submit(fetch_package_list, serials=serials)
+
+    def run_batch(self, command, package_names, verify_func, serials=None):
+        return self.submit(run_device_batch, command, package_names, verify_func, serials=serials)
+
+    def all_package_names(self):
+        package_names = set()
+        for fleet_device in self.fleet_devices:
+            package_names |= fleet_device.package_names
+        return package_names
+
+    def shutdown(self):
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+        for fleet_device in self.fleet_devices:
+            fleet_device.close()
+        self.client.close()
+
+
+def fetch_package_list(fleet_device):
+    fleet_device.set_progress("fetch package list...")
+    output = fleet_device.check_output("adb", "shell", "pm", "list", "packages", timeout=10)
+    fleet_device.package_names = parse_package_list(output)
+    return "%i packages" % len(fleet_device.package_names)
+
+
+def run_device_batch(fleet_device, command, package_names, verify_func):
+    # Skip all packages that are not installed on this device:
+    package_names = sorted(set(package_names) & fleet_device.package_names)
+    if not package_names:
+        return "nothing to do"
+
+    fleet_device.set_progress("%s: %i packages..." % (" ".join(command), len(package_names)))
+    results = run_batch(fleet_device.check_output, command, package_names)
+    Journal(serial=fleet_device.serial).append(new_batch_id(), command, results)
+    for result in results:
+        log.info("%s: %s", fleet_device.serial, result)
+    error_count = len([result for result in results if not result.success])
+
+    fleet_device.set_progress("verify...")
+    failed = verify_func(fleet_device.check_output, package_names)
+    if failed is None:
+        verify_info = "not verified"
+    else:
+        verify_info = "%i not done" % len(failed)
+
+    return "%i ok, %i errors, %s" % (len(results) - error_count, error_count, verify_info)
@@ -14,22 +14,47 @@
 """
 
 import logging
-import re
+import os
 import subprocess
 import sys
+import time
 
 from adb_uninstall import __version__
-from adb_uninstall.adb_package import Package, Packages
-from adb_uninstall.constants import COLOR_GREY_RED, COLOR_LIGHT_GREEN, COLOR_LIGHT_RED
+from adb_uninstall.adb_client import AdbServerError
+from adb_uninstall.adb_footprint import fetch_footprints
+from adb_uninstall.adb_inventory import InventoryParser, PackageInfo, build_inventory_script, diff_inventory
+from adb_uninstall.adb_package import Package
+from adb_uninstall.adb_policy import CircuitOpenError
+from adb_uninstall.adb_shell import AdbShellSessionDied
+from adb_uninstall.batch_executor import BatchExecutor
+from adb_uninstall.constants import (
+    COLOR_GREY_RED,
+    COLOR_LIGHT_GREEN,
+    COLOR_LIGHT_RED,
+    COLOR_LIGHT_YELLOW,
+    CONSOLE_LOG_ENV_NAME,
+    CONSOLE_LOG_PATH,
+)
+from adb_uninstall.engine import ACTIONS, DISABLE, UNINSTALL, Engine, EngineError
+from adb_uninstall.fleet import Fleet
+from adb_uninstall.metrics import registry as metrics_registry
+from adb_uninstall.package_cache import PackageCache, fetch_fingerprint
+from adb_uninstall.package_index import PackageIndex, QueryError
+from adb_uninstall.profiles import Profile, ProfileError, load_profile, save_profile
 from adb_uninstall.tk_automenu import automenu
+from adb_uninstall.tk_console import TkConsole
+from adb_uninstall.tk_namespace_view import NamespaceView
+from adb_uninstall.tk_progress import BatchProgressBar
 from adb_uninstall.tk_statusbar import MultiStatusBar
+from adb_uninstall.tk_task_runner import TaskRunner
+from adb_uninstall.tk_virtual_treeview import VirtualTreeview
+from adb_uninstall.tracker_db import import_dump
+from adb_uninstall.utils.humanize import human_filesize
 from adb_uninstall.utils.redirect import RedirectStdoutStderr
-from adb_uninstall.utils.subprocess2 import verbose_check_output
 
 try:
     import tkinter as tk
-    from tkinter import messagebox, ttk
-    from tkinter.scrolledtext import ScrolledText
+    from tkinter import filedialog, messagebox, ttk
 except ImportError as err:
     print("\nERROR can't import Tkinter: %s\n" % err)
     print("Hint: 'apt install python3-tk'\n")
@@ -38,126 +63,290 @@ except ImportError as err:
 
 log = logging.getLogger(__name__)
 
-STATUSBAR_INFO_KEY = "info"
-STATUSBAR_DEVICE_KEY = "device"
-
-
-class ScrollableTreeview(ttk.Frame):
-    def __init__(self, *, parent, columns, call_back, **kwargs):
-        self.parent = parent
-        self.call_back = call_back
-        super().__init__(parent, **kwargs)
+# Insert fetched packages in chunks of this size, or at least after this time (in sec.):
+FETCH_CHUNK_SIZE = 200
+FETCH_CHUNK_INTERVAL = 0.05
 
-        self.row_count = 0
+# Save the package cache after the last selection change (in ms):
+CACHE_SAVE_DELAY = 1000
 
-        self.tree = ttk.Treeview(self, columns=columns)
-        self.tree.bind("<ButtonRelease-1>", self._call_back)
+# Index of the "Size" and "Trackers" column in PackageTable.get_values()
+SIZE_COLUMN = 4
+TRACKERS_COLUMN = 5
 
-        for no, column in enumerate(columns):
-            self.tree.column("#%i" % no, stretch=True, anchor=tk.CENTER)
-            self.tree.heading("#%i" % no, text=column)
+# Default of "min. trackers" in the PackageTable filter bar:
+DEFAULT_MIN_TRACKERS = 3
 
-        self.scrollbar_x = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.scrollbar_y = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+# Row tag for packages with a 'warn' rule:
+WARN_TAG = "warn"
 
-        self.tree.configure(
-            xscrollcommand=self.scrollbar_x.set,
-            yscrollcommand=self.scrollbar_y.set)
-
-        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
-        self.scrollbar_x.grid(row=1, column=0, sticky=tk.EW)
-        self.scrollbar_y.grid(row=0, column=1, sticky=tk.NS)
-
-        self.columnconfigure(0, weight=1)
-        self.rowconfigure(0, weight=1)
-
-        self.tree.columnconfigure(0, weight=1)
-        self.tree.rowconfigure(0, weight=1)
-
-    def row2tagname(self, row):
-        return "row_%i" % row
-
-    def row2index(self, row):
-        return ""
-
-    def add(self, *, values):
-        # print("add:", values)
-        self.tree.insert("", tk.END, tag=self.row2tagname(
-            self.row_count), text=values[0], values=values[1:])
-        self.row_count += 1
-        return self.row_count - 1
-
-    def _call_back(self, event):
-        item = self.tree.focus()
-        self.tree.selection_remove(item)
-        row = self.tree.index(item)
-        column = self.tree.identify_column(event.x)
-        self.call_back(item, row, column)
-
-    def set_row_background_color(self, row, color):
-        tagname = self.row2tagname(row)
-        self.tree.tag_configure(tagname, background=color, foreground="#000000")
+STATUSBAR_INFO_KEY = "info"
+STATUSBAR_DEVICE_KEY = "device"
+STATUSBAR_METRICS_KEY = "metrics"
+STATUSBAR_RECLAIMABLE_KEY = "reclaimable"
 
-    def set_text(self, *, item, column, text):
-        self.tree.set(item, column, text)
+# Update the adb call metrics in the status bar (in ms):
+METRICS_UPDATE_INTERVAL = 1000
 
 
 class PackageTable(ttk.Frame):
-    def __init__(self, parent, adb_packages, output_callback, actions):
+    """
+    Shows the packages in a VirtualTreeview: Only the visible rows are Treeview items.
+    Every row is a Package instance and the row color is a shared tag per action.
+    The filter box uses a PackageIndex, that is build once per package list.
+    'on_action_change' is called with the list of changed packages.
+    """
+
+    def __init__(self, parent, adb_packages, output_callback, actions, on_action_change=None):
         self.parent = parent
         self.adb_packages = adb_packages
         self.output_callback = output_callback
+        self.on_action_change = on_action_change
+        self.cached_actions = {}  # package name -> keep/remove from the PackageCache
+        self.index = None  # PackageIndex or None if the packages changed
+        self.tree_tags = {
+            Package.KEEP: {"background": COLOR_LIGHT_GREEN, "foreground": "#000000"},
+            Package.REMOVE: {"background": COLOR_LIGHT_RED, "foreground": "#000000"},
+            Package.LOCKED: {"background": COLOR_GREY_RED, "foreground": "#000000"},
+            WARN_TAG: {"background": COLOR_LIGHT_YELLOW, "foreground": "#000000"},
+        }
 
         super().__init__(parent)
 
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
 
-        self.tree = ScrollableTreeview(
+        self.tree = VirtualTreeview(
             parent=parent,
             columns=(
                 "Package",
                 "Visit Google Play",
                 "Visit Exodus Privacy",
-                "Action"),
-            call_back=self.call_back
+                "Action",
+                "Size",
+                "Trackers",
+                "Type",
+                "State",
+                "Installer",
+                "UID",
+                "APK path"),
+            get_values=self.get_values,
+            get_sort_values=self.get_sort_values,
+            get_tag=self.get_tag,
+            call_back=self.call_back,
+            tags=self.tree_tags,
         )
         self.tree.grid(row=0, column=0, sticky=tk.NSEW)
         self.tree.columnconfigure(0, weight=1)
         self.tree.rowconfigure(0, weight=1)
 
+        self.filter_frame = tk.Frame(parent)
+        self.filter_frame.grid(row=1, column=0, sticky=tk.EW)
+        self.filter_frame.columnconfigure(1, weight=1)
+
+        tk.Label(self.filter_frame, text="Filter (text, glob or re:regex):").grid(row=0, column=0, padx=5)
+        self.filter_entry = tk.Entry(self.filter_frame)
+        self.filter_entry.grid(row=0, column=1, sticky=tk.EW)
+        self.filter_entry.bind("<KeyRelease>", self.apply_filter)
+        self.filter_entry.bind("<Escape>", self.clear_filter)
+        self.filter_info = tk.Label(self.filter_frame, width=30, anchor=tk.W)
+        self.filter_info.grid(row=0, column=2, padx=5)
+        filter_actions = (("select matching as remove", Package.REMOVE), ("select matching as keep", Package.KEEP))
+        for no, (text, action) in enumerate(filter_actions, 3):
+            button = tk.Button(
+                self.filter_frame, text=text, command=lambda action=action: self.set_shown_action(action)
+            )
+            button.grid(row=0, column=no, padx=5)
+
+        tk.Label(self.filter_frame, text="min. trackers:").grid(row=0, column=5, padx=5)
+        self.min_trackers = tk.Spinbox(self.filter_frame, from_=1, to=99, width=3)
+        self.min_trackers.delete(0, tk.END)
+        self.min_trackers.insert(0, DEFAULT_MIN_TRACKERS)
+        self.min_trackers.grid(row=0, column=6)
+        button = tk.Button(self.filter_frame, text="select as remove", command=self.select_by_trackers)
+        button.grid(row=0, column=7, padx=5)
+
         self.button_frame = tk.Frame(parent)
-        self.button_frame.grid(row=1, column=0, sticky=tk.EW)
+        self.button_frame.grid(row=2, column=0, sticky=tk.EW)
 
-        self.buttons = []
+        self.buttons = {}
         for no, (text, command) in enumerate(actions.items()):
             button = tk.Button(self.button_frame, text=text, command=command)
             button.grid(row=0, column=no, padx=10)
-            self.buttons.append(button)
+            self.buttons[text] = button
 
-    def add(self, package_name):
-        package = self.adb_packages.add(package_name=package_name)
+    ###########################################################################
+    # filter
+
+    def rebuild_index(self):
+        self.index = PackageIndex(self.adb_packages.name2package)
 
-        if package.locked:
-            info = Package.LOCKED
-            color = COLOR_GREY_RED
+    def apply_filter(self, event=None):
+        query = self.filter_entry.get()
+        if not query.strip():
+            self.tree.filter_rows(None)
+            self.filter_info.config(text="")
+            return
+
+        if self.index is None:
+            self.rebuild_index()
+        try:
+            package_names = self.index.search(query)
+        except QueryError as err:
+            self.filter_info.config(text=str(err))
+            return
+
+        if len(package_names) == len(self.index):
+            self.tree.filter_rows(None)  # Cheaper than a filter that matches all
         else:
-            info = Package.KEEP
-            color = COLOR_LIGHT_GREEN
+            name2package = self.adb_packages.name2package
+            self.tree.filter_rows([name2package[package_name] for package_name in package_names])
+        self.filter_info.config(text="%i of %i packages" % (len(package_names), len(self.index)))
 
-        row = self.tree.add(
-            values=(package_name, "open play.google.com", "open exodus-privacy.eu.org", info))
-        assert isinstance(row, int)
+    def clear_filter(self, event=None):
+        self.filter_entry.delete(0, tk.END)
+        self.apply_filter()
 
-        self.tree.set_row_background_color(row=row, color=color)
+    def set_shown_action(self, action):
+        """
+        Set keep/remove for all shown (matching) packages at once.
+        """
+        changed = self.adb_packages.set_action(self.tree.rows, action)
+        if not changed:
+            return
+        self.output_callback("%i packages set to %r" % (len(changed), action))
+        self.tree.refresh()
+        if self.on_action_change is not None:
+            self.on_action_change(changed)
+
+    def select_by_trackers(self):
+        """
+        Select all packages with at least "min. trackers" known trackers as remove (locked packages are skipped).
+        """
+        try:
+            min_count = int(self.min_trackers.get())
+        except ValueError:
+            self.output_callback("Invalid number of trackers: %r" % self.min_trackers.get())
+            return
+        changed = self.adb_packages.set_action_by_index(self.adb_packages.tracker_indexes(min_count), Package.REMOVE)
+        self.output_callback(
+            "%i packages with %i or more trackers set to %r" % (len(changed), min_count, Package.REMOVE)
+        )
+        if not changed:
+            return
+        self.tree.refresh()
+        if self.on_action_change is not None:
+            self.on_action_change([self.adb_packages.get_by_index(index=index) for index in changed])
+
+    ###########################################################################
+
+    def get_values(self, package):
+        footprint = package.footprint
+        size = "" if footprint is None else human_filesize(footprint.total)
+        trackers = package.trackers
+        if trackers is None:
+            trackers = ""  # Unknown: not in the tracker index
+        elif trackers:
+            trackers = "%i: %s" % (len(trackers), ", ".join(trackers))
+        else:
+            trackers = "0"
+        values = (
+            package.package_name, "open play.google.com", "open exodus-privacy.eu.org", package.action, size, trackers
+        )
+        info = package.info
+        if info is None:
+            return values + ("", "", "", None, "")
+        return values + (
+            info.package_type or "", info.state or "", info.installer or "", info.uid, info.apk_path or ""
+        )
+
+    def get_sort_values(self, package):
+        # Sort the "Size" column by bytes and "Trackers" by the count, not by the formatted text:
+        values = self.get_values(package)
+        footprint = package.footprint
+        trackers = package.trackers
+        return (
+            values[:SIZE_COLUMN]
+            + (None if footprint is None else footprint.total, None if trackers is None else len(trackers))
+            + values[TRACKERS_COLUMN + 1:]
+        )
+
+    def get_tag(self, package):
+        if package.keep and package.warn:
+            return WARN_TAG
+        return package.action
+
+    def add(self, package_name):
+        self.add_many([package_name])
+
+    def add_many(self, package_names):
+        self.index = None
+        packages = [self.adb_packages.add(package_name=package_name) for package_name in package_names]
+        self.tree.append_rows(packages)
+
+    def add_infos(self, infos):
+        self.index = None
+        packages = [
+            self.adb_packages.add(
+                package_name=info.package_name, info=info, action=self.cached_actions.get(info.package_name)
+            )
+            for info in infos
+        ]
+        self.tree.append_rows(packages)
+
+    def load_cache(self, infos, actions):
+        self.cached_actions = actions
+        self.clear()
+        self.add_infos(infos.values())
+        self.sort_by_name()
+        self.apply_filter()
+
+    def update_infos(self, infos):
+        """
+        Apply a new inventory: Only the added, removed and changed rows are touched.
+        Returns the added, removed and changed package names.
+        """
+        name2package = self.adb_packages.name2package
+        old_infos = {
+            package_name: package.info or PackageInfo(package_name=package_name)
+            for package_name, package in name2package.items()
+        }
+        added, removed, changed = diff_inventory(old_infos, infos)
+
+        if removed:
+            self.index = None
+            self.tree.remove_rows([self.adb_packages.remove(package_name) for package_name in removed])
+        for package_name in changed:
+            name2package[package_name].info = infos[package_name]
+        if added:
+            self.add_infos([infos[package_name] for package_name in added])
+
+        if added or removed:
+            self.sort_by_name()
+        elif changed:
+            self.tree.refresh()
+
+        # The package list is complete: build the search index once
+        if self.index is None:
+            self.rebuild_index()
+        self.apply_filter()
+
+        return added, removed, changed
 
-    def call_back(self, item, row, column):
-        log.debug("Clicked: %r %r %r", item, row, column)
+    def set_footprints(self, footprints):
+        self.adb_packages.set_footprints(footprints)
+        self.tree.refresh()
 
-        # FIXME: how to ignore click on table headline items?!?
+    def sort_by_name(self):
+        self.tree.sort(key=lambda package: package.package_name)
 
-        package = self.adb_packages.get_by_index(index=row)
-        log.debug("Clicked on package: %r", package)
+    def clear(self):
+        self.index = None
+        self.adb_packages.clear()
+        self.tree.clear()
+
+    def call_back(self, package, column):
+        log.debug("Clicked on package: %r column: %r", package, column)
 
         if column == "#1":
             package.open_play_google()
@@ -170,14 +359,252 @@ class PackageTable(ttk.Frame):
 
             if package.keep:
                 package.set_remove()
-                self.tree.set_row_background_color(row, color=COLOR_LIGHT_RED)
             elif package.remove:
                 package.set_keep()
-                self.tree.set_row_background_color(row, color=COLOR_LIGHT_GREEN)
             else:
                 raise RuntimeError("?!?")
 
-            self.tree.set_text(item=item, column="#3", text=package.action)
+            self.tree.refresh_row(package)
+            if self.on_action_change is not None:
+                self.on_action_change([package])
+
+
+class FleetWindow(tk.Toplevel):
+    """
+    Fetch package lists and run uninstall/deactivate batches on all selected devices at once.
+    """
+
+    POLL_INTERVAL = 200  # ms
+
+    def __init__(self, *, app, devices):
+        super().__init__(app)
+        self.app = app
+        self.title("Fleet mode - %i devices" % len(devices))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.fleet = Fleet(devices=devices)
+        self.on_done = None
+        self.poll_after_id = None
+
+        self.tree = ttk.Treeview(self, columns=("Model", "State", "Progress", "Result"))
+        self.tree.heading("#0", text="Serial")
+        for column in ("Model", "State", "Progress", "Result"):
+            self.tree.heading(column, text=column)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+
+        for fleet_device in self.fleet.fleet_devices:
+            self.tree.insert(
+                "", tk.END, iid=fleet_device.serial, text=fleet_device.serial,
+                values=(fleet_device.device.model, fleet_device.state, "", "")
+            )
+        self.tree.selection_set(self.tree.get_children())
+        self.tree.bind("<Double-1>", self.show_device_output)
+
+        self.button_frame = tk.Frame(self)
+        self.button_frame.grid(row=1, column=0, sticky=tk.EW)
+        self.buttons = []
+        actions = {
+            "fetch package lists": self.fetch_package_lists,
+            "uninstall apps": self.uninstall_apps,
+            "deactivate apps": self.deactivate_apps,
+            "close": self.destroy,
+        }
+        for no, (text, command) in enumerate(actions.items()):
+            button = tk.Button(self.button_frame, text=text, command=command)
+            button.grid(row=0, column=no, padx=10)
+            self.buttons.append(button)
+
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+        self.poll()
+
+    def selected_serials(self):
+        return set(self.tree.selection())
+
+    def show_device_output(self, event):
+        serial = self.tree.identify_row(event.y)
+        for fleet_device in self.fleet.fleet_devices:
+            if fleet_device.serial == serial:
+                self.app.output_callback("_" * 80)
+                self.app.output_callback("Output of %s:" % serial)
+                self.app.output_callback("".join(fleet_device.output))
+
+    def _submit(self, func, *args, on_done=None):
+        if self.fleet.running:
+            messagebox.showerror(title="Busy", message="Please wait for the running job!", parent=self)
+            return
+
+        serials = self.selected_serials()
+        if not serials:
+            messagebox.showinfo(title="Info", message="No devices selected !", parent=self)
+            return
+
+        self.on_done = on_done
+        func(*args, serials=serials)
+
+    def fetch_package_lists(self):
+        self._submit(self.fleet.fetch_package_lists, on_done=self.fetch_done)
+
+    def fetch_done(self):
+        package_names = self.fleet.all_package_names()
+        self.app.output_callback("Fleet: %i different packages on all devices." % len(package_names))
+        self.app.set_package_names(package_names)
+
+    def _action(self, action):
+        package_names = self.app.selected_package_names()
+        if not package_names:
+            messagebox.showinfo(title="Info", message="No packages selected !", parent=self)
+            return
+        command, verify_func = ACTIONS[action]
+        self._submit(self.fleet.run_batch, command, package_names, verify_func)
+
+    def uninstall_apps(self):
+        self._action(UNINSTALL)
+
+    def deactivate_apps(self):
+        self._action(DISABLE)
+
+    def poll(self):
+        for fleet_device in self.fleet.fleet_devices:
+            self.tree.item(
+                fleet_device.serial,
+                values=(fleet_device.device.model, fleet_device.state, fleet_device.progress, fleet_device.result)
+            )
+
+        if self.on_done is not None and not self.fleet.running:
+            on_done, self.on_done = self.on_done, None
+            on_done()
+
+        self.poll_after_id = self.after(self.POLL_INTERVAL, self.poll)
+
+    def destroy(self, *args):
+        if self.poll_after_id is not None:
+            self.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        self.fleet.shutdown()
+        super().destroy()
+
+
+class RestoreWindow(tk.Toplevel):
+    """
+    List the journal batches of the current device and restore the selected ones
+    or everything since the selected batch.
+    """
+
+    def __init__(self, *, app, journal):
+        super().__init__(app)
+        self.app = app
+        self.journal = journal
+        self.title("Restore - %s" % journal.serial)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.batches = {batch.batch_id: batch for batch in journal.batches()}
+
+        self.tree = ttk.Treeview(self, columns=("Command", "Packages", "Failed"))
+        self.tree.heading("#0", text="Time")
+        for column in ("Command", "Packages", "Failed"):
+            self.tree.heading(column, text=column)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+
+        # Newest batch first:
+        for batch in reversed(list(self.batches.values())):
+            data = batch.as_dict()
+            self.tree.insert(
+                "", tk.END, iid=batch.batch_id, text=data["time"],
+                values=(batch.command, len(batch.succeeded), data["failed"])
+            )
+
+        self.button_frame = tk.Frame(self)
+        self.button_frame.grid(row=1, column=0, sticky=tk.EW)
+        actions = {
+            "restore selected batches": self.restore_batches,
+            "restore everything since selected batch": self.restore_since,
+            "close": self.destroy,
+        }
+        for no, (text, command) in enumerate(actions.items()):
+            button = tk.Button(self.button_frame, text=text, command=command)
+            button.grid(row=0, column=no, padx=10)
+
+    def _restore(self, **kwargs):
+        try:
+            plan = self.app.engine.plan_restore(**kwargs)
+        except EngineError as err:
+            messagebox.showerror(title="Error", message=str(err), parent=self)
+            return
+        if not plan:
+            messagebox.showinfo(title="Restore", message="Nothing to restore.", parent=self)
+            return
+
+        run = messagebox.askyesno(
+            title="Restore?",
+            message="%s\n\nRun these %i commands?" % (plan, plan.command_count),
+            parent=self,
+        )
+        if run:
+            self.app.run_task(self.app._run_restore, plan)
+            self.destroy()
+
+    def restore_batches(self):
+        batch_ids = self.tree.selection()
+        if not batch_ids:
+            messagebox.showinfo(title="Info", message="No batches selected !", parent=self)
+            return
+        self._restore(batch_ids=batch_ids)
+
+    def restore_since(self):
+        batch_ids = self.tree.selection()
+        if not batch_ids:
+            messagebox.showinfo(title="Info", message="No batch selected !", parent=self)
+            return
+        self._restore(since=min(self.batches[batch_id].time for batch_id in batch_ids))
+
+
+class NamespaceWindow(tk.Toplevel):
+    """
+    The packages as a tree of their dotted names, e.g. to review them by vendor.
+    """
+
+    def __init__(self, *, app):
+        super().__init__(app)
+        self.app = app
+        self.title("Namespace view")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.view = NamespaceView(
+            self, app.packages, on_action_change=self.action_changed, tags=app.package_table.tree_tags
+        )
+        self.view.grid(row=0, column=0, sticky=tk.NSEW)
+        self.view.rebuild()
+
+        self.button_frame = tk.Frame(self)
+        self.button_frame.grid(row=1, column=0, sticky=tk.EW)
+        actions = {
+            "remove subtree": lambda: self.set_subtree_action(Package.REMOVE),
+            "keep subtree": lambda: self.set_subtree_action(Package.KEEP),
+            "close": self.destroy,
+        }
+        for no, (text, command) in enumerate(actions.items()):
+            button = tk.Button(self.button_frame, text=text, command=command)
+            button.grid(row=0, column=no, padx=10)
+
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+    def set_subtree_action(self, action):
+        changed = self.view.set_subtree_action(action)
+        if changed is None:
+            messagebox.showinfo(title="Info", message="No namespace selected !", parent=self)
+        elif changed:
+            self.app.output_callback("%i packages set to %r" % (len(changed), action))
+
+    def action_changed(self, packages):
+        self.app.package_table.tree.refresh()
+        self.app.package_action_changed(packages)
+
+    def destroy(self, *args):
+        self.app.namespace_window = None
+        super().destroy()
 
 
 class AdbUninstaller(tk.Tk):
@@ -197,16 +624,33 @@ class AdbUninstaller(tk.Tk):
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
 
-        self.packages = Packages()
+        # The GUI is only a layer over the headless engine.
+        # All adb commands are send via self.subprocess(), so the output is shown in the GUI:
+        self.engine = Engine(check_output=self.subprocess)
+        self.packages = self.engine.packages
+
+        # Send commands directly to the adb server or via one long-lived 'adb shell' process:
+        self.backend = self.engine.backend
+
+        self.devices = []
+        self.package_cache = None
+        self.namespace_window = None
+        self.cache_save_after_id = None
+
+        # All adb commands run in a worker thread, so the GUI is never blocked:
+        self.task_runner = TaskRunner(self, on_busy_change=self.busy_changed)
 
         menudata = (
             [
                 "_File",
                 (
                     # ("_New", "Control-n", self.new),
-                    # ("_Open...", "Control-o", self.open),
-                    # ("_Save", "Control-s", self.dummy),
-                    # (),  # Add a separator here
+                    ("_Open profile...", "Control-o", self.open_profile),
+                    ("_Save selection as profile...", "Control-s", self.save_profile),
+                    ("_Restore from journal...", "", self.open_restore),
+                    ("_Import tracker database...", "", self.import_trackers),
+                    ("_Export adb metrics...", "", self.export_metrics),
+                    (),  # Add a separator here
                     ("_Exit", "Alt-F4", self.destroy),
                 ),
             ],
@@ -240,27 +684,40 @@ class AdbUninstaller(tk.Tk):
         p.add(self.list_frame)
 
         actions = {
-            "list devices": self.list_devices,
+            "list devices": self.start_list_devices,
+            "fleet mode": self.open_fleet,
+            "namespace view": self.open_namespace_view,
             # "fetch package": self.fetch_package_list,
             # "save selection": self.destroy,
             "uninstall apps": self.uninstall_apps,
             "deactivate apps": self.deactivate_apps,
+            "cancel": self.cancel_tasks,
             "Exit": self.destroy,
         }
 
         self.package_table = PackageTable(
-            self.list_frame, self.packages, output_callback=self.output_callback, actions=actions
+            self.list_frame,
+            self.packages,
+            output_callback=self.output_callback,
+            actions=actions,
+            on_action_change=self.package_action_changed,
         )
         self.package_table.grid(row=0, column=0, sticky=tk.NSEW)
         self.package_table.columnconfigure(0, weight=1)
         self.package_table.rowconfigure(0, weight=1)
 
+        # TaskRunner calls busy_changed() only on a change: apply the initial state ("cancel" disabled)
+        self.busy_changed(False)
+
         self.status_frame = ttk.Labelframe(p, text="Status", height=50)
         self.status_frame.columnconfigure(0, weight=1)
         self.status_frame.rowconfigure(0, weight=1)
         p.add(self.status_frame)
 
-        self.info_text = ScrolledText(self.status_frame, height=10)
+        # Buffered output: flushed once per frame, capped number of lines.
+        # Mirrored into a rotating log file only on request:
+        log_filepath = os.environ.get(CONSOLE_LOG_ENV_NAME) or CONSOLE_LOG_PATH
+        self.info_text = TkConsole(self.status_frame, height=10, log_filepath=log_filepath)
         self.info_text.grid(row=0, column=0, sticky=tk.NSEW)
         self.info_text.columnconfigure(0, weight=1)
         self.info_text.rowconfigure(0, weight=1)
@@ -275,10 +732,15 @@ class AdbUninstaller(tk.Tk):
         self.create_status_bar(row=1)
         self.set_status_bar_info("loading...")
 
+        # Only visible while a uninstall/disable batch is running:
+        self.progress_bar = BatchProgressBar(self)
+        self.progress_bar.grid(row=2, column=0, sticky=tk.EW)
+        self.progress_bar.grid_remove()
+
         ####################################################################################
 
         # reconnect on startup:
-        self.after(1, self.reconnect)
+        self.run_task(self.reconnect)
         self.mainloop()
 
     ###########################################################################
@@ -291,21 +753,53 @@ class AdbUninstaller(tk.Tk):
             # by the resize widget.
             self.status_bar.set_label("_padding1", "    ", side=tk.RIGHT)
         self.status_bar.grid(row=row, column=0, sticky=tk.EW)
+        self.update_metrics_bar()
 
     def set_status_bar_info(self, text):
-        self.status_bar.set_label(STATUSBAR_INFO_KEY, text)
-        self.update_idletasks()
+        self.task_runner.call_in_main(self.status_bar.set_label, STATUSBAR_INFO_KEY, text)
 
     def set_device_bar_info(self, text):
-        self.status_bar.set_label(STATUSBAR_DEVICE_KEY, text)
-        self.update_idletasks()
+        self.task_runner.call_in_main(self.status_bar.set_label, STATUSBAR_DEVICE_KEY, text)
+
+    def update_reclaimable_bar(self):
+        """
+        The storage that the uninstall of the current selection frees: O(selected packages)
+        """
+        size, unknown = self.packages.reclaimable_size()
+        text = "reclaimable: %s" % human_filesize(size)
+        if unknown:
+            text += " (+%i unknown)" % unknown
+        self.status_bar.set_label(STATUSBAR_RECLAIMABLE_KEY, text)
+
+    def update_metrics_bar(self):
+        self.status_bar.set_label(STATUSBAR_METRICS_KEY, metrics_registry.summary(), side=tk.RIGHT)
+        self.metrics_after_id = self.after(METRICS_UPDATE_INTERVAL, self.update_metrics_bar)
+
+    ###########################################################################
+    # Background tasks
+
+    def run_task(self, func, *args, on_done=None):
+        return self.task_runner.submit(func, *args, on_done=on_done, on_error=self.task_error)
+
+    def task_error(self, err):
+        self.output_callback("ERROR: %s" % err)
+        self.set_status_bar_info("ERROR: %s" % err)
+
+    def cancel_tasks(self):
+        self.output_callback("Cancel all tasks...")
+        self.task_runner.cancel_all()
+
+    def busy_changed(self, busy):
+        for text, button in self.package_table.buttons.items():
+            if text == "cancel":
+                button.config(state=tk.NORMAL if busy else tk.DISABLED)
+            elif text != "Exit":
+                button.config(state=tk.DISABLED if busy else tk.NORMAL)
 
     ###########################################################################
 
     def output_callback(self, text, end="\n"):
-        self.info_text.insert(tk.END, "%s%s" % (text, end))
-        self.info_text.see(tk.END)
-        self.update_idletasks()
+        self.info_text.write("%s%s" % (text, end))
 
     def stdout_redirect_handler(self, *args):
         # log.debug("redirect: %r", args)
@@ -322,8 +816,8 @@ class AdbUninstaller(tk.Tk):
                 stdout_write=self.stdout_redirect_handler,
                 stderr_write=self.stdout_redirect_handler, tee=True
             ):
-                output = verbose_check_output(*args, timeout=timeout)
-        except subprocess.CalledProcessError as err:
+                output = self.backend.check_output(*args, timeout=timeout)
+        except (subprocess.CalledProcessError, AdbShellSessionDied, AdbServerError, CircuitOpenError) as err:
             print("ERROR: %s" % err)
             self.set_status_bar_info("%s - ERROR" % info)
         else:
@@ -334,104 +828,308 @@ class AdbUninstaller(tk.Tk):
 
         return output
 
-    def _uninstall(self, package_name):
-        self.output_callback("_" * 80)
-        self.output_callback("Uninstall app: %r" % package_name)
-        self.subprocess("adb", "shell", "pm", "uninstall", "--user", "0", package_name, timeout=3)
+    def iter_subprocess(self, *args, timeout=10):
+        """
+        Streaming version of subprocess(): Yields the output lines as soon as they arrive.
+        """
+        info = " ".join(args)
+        self.set_status_bar_info("%s..." % info)
+
+        try:
+            with RedirectStdoutStderr(
+                stdout_write=self.stdout_redirect_handler,
+                stderr_write=self.stdout_redirect_handler, tee=True
+            ):
+                yield from self.backend.iter_output(*args, timeout=timeout)
+        except (subprocess.CalledProcessError, AdbShellSessionDied, AdbServerError, CircuitOpenError) as err:
+            print("ERROR: %s" % err)
+            self.set_status_bar_info("%s - ERROR" % info)
+        else:
+            self.set_status_bar_info("%s - done" % info)
+
+    def selected_package_names(self):
+        return self.engine.selected_package_names()
 
-    def _disable_user(self, package_name):
+    def _action(self, *, title, action):
+        package_names = self.selected_package_names()
+        if not package_names:
+            messagebox.showinfo(title="Info", message="No packages selected !")
+            return
+
+        self.run_task(self._run_action, title, action, package_names)
+
+    def batch_executor(self, title):
+        """
+        Returns a BatchExecutor that is shown in the progress bar, see: finish_batch()
+        """
+
+        def on_progress(progress):
+            self.task_runner.call_in_main(self.progress_bar.update_progress, progress)
+            self.set_status_bar_info("%s: %s" % (title, progress))
+
+        executor = BatchExecutor(on_progress=on_progress, should_stop=self.task_runner.is_cancelled)
+        self.task_runner.call_in_main(self.progress_bar.start, executor, title)
+        return executor
+
+    def finish_batch(self):
+        self.task_runner.call_in_main(self.progress_bar.finish)
+
+    def _run_action(self, title, action, package_names):
         self.output_callback("_" * 80)
-        self.output_callback("Disable app: %r" % package_name)
-        self.subprocess("adb", "shell", "pm", "disable-user", package_name, timeout=3)
+        self.output_callback("%s %i apps..." % (title, len(package_names)))
 
-    def _action(self, action_func):
-        packages = self.packages.index2package.values()
+        executor = self.batch_executor(title)
+        try:
+            action_result = self.engine.run_action(action, package_names, executor=executor)
+        finally:
+            self.finish_batch()
+
+        for package_name, reason in sorted(action_result.skipped.items()):
+            self.output_callback("%s app: %r - skipped: %s" % (title, package_name, reason))
+        for result in action_result.results:
+            if result.success:
+                self.output_callback("%s app: %r - OK: %s" % (title, result.package_name, result.message))
+            else:
+                self.output_callback(
+                    "%s app: %r - ERROR (exit code %r): %s"
+                    % (title, result.package_name, result.exit_code, result.message)
+                )
 
-        removed_packages = []
-        for package in packages:
-            if package.remove:
-                removed_packages.append(package)
-                action_func(package_name=package.package_name)
+        self.output_callback("_" * 80)
+        failed = action_result.not_done
+        if failed is None:
+            self.output_callback("Can't verify the device state!")
+        elif failed:
+            self.output_callback("%i of %i apps not done:" % (len(failed), len(action_result.results)))
+            for package_name in sorted(failed):
+                self.output_callback("\t%s" % package_name)
+        elif action_result.cancelled:
+            self.output_callback(
+                "Cancelled: %i apps done, %i apps skipped." % (len(action_result.results), len(action_result.skipped))
+            )
+        else:
+            self.output_callback("All %i apps done, ok." % len(action_result.results))
 
-        if not removed_packages:
-            messagebox.showinfo(title="Info", message="No packages selected !")
+        if action_result.summary is not None:
+            self.output_callback("%s: %s" % (title, action_result.summary))
+            self.set_status_bar_info("%s: %s" % (title, action_result.summary))
 
     def uninstall_apps(self):
-        self._action(action_func=self._uninstall)
+        self._action(title="Uninstall", action=UNINSTALL)
 
     def deactivate_apps(self):
-        self._action(action_func=self._disable_user)
+        self._action(title="Disable", action=DISABLE)
 
     def reconnect(self):
         """
-        Kill adb server and reconnect device
+        Connect the device: Reuse the running adb server and
+        use start-server/reconnect/kill-server only if needed.
         """
         self.output_callback("_" * 80)
-        self.output_callback("Reconnect device...")
-        self.subprocess("adb", "kill-server")
-        self.subprocess("adb", "reconnect")
+        self.output_callback("Connect device...")
+        result = self.engine.connect(should_stop=self.task_runner.is_cancelled)
+        self.output_callback("Connect steps: %s" % result)
+        self.task_runner.check_cancelled()
+
+        if not result.healthy:
+            probe = result.probe
+            if probe.server_down:
+                print("Error: Can't connect to adb server: %s" % probe.error)
+            elif probe.unauthorized:
+                print("Error: Please accept 'USB Debugging' on the device!")
+            else:
+                print("Error: No device found. Maybe 'USB Debugging' is not enabled on device?!?")
 
-        self.list_devices()
-        self.fetch_package_list()
+        devices = self.list_devices()
+        self.task_runner.check_cancelled()
+        if len(devices) == 1:
+            self.load_package_cache(devices[0].serial)
+            self.task_runner.check_cancelled()
+            self.fetch_package_list()
+        elif len(devices) > 1:
+            self.task_runner.call_in_main(self.open_fleet)
+
+    def start_list_devices(self):
+        self.run_task(self.list_devices)
 
     def list_devices(self):
+        """
+        Returns a list of all AdbDevice instances
+        """
         self.output_callback("_" * 80)
         self.output_callback("List devices via adb...")
-        try:
-            self.subprocess("adb", "wait-for-usb-device", timeout=5)
-        except subprocess.TimeoutExpired as err:
-            print("Error: %s" % err)
-            print("Maybe 'USB Debugging' is not enabled on device?!?")
-
-        output = self.subprocess("adb", "devices", "-l", timeout=3)
-        # print(repr(output))
-        self.output_callback(output)
-
-        # example output e.g.:
-        #
-        # 'List of devices attached\nXYZ1234             device usb:3-10.4 product:foo model:bar device:foobar\n\n'
-
-        if "attached" not in output:
+        devices = self.engine.devices()
+        if devices is None:
             print("Output error :(")
-            return
-
-        lines = [line.strip() for line in output.splitlines() if line.strip()]
+            return []
+
+        self.devices = devices
+        if not self.devices:
+            print("ERROR: No device found!")
+            self.set_device_bar_info("no device")
+        elif len(self.devices) == 1:
+            # e.g.: "XYZ1234 - device usb:3-10.4 product:foo model:bar device:foobar"
+            self.set_device_bar_info(str(self.devices[0]))
+        else:
+            print("%i devices found: Use the 'fleet mode' for them." % len(self.devices))
+            self.set_device_bar_info("%i devices" % len(self.devices))
 
-        # e.g.:
-        # ['List of devices attached', 'XYZ1234             device usb:3-10.4 product:foo model:bar device:foobar']
+        return self.devices
 
-        if len(lines) != 2:
-            print("ERROR: Please connect only *one* device!")
-            return
+    def open_fleet(self):
+        if not self.devices:
+            self.run_task(self.list_devices, on_done=self._open_fleet)
+        else:
+            self._open_fleet(self.devices)
 
-        devices_info = lines[1]
-        devices_info = re.sub(r"\s{2,}", " - ", devices_info)
+    def _open_fleet(self, devices):
+        if devices:
+            FleetWindow(app=self, devices=devices)
 
-        # e.g.: "XYZ1234 - device usb:3-10.4 product:foo model:bar device:foobar"
+    def load_package_cache(self, serial):
+        """
+        Show the cached packages of this device, until the new inventory is fetched.
+        """
+        fingerprint = fetch_fingerprint(self.subprocess)
+        package_cache = PackageCache(serial=serial, fingerprint=fingerprint)
+        if package_cache.load():
+            self.output_callback("%i packages loaded from cache." % len(package_cache.infos))
+        self.package_cache = package_cache
+        self.task_runner.call_in_main(self.package_table.load_cache, package_cache.infos, package_cache.actions)
+
+    def save_package_cache(self):
+        self.cache_save_after_id = None
+        if self.package_cache is None:
+            return
 
-        self.set_device_bar_info(devices_info)
+        self.package_cache.infos = self.packages.info_map()
+        self.package_cache.actions = self.packages.action_map()
+        try:
+            self.package_cache.save()
+        except OSError as err:
+            log.error("Can't save package cache: %s", err)
+
+    def package_action_changed(self, packages):
+        self.update_reclaimable_bar()
+        if self.namespace_window is not None:
+            self.namespace_window.view.packages_changed(packages)
+        if self.cache_save_after_id is not None:
+            self.after_cancel(self.cache_save_after_id)
+        self.cache_save_after_id = self.after(CACHE_SAVE_DELAY, self.save_package_cache)
 
     def fetch_package_list(self, *args):
+        """
+        Fetch the package inventory with one 'adb shell' call.
+
+        Without cached packages: insert the packages in chunks while the first
+        'pm list packages' is still running.
+        With cached packages: Update only the added, removed and changed rows.
+        """
         self.output_callback("_" * 80)
         self.output_callback("Fetch package list via adb...")
 
-        packages = []
-        output = self.subprocess("adb", "shell", "pm", "list", "packages", timeout=10)
-        if not output:
+        incremental = self.package_cache is not None and bool(self.package_cache.infos)
+        if not incremental:
+            self.task_runner.call_in_main(self.package_table.clear)
+
+        parser = InventoryParser()
+        count = 0
+        chunk = []
+        last_flush = 0
+        for line in self.iter_subprocess("adb", "shell", build_inventory_script(), timeout=30):
+            info = parser.feed(line)
+            if info is not None:
+                if incremental:
+                    count += 1
+                    continue
+
+                chunk.append(info)
+
+                if len(chunk) >= FETCH_CHUNK_SIZE or time.monotonic() - last_flush >= FETCH_CHUNK_INTERVAL:
+                    self.output_callback("." * len(chunk), end="")
+                    self.task_runner.call_in_main(self.package_table.add_infos, chunk)
+                    count += len(chunk)
+                    chunk = []
+                    last_flush = time.monotonic()
+
+        if chunk:
+            self.output_callback("." * len(chunk), end="")
+            self.task_runner.call_in_main(self.package_table.add_infos, chunk)
+            count += len(chunk)
+
+        self.output_callback("\n", end="")
+        if not count:
             print("no process output")
             return
 
-        for line in output.splitlines():
-            if line.startswith("package:"):
-                self.output_callback(".", end="")
-                package_name = line[8:].strip()
-                packages.append(package_name)
+        infos = parser.merge()
+        self.output_callback(
+            "%i packages fetched (%i system, %i disabled, %i uninstalled)." % (
+                count,
+                len([info for info in infos.values() if info.system]),
+                len([info for info in infos.values() if info.state == info.DISABLED]),
+                len([info for info in infos.values() if info.state == info.UNINSTALLED]),
+            )
+        )
+        self.task_runner.call_in_main(self.inventory_fetched, infos)
+        self.fetch_footprints(infos)
 
-        self.output_callback("\n", end="")
+    def fetch_footprints(self, infos):
+        """
+        Fetch the storage footprint of all installed packages: one 'dumpsys diskstats' call
+        (+ one 'stat' call per chunk of packages, that are missing in the diskstats)
+        """
+        self.set_status_bar_info("Fetch package sizes...")
+        apk_paths = {package_name: info.apk_path for package_name, info in infos.items() if info.installed}
+        try:
+            footprints = fetch_footprints(self.backend.iter_output, apk_paths)
+        except subprocess.SubprocessError as err:  # e.g.: timeout or CircuitOpenError
+            print("ERROR: %s" % err)
+            footprints = None
+        if footprints is None:
+            # The sizes are optional: the package list is usable without them
+            self.set_status_bar_info("Fetch package sizes - sizes unavailable")
+            return
+        self.set_status_bar_info("Fetch package sizes - done")
+        self.output_callback("Sizes of %i packages fetched." % len(footprints))
+        self.task_runner.call_in_main(self.footprints_fetched, footprints)
+
+    def footprints_fetched(self, footprints):
+        self.package_table.set_footprints(footprints)
+        self.update_reclaimable_bar()
 
-        for no, package in enumerate(sorted(packages)):
-            # self.output_callback(package)
-            self.package_table.add(package)
+    def open_namespace_view(self):
+        if self.namespace_window is None:
+            self.namespace_window = NamespaceWindow(app=self)
+        else:
+            self.namespace_window.lift()
+
+    def packages_replaced(self):
+        """
+        The package list has changed: rebuild the namespace view
+        """
+        if self.namespace_window is not None:
+            self.namespace_window.view.rebuild()
+
+    def inventory_fetched(self, infos):
+        added, removed, changed = self.package_table.update_infos(infos)
+        self.packages_replaced()
+        self.load_trackers()
+        self.update_reclaimable_bar()
+        if self.package_cache is not None and self.package_cache.infos:
+            self.output_callback(
+                "Package table updated: %i added, %i removed, %i changed." % (len(added), len(removed), len(changed))
+            )
+        self.save_package_cache()
+
+    def set_package_names(self, package_names):
+        self.package_cache = None  # The packages of many devices: Don't mix them into one device cache
+        self.package_table.clear()
+        for package_name in sorted(package_names):
+            self.package_table.add(package_name)
+        self.package_table.apply_filter()
+        self.packages_replaced()
+        self.load_trackers()
 
     # def new(self, *args):
     #     self.info_text.insert(tk.END, "\nFile/New\n")
@@ -439,16 +1137,187 @@ class AdbUninstaller(tk.Tk):
     # def open(self, *args):
     #     self.info_text.insert(tk.END, "\nFile/Open\n")
 
+    ###########################################################################
+    # Trackers
+
+    def load_trackers(self):
+        """
+        Show the trackers of all packages from the offline index: a few SQLite queries, no network access.
+        """
+        trackers = self.engine.lookup_trackers()
+        if trackers:
+            self.output_callback("Trackers of %i packages found in the offline index." % len(trackers))
+        self.package_table.tree.refresh()
+
+    def import_trackers(self, *args):
+        filepath = filedialog.askopenfilename(
+            title="Import Exodus Privacy tracker dump",
+            filetypes=(("Tracker dumps", "*.json *.json.gz"), ("All files", "*")),
+        )
+        if not filepath:
+            return
+        self.output_callback("_" * 80)
+        self.output_callback("Import tracker dump %s..." % filepath)
+        self.run_task(import_dump, filepath, self.engine.tracker_db.path, on_done=self.trackers_imported)
+
+    def trackers_imported(self, info):
+        self.output_callback("%(packages)i packages with %(trackers)i different trackers imported." % info)
+        self.engine.tracker_db.reload()
+        self.load_trackers()
+
+    ###########################################################################
+    # Profiles
+
+    def open_profile(self, *args):
+        filepath = filedialog.askopenfilename(
+            title="Open debloat profile", filetypes=(("Profiles", "*.json *.toml"), ("All files", "*"))
+        )
+        if not filepath:
+            return
+        try:
+            profile = load_profile(filepath)
+        except (ProfileError, OSError) as err:
+            messagebox.showerror(title="Error", message="Can't load profile: %s" % err)
+            return
+
+        self.output_callback("_" * 80)
+        self.output_callback("Plan profile %s..." % profile)
+        self.run_task(self.engine.plan_profile, profile, on_done=self.profile_planned)
+
+    def profile_planned(self, plan):
+        """
+        Show the dry-run plan and run it after confirmation.
+        """
+        self.output_callback(str(plan))
+        for package_name, reason in sorted(plan.skipped.items()):
+            self.output_callback("\tskip %s: %s" % (package_name, reason))
+
+        if not plan.command_count:
+            messagebox.showinfo(title="Profile", message="Nothing to do: The device matches the profile.")
+            return
+
+        run = messagebox.askyesno(
+            title="Run profile?",
+            message="%s\n\nRun these %i commands?" % (plan, plan.command_count),
+        )
+        if run:
+            self.run_task(self._run_plan, plan)
+
+    def _run_plan(self, plan):
+        executor = self.batch_executor("Profile")
+        try:
+            action_results = self.engine.run_plan(plan, executor=executor)
+        finally:
+            self.finish_batch()
+
+        for action_result in action_results:
+            for result in action_result.results:
+                self.output_callback("%s %s" % (action_result.action, result))
+            if action_result.not_done:
+                self.output_callback("%i apps not done: %s" % (
+                    len(action_result.not_done), ", ".join(sorted(action_result.not_done))
+                ))
+            if action_result.summary is not None:
+                self.output_callback("%s: %s" % (action_result.action, action_result.summary))
+        self.task_runner.check_cancelled()
+
+        # Update the table with the new device state:
+        self.fetch_package_list()
+
+    def save_profile(self, *args):
+        package_names = self.selected_package_names()
+        if not package_names:
+            messagebox.showinfo(title="Info", message="No packages selected !")
+            return
+
+        filepath = filedialog.asksaveasfilename(
+            title="Save selection as debloat profile", defaultextension=".json", filetypes=(("JSON", "*.json"),)
+        )
+        if not filepath:
+            return
+
+        profile = Profile(name=os.path.splitext(os.path.basename(filepath))[0], origin=filepath)
+        for package_name in package_names:
+            profile.add(package_name, DISABLE)  # disable is the safer action
+        try:
+            save_profile(profile, filepath)
+        except OSError as err:
+            messagebox.showerror(title="Error", message="Can't save profile: %s" % err)
+        else:
+            self.output_callback("%i packages saved in profile: %s" % (len(package_names), filepath))
+
+    ###########################################################################
+    # Journal
+
+    def open_restore(self, *args):
+        journal = self.engine.journal()
+        if journal is None:
+            messagebox.showinfo(title="Info", message="No device connected !")
+            return
+        RestoreWindow(app=self, journal=journal)
+
+    def _run_restore(self, plan):
+        self.output_callback("_" * 80)
+        self.output_callback("Restore: %s" % plan)
+
+        executor = self.batch_executor("Restore")
+        try:
+            action_result = self.engine.restore(plan, executor=executor)
+        finally:
+            self.finish_batch()
+
+        for result in action_result.results:
+            self.output_callback("restore %s" % result)
+        if action_result.not_done is None:
+            self.output_callback("Can't verify the device state!")
+        elif action_result.not_done:
+            self.output_callback("%i apps not restored: %s" % (
+                len(action_result.not_done), ", ".join(sorted(action_result.not_done))
+            ))
+        self.output_callback("Restore: %s" % action_result.summary)
+        self.set_status_bar_info("Restore: %s" % action_result.summary)
+        self.task_runner.check_cancelled()
+
+        # Update the table with the new device state:
+        self.fetch_package_list()
+
+    ###########################################################################
+    # Metrics
+
+    def export_metrics(self, *args):
+        filepath = filedialog.asksaveasfilename(
+            title="Export adb metrics",
+            defaultextension=".json",
+            filetypes=(("JSON", "*.json"), ("CSV", "*.csv")),
+        )
+        if not filepath:
+            return
+        try:
+            metrics_registry.export(filepath)
+        except OSError as err:
+            messagebox.showerror(title="Error", message="Can't export metrics: %s" % err)
+        else:
+            self.output_callback("adb metrics exported to: %s" % filepath)
+
+    ###########################################################################
+
     def about(self, *args):
         messagebox.showinfo(title="about", message="See github page ;)")
 
     def destroy(self, *args):
         close = messagebox.askyesno(title="close?", message="Quit?")
         if close:
+            self.task_runner.shutdown()
+            self.after_cancel(self.metrics_after_id)
+            if self.cache_save_after_id is not None:
+                self.after_cancel(self.cache_save_after_id)
+            self.save_package_cache()
+            self.engine.close()
             super().destroy()
 
 
 def main():
+    logging.basicConfig(level=logging.DEBUG)
     AdbUninstaller()
 
 
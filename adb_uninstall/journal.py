@@ -0,0 +1,325 @@
+"""
+    Append-only journal of all uninstall/disable/restore batches per device.
+
+    One JSON lines file per device serial, one line per package result.
+    A background thread writes the lines, so the batch never waits for the disk.
+    Every chunk of a batch is written, flushed and fsync'd as a whole: A crash
+    may lose the last chunk, but never breaks the lines before.
+
+    Restore: Reverse one or more batches or everything since a point in time.
+    The restores are journaled, too: So a package is never restored twice.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from adb_uninstall.adb_batch import PM_DISABLE_USER, PM_ENABLE, PM_INSTALL_EXISTING, PM_UNINSTALL
+from adb_uninstall.constants import JOURNAL_PATH
+
+log = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def command_key(command):
+    return " ".join(command)
+
+
+# pm command -> pm command that reverses it
+REVERSE_COMMANDS = {
+    command_key(PM_UNINSTALL): PM_INSTALL_EXISTING,
+    command_key(PM_DISABLE_USER): PM_ENABLE,
+}
+# The restore order: reinstall first, because a reinstalled app may be still disabled
+RESTORE_COMMANDS = (PM_INSTALL_EXISTING, PM_ENABLE)
+
+
+def new_batch_id():
+    """
+    Sortable and unique batch id, e.g.: '20201231-235959-1a2b'
+    """
+    return "%s-%s" % (time.strftime("%Y%m%d-%H%M%S"), os.urandom(2).hex())
+
+
+def parse_time(text):
+    """
+    Returns the epoch time of a local date/time string (or raise ValueError)
+
+    >>> parse_time("2020-12-31 23:59") == time.mktime((2020, 12, 31, 23, 59, 0, 0, 0, -1))
+    True
+    >>> parse_time("yesterday")
+    Traceback (most recent call last):
+        ...
+    ValueError: Invalid time 'yesterday' (must be e.g.: '2020-12-31 23:59:59')
+    """
+    for time_format in (TIME_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, time_format))
+        except ValueError:
+            pass
+    raise ValueError("Invalid time %r (must be e.g.: '2020-12-31 23:59:59')" % text)
+
+
+class JournalWriter:
+    """
+    Write the journal lines in a background thread.
+    Started on the first write, flushed at exit.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="journal", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def write(self, filepath, lines):
+        self._start()
+        self.queue.put((filepath, lines))
+
+    def _run(self):
+        while True:
+            filepath, lines = self.queue.get()
+            try:
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                with open(filepath, "a") as f:
+                    f.write("".join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as err:
+                log.error("Can't write journal %s: %s", filepath, err)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Wait until all queued lines are written.
+        """
+        if self.thread is not None:
+            self.queue.join()
+
+
+# Used by all Journal instances:
+writer = JournalWriter()
+
+
+class JournalBatch:
+    def __init__(self, *, batch_id, command):
+        self.batch_id = batch_id
+        self.command = command  # command_key() of the pm command
+        self.entries = []
+
+    @property
+    def time(self):
+        return self.entries[0]["time"]
+
+    @property
+    def succeeded(self):
+        return [entry["package"] for entry in self.entries if entry["exit_code"] == 0]
+
+    @property
+    def reversible(self):
+        return self.command in REVERSE_COMMANDS
+
+    def as_dict(self):
+        return {
+            "batch": self.batch_id,
+            "time": time.strftime(TIME_FORMAT, time.localtime(self.time)),
+            "command": self.command,
+            "succeeded": self.succeeded,
+            "failed": len(self.entries) - len(self.succeeded),
+        }
+
+    def __str__(self):
+        return "%s %s: %s (%i packages, %i failed)" % (
+            time.strftime(TIME_FORMAT, time.localtime(self.time)),
+            self.batch_id,
+            self.command,
+            len(self.succeeded),
+            len(self.entries) - len(self.succeeded),
+        )
+
+
+class RestorePlan:
+    def __init__(self, steps):
+        self.steps = steps  # list of (pm command, list of package names)
+
+    @property
+    def package_names(self):
+        package_names = set()
+        for command, step_package_names in self.steps:
+            package_names.update(step_package_names)
+        return sorted(package_names)
+
+    @property
+    def command_count(self):
+        return sum(len(package_names) for command, package_names in self.steps)
+
+    def as_dict(self):
+        return {
+            "steps": [
+                {"command": command_key(command), "packages": package_names}
+                for command, package_names in self.steps
+            ]
+        }
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    def __str__(self):
+        if not self.steps:
+            return "Nothing to restore."
+        return ", ".join(
+            "%s: %i packages" % (command_key(command), len(package_names)) for command, package_names in self.steps
+        )
+
+
+def plan_restore(entries, batch_ids=None, since=None):
+    """
+    Reverse all successful commands of the given batches and/or since the given time,
+    that are not restored already. Returns a RestorePlan instance.
+
+    >>> entries = [
+    ...     {"batch": "1", "time": 10, "command": "pm uninstall --user 0", "package": "com.a", "exit_code": 0},
+    ...     {"batch": "1", "time": 10, "command": "pm uninstall --user 0", "package": "com.b", "exit_code": 1},
+    ...     {"batch": "2", "time": 20, "command": "pm disable-user", "package": "com.c", "exit_code": 0},
+    ...     {"batch": "2", "time": 20, "command": "pm disable-user", "package": "com.d", "exit_code": 0},
+    ...     {"batch": "3", "time": 30, "command": "pm enable", "package": "com.d", "exit_code": 0},
+    ... ]
+    >>> print(plan_restore(entries, batch_ids=["1"]).as_dict())
+    {'steps': [{'command': 'cmd package install-existing --user 0', 'packages': ['com.a']}]}
+    >>> print(plan_restore(entries, since=15))
+    pm enable: 1 packages
+    >>> plan_restore(entries, since=15).package_names
+    ['com.c']
+    """
+    if batch_ids is None and since is None:
+        raise ValueError("Restore what? Give batch ids and/or a point in time.")
+    batch_ids = set(batch_ids or ())
+
+    pending = OrderedDict()  # package name -> set of reverse pm commands
+    for entry in entries:
+        if entry["exit_code"] != 0:
+            continue
+        package_name = entry["package"]
+        reverse_command = REVERSE_COMMANDS.get(entry["command"])
+        if reverse_command is not None:
+            if entry["batch"] in batch_ids or (since is not None and entry["time"] >= since):
+                pending.setdefault(package_name, set()).add(reverse_command)
+        elif package_name in pending:
+            # Restored in the meantime:
+            pending[package_name].discard(tuple(entry["command"].split()))
+
+    steps = []
+    for command in RESTORE_COMMANDS:
+        package_names = sorted(name for name, commands in pending.items() if command in commands)
+        if package_names:
+            steps.append((command, package_names))
+    return RestorePlan(steps)
+
+
+class Journal:
+    """
+    >>> import tempfile
+    >>> from adb_uninstall.adb_batch import BatchResult
+    >>> with tempfile.TemporaryDirectory() as temp_path:
+    ...     journal = Journal(serial="192.168.0.2:5555", path=temp_path)
+    ...     journal.append("1", PM_UNINSTALL, [
+    ...         BatchResult(package_name="com.foo", exit_code=0, message="Success"),
+    ...         BatchResult(package_name="com.bar", exit_code=1, message="Failure"),
+    ...     ])
+    ...     journal.flush()
+    ...     print(os.listdir(temp_path))
+    ...     for batch in journal.batches():
+    ...         print(batch.batch_id, batch.command, batch.succeeded)
+    ...     print(journal.plan_restore(batch_ids=["1"]))
+    ['192.168.0.2_5555.jsonl']
+    1 pm uninstall --user 0 ['com.foo']
+    cmd package install-existing --user 0: 1 packages
+    """
+
+    def __init__(self, *, serial, path=JOURNAL_PATH):
+        self.serial = serial
+        self.path = os.path.expanduser(path)
+
+    @property
+    def filepath(self):
+        # The serial of network devices contains e.g. ':'
+        filename = re.sub(r"[^A-Za-z0-9_.-]", "_", self.serial)
+        return os.path.join(self.path, "%s.jsonl" % filename)
+
+    def append(self, batch_id, command, results):
+        """
+        Journal the BatchResult instances of one chunk (written in background)
+        """
+        now = time.time()
+        lines = [
+            json.dumps(
+                {
+                    "batch": batch_id,
+                    "time": now,
+                    "command": command_key(command),
+                    "package": result.package_name,
+                    "exit_code": result.exit_code,
+                    "message": result.message,
+                }
+            )
+            + "\n"
+            for result in results
+        ]
+        if lines:
+            writer.write(self.filepath, lines)
+
+    def flush(self):
+        writer.flush()
+
+    def entries(self):
+        """
+        Returns all journal entries in chronological order.
+        """
+        self.flush()
+        entries = []
+        try:
+            with open(self.filepath, "r") as f:
+                for line_no, line in enumerate(f, 1):
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # e.g.: the last line after a crash
+                        log.error("Skip broken line %i in journal %s", line_no, self.filepath)
+        except FileNotFoundError:
+            log.debug("No journal for %s", self.serial)
+        return entries
+
+    def batches(self):
+        """
+        Returns all JournalBatch instances in chronological order.
+        """
+        batches = OrderedDict()
+        for entry in self.entries():
+            batch = batches.get(entry["batch"])
+            if batch is None:
+                batch = batches[entry["batch"]] = JournalBatch(batch_id=entry["batch"], command=entry["command"])
+            batch.entries.append(entry)
+        return list(batches.values())
+
+    def plan_restore(self, batch_ids=None, since=None):
+        return plan_restore(self.entries(), batch_ids=batch_ids, since=since)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,247 @@
+"""
+    Latency metrics of all adb calls.
+
+    Every call is recorded by kind (e.g.: "devices", "inventory", "uninstall")
+    and device serial into a histogram with fixed, exponential buckets.
+    So recording is O(1) and the memory is bounded, p50/p95 are estimated
+    from the buckets (upper bound of the bucket).
+
+    >>> registry = MetricsRegistry()
+    >>> for duration in (0.010, 0.012, 0.015, 0.020, 0.250):
+    ...     registry.record(kind="devices", serial="XYZ", duration=duration, outcome=OK)
+    >>> registry.record(kind="uninstall", serial="XYZ", duration=2.5, outcome=TIMEOUT)
+    >>> for row in registry.snapshot():
+    ...     print(row["kind"], row["serial"], row["count"], row["ok"], row["timeout"], row["p50_ms"], row["p95_ms"])
+    devices XYZ 5 5 0 18.2 250.0
+    uninstall XYZ 1 0 1 2500.0 2500.0
+"""
+
+import bisect
+import collections
+import contextlib
+import csv
+import io
+import json
+import re
+import subprocess
+import threading
+import time
+
+from adb_uninstall.utils.humanize import human_duration
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+OUTCOMES = (OK, ERROR, TIMEOUT)
+
+# Histogram bucket upper bounds in sec.: 1ms * 1.25^n up to ~2min
+BUCKET_BOUNDS = tuple(0.001 * 1.25 ** no for no in range(53))
+
+THROUGHPUT_WINDOW = 60  # sec.
+
+# Classify adb command lines, first match wins:
+COMMAND_KINDS = (
+    ("uninstall", re.compile(r"pm uninstall")),
+    ("disable-user", re.compile(r"pm disable-user")),
+    ("inventory", re.compile(r"__ADB_UNINSTALL_SECTION__")),
+    ("list", re.compile(r"pm list packages")),
+    ("getprop", re.compile(r"getprop")),
+    ("devices", re.compile(r"^adb devices")),
+)
+
+
+def command_kind(args):
+    """
+    >>> command_kind(("adb", "shell", "pm", "list", "packages", "-d"))
+    'list'
+    >>> command_kind(("adb", "shell", 'pm uninstall --user 0 com.foo 2>&1;echo "..."'))
+    'uninstall'
+    >>> command_kind(("adb", "kill-server"))
+    'kill-server'
+    """
+    command_line = " ".join(args)
+    for kind, regex in COMMAND_KINDS:
+        if regex.search(command_line):
+            return kind
+    return args[1] if len(args) > 1 else args[0]
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)  # The last one is for all longer durations
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket that contains the percentile (or None)
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for no, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                if no < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[no], self.max)
+                return self.max
+        return self.max
+
+    def merge(self, other):
+        for no, bucket_count in enumerate(other.buckets):
+            self.buckets[no] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+
+class CallStats:
+    def __init__(self):
+        self.histogram = Histogram()
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+
+    def add(self, duration, outcome):
+        self.histogram.add(duration)
+        self.outcomes[outcome] += 1
+
+
+def _ms(duration):
+    return None if duration is None else round(duration * 1000, 1)
+
+
+class MetricsRegistry:
+    def __init__(self, throughput_window=THROUGHPUT_WINDOW):
+        self.throughput_window = throughput_window
+        self.lock = threading.Lock()
+        self.stats = {}  # (kind, serial) -> CallStats
+        self.total = CallStats()
+        self.recent = collections.deque()  # end times of the calls in the throughput window
+
+    def record(self, *, kind, serial, duration, outcome):
+        now = time.monotonic()
+        with self.lock:
+            key = (kind, serial or "-")
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = CallStats()
+            stats.add(duration, outcome)
+            self.total.add(duration, outcome)
+
+            self.recent.append(now)
+            self._expire(now)
+
+    def _expire(self, now):
+        limit = now - self.throughput_window
+        while self.recent and self.recent[0] < limit:
+            self.recent.popleft()
+
+    @contextlib.contextmanager
+    def measure(self, kind, serial=None):
+        """
+        Record the duration of the with block, the outcome depends on the exception.
+        """
+        start_time = time.monotonic()
+        outcome = ERROR
+        try:
+            yield
+            outcome = OK
+        except subprocess.TimeoutExpired:
+            outcome = TIMEOUT
+            raise
+        except GeneratorExit:
+            # The consumer of a streaming call stopped early: not a failed call
+            outcome = OK
+            raise
+        finally:
+            self.record(kind=kind, serial=serial, duration=time.monotonic() - start_time, outcome=outcome)
+
+    def throughput(self):
+        """
+        Calls per second in the throughput window.
+        """
+        with self.lock:
+            self._expire(time.monotonic())
+            return len(self.recent) / self.throughput_window
+
+    def snapshot(self):
+        """
+        Returns a list of dicts, one per kind + serial
+        """
+        rows = []
+        with self.lock:
+            for (kind, serial), stats in sorted(self.stats.items()):
+                histogram = stats.histogram
+                row = {
+                    "kind": kind,
+                    "serial": serial,
+                    "count": histogram.count,
+                    "p50_ms": _ms(histogram.percentile(50)),
+                    "p95_ms": _ms(histogram.percentile(95)),
+                    "min_ms": _ms(histogram.min),
+                    "max_ms": _ms(histogram.max),
+                    "mean_ms": _ms(histogram.total / histogram.count),
+                }
+                row.update(stats.outcomes)
+                rows.append(row)
+        return rows
+
+    def summary(self):
+        """
+        Short text for the status bar.
+        """
+        with self.lock:
+            histogram = self.total.histogram
+            if not histogram.count:
+                return "adb: no calls"
+            p50 = histogram.percentile(50)
+            p95 = histogram.percentile(95)
+            failed = self.total.outcomes[ERROR] + self.total.outcomes[TIMEOUT]
+            count = histogram.count
+        return "adb: %i calls, %i failed, p50 %s, p95 %s, %.1f/min" % (
+            count, failed, human_duration(p50), human_duration(p95), self.throughput() * 60
+        )
+
+    def to_json(self):
+        return json.dumps({"time": time.time(), "metrics": self.snapshot()}, indent=2)
+
+    def to_csv(self):
+        rows = self.snapshot()
+        output = io.StringIO()
+        fieldnames = ("kind", "serial", "count") + OUTCOMES + ("p50_ms", "p95_ms", "min_ms", "max_ms", "mean_ms")
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def export(self, filepath):
+        """
+        Save a snapshot as .csv or .json (depends on the file extension)
+        """
+        content = self.to_csv() if filepath.endswith(".csv") else self.to_json()
+        with open(filepath, "w", newline="") as f:
+            f.write(content)
+
+
+# All adb calls of this process are recorded here:
+registry = MetricsRegistry()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
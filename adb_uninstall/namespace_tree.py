@@ -0,0 +1,178 @@
+"""
+    Prefix tree over the dotted package names, e.g.: com -> com.google -> com.google.android
+
+    Every node caches the number of keep/remove/locked packages below it.
+    If the action of one package changes, only the nodes on the path to the root
+    are updated: O(depth). A whole subtree is set with one Packages.set_action() pass
+    and one recount of the subtree.
+"""
+
+from adb_uninstall.adb_package import Package
+
+ACTIONS = (Package.KEEP, Package.REMOVE, Package.LOCKED)
+
+
+class NamespaceNode:
+    def __init__(self, *, name, path, parent):
+        self.name = name  # the last part of the path, e.g.: 'google'
+        self.path = path  # e.g.: 'com.google'
+        self.parent = parent
+        self.children = {}  # name -> NamespaceNode
+        self.package = None  # Package instance, if a package has exactly this name
+        self.counts = dict.fromkeys(ACTIONS, 0)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def sorted_children(self):
+        return [self.children[name] for name in sorted(self.children)]
+
+    def iter_nodes(self):
+        """
+        All nodes of this subtree (depth first, this node first)
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def iter_packages(self):
+        for node in self.iter_nodes():
+            if node.package is not None:
+                yield node.package
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def __str__(self):
+        return "%s (%i keep, %i remove, %i locked)" % (
+            self.path or "<root>", self.counts[Package.KEEP], self.counts[Package.REMOVE], self.counts[Package.LOCKED]
+        )
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+class NamespaceTree:
+    """
+    >>> from adb_uninstall.adb_package import Packages
+    >>> from adb_uninstall.rules import RuleSet
+    >>> packages = Packages(rule_set=RuleSet())
+    >>> for package_name in ("com.google.ads", "com.google.maps", "com.google", "org.mozilla.firefox"):
+    ...     package = packages.add(package_name=package_name)
+    >>> tree = NamespaceTree(packages.name2package.values())
+    >>> print(tree.node("com"))
+    com (3 keep, 0 remove, 0 locked)
+    >>> [node.name for node in tree.root.sorted_children()]
+    ['com', 'org']
+
+    >>> package = packages.name2package["com.google.ads"]
+    >>> package.set_remove()
+    >>> [node.path for node in tree.update(package)]
+    ['com.google.ads', 'com.google', 'com', '']
+    >>> print(tree.node("com.google"))
+    com.google (2 keep, 1 remove, 0 locked)
+
+    >>> changed = tree.set_subtree_action(tree.node("com"), packages, Package.REMOVE)
+    >>> sorted(package.package_name for package in changed)
+    ['com.google', 'com.google.maps']
+    >>> print(tree.root)
+    <root> (1 keep, 3 remove, 0 locked)
+    """
+
+    def __init__(self, packages=()):
+        self.root = NamespaceNode(name="", path="", parent=None)
+        self.package_nodes = {}  # package name -> NamespaceNode
+        self.actions = {}  # package name -> the counted action
+        for package in packages:
+            self.add(package)
+
+    def node(self, path):
+        """
+        Returns the node of the given dotted path (or raise KeyError)
+        """
+        node = self.root
+        if path:
+            for name in path.split("."):
+                node = node.children[name]
+        return node
+
+    def add(self, package):
+        node = self.root
+        for name in package.package_name.split("."):
+            child = node.children.get(name)
+            if child is None:
+                path = name if node is self.root else "%s.%s" % (node.path, name)
+                child = node.children[name] = NamespaceNode(name=name, path=path, parent=node)
+            node = child
+
+        node.package = package
+        self.package_nodes[package.package_name] = node
+        self.actions[package.package_name] = package.action
+        while node is not None:
+            node.counts[package.action] += 1
+            node = node.parent
+
+    def update(self, package):
+        """
+        Update the counts after the action of the package has changed: O(depth)
+        Returns the changed nodes: the package node and all ancestors.
+        """
+        old_action = self.actions[package.package_name]
+        if old_action == package.action:
+            return []
+        self.actions[package.package_name] = package.action
+
+        node = self.package_nodes[package.package_name]
+        changed = []
+        while node is not None:
+            node.counts[old_action] -= 1
+            node.counts[package.action] += 1
+            changed.append(node)
+            node = node.parent
+        return changed
+
+    def recount(self, node):
+        """
+        Recount the subtree of the node and update all ancestors with the difference.
+        """
+        old_counts = dict(node.counts)
+
+        nodes = list(node.iter_nodes())  # parents before children
+        for subtree_node in nodes:
+            subtree_node.counts = dict.fromkeys(ACTIONS, 0)
+        for subtree_node in reversed(nodes):  # children before parents
+            package = subtree_node.package
+            if package is not None:
+                self.actions[package.package_name] = package.action
+                subtree_node.counts[package.action] += 1
+            if subtree_node is not node:
+                for action, count in subtree_node.counts.items():
+                    subtree_node.parent.counts[action] += count
+
+        for action in ACTIONS:
+            difference = node.counts[action] - old_counts[action]
+            if difference:
+                for ancestor in node.ancestors():
+                    ancestor.counts[action] += difference
+
+    def set_subtree_action(self, node, packages, action):
+        """
+        Set keep/remove for all packages below the node (locked packages are skipped).
+        'packages' is the adb_package.Packages instance. Returns the changed packages.
+        """
+        changed = packages.set_action(list(node.iter_packages()), action)
+        if changed:
+            self.recount(node)
+        return changed
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
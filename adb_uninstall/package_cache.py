@@ -0,0 +1,121 @@
+"""
+    On-disk cache of the package inventory and the keep/remove selection per device.
+
+    One JSON file per device serial. The inventory is only used, if the
+    'ro.build.fingerprint' of the device is unchanged. The selection is
+    always restored, because it's still valid after a system update.
+"""
+
+import json
+import logging
+import os
+import re
+
+from adb_uninstall.adb_inventory import PackageInfo
+from adb_uninstall.constants import PACKAGE_CACHE_PATH
+
+log = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def fetch_fingerprint(check_output):
+    """
+    Returns the build fingerprint of the device (or None)
+    """
+    output = check_output("adb", "shell", "getprop", "ro.build.fingerprint", timeout=5)
+    if not output:
+        return None
+    return output.strip() or None
+
+
+class PackageCache:
+    """
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as temp_path:
+    ...     cache = PackageCache(serial="192.168.0.2:5555", fingerprint="foo/bar:10", path=temp_path)
+    ...     cache.infos = {"com.foo": PackageInfo(package_name="com.foo", uid=10001)}
+    ...     cache.actions = {"com.foo": "remove"}
+    ...     cache.save()
+    ...     print(os.listdir(temp_path))
+    ...
+    ...     cache = PackageCache(serial="192.168.0.2:5555", fingerprint="foo/bar:10", path=temp_path)
+    ...     cache.load()
+    ...     print(cache.infos["com.foo"].uid, cache.actions)
+    ...
+    ...     cache = PackageCache(serial="192.168.0.2:5555", fingerprint="foo/bar:11", path=temp_path)
+    ...     cache.load()
+    ...     print(cache.infos, cache.actions)
+    ['192.168.0.2_5555.json']
+    True
+    10001 {'com.foo': 'remove'}
+    False
+    {} {'com.foo': 'remove'}
+    """
+
+    def __init__(self, *, serial, fingerprint, path=PACKAGE_CACHE_PATH):
+        self.serial = serial
+        self.fingerprint = fingerprint
+        self.path = os.path.expanduser(path)
+
+        self.infos = {}  # package name -> PackageInfo
+        self.actions = {}  # package name -> Package.KEEP / Package.REMOVE
+
+    @property
+    def filepath(self):
+        # The serial of network devices contains e.g. ':'
+        filename = re.sub(r"[^A-Za-z0-9_.-]", "_", self.serial)
+        return os.path.join(self.path, "%s.json" % filename)
+
+    def load(self):
+        """
+        Returns True if the cached inventory is valid for the current fingerprint.
+        """
+        try:
+            with open(self.filepath, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            log.debug("No package cache for %s", self.serial)
+            return False
+        except (OSError, ValueError) as err:
+            log.error("Can't read package cache %s: %s", self.filepath, err)
+            return False
+
+        if data.get("version") != CACHE_VERSION:
+            log.info("Ignore old package cache: %s", self.filepath)
+            return False
+
+        self.actions = data.get("actions", {})
+
+        if self.fingerprint is None or data.get("fingerprint") != self.fingerprint:
+            log.info("Fingerprint of %s changed: Ignore cached package inventory.", self.serial)
+            return False
+
+        self.infos = {
+            package_name: PackageInfo.from_dict(package_name, info)
+            for package_name, info in data.get("infos", {}).items()
+        }
+        return True
+
+    def save(self):
+        data = {
+            "version": CACHE_VERSION,
+            "serial": self.serial,
+            "fingerprint": self.fingerprint,
+            "infos": {package_name: info.to_dict() for package_name, info in self.infos.items()},
+            "actions": self.actions,
+        }
+        os.makedirs(self.path, exist_ok=True)
+
+        # Write to a temp file first, so a crash never leaves a broken cache file:
+        temp_filepath = "%s.tmp" % self.filepath
+        with open(temp_filepath, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_filepath, self.filepath)
+        log.debug("Package cache saved: %s", self.filepath)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,332 @@
+"""
+    Search index over the package names for the incremental filter of the package table.
+
+    Built once per package list: the sorted names and a trigram index
+    (trigram -> set of name positions). The literal parts of a query select the
+    candidates via the intersection of their trigram sets, only the candidates
+    are matched. So a keystroke costs a few set intersections, not a scan of all names.
+    A prefix glob (e.g.: 'com.google.*') is a binary search in the sorted names.
+    Only queries without a trigram (e.g. a regex with alternatives) scan all names.
+
+    Query syntax (case insensitive):
+        google          substring
+        com.google.*    glob (if the query contains one of: * ? [ )
+        re:^com\\.(a|b)  regular expression (search, not match)
+"""
+
+import bisect
+import fnmatch
+import re
+
+REGEX_PREFIX = "re:"
+GLOB_CHARS = "*?["
+
+SUBSTRING = "substring"
+PREFIX = "prefix"
+SUFFIX = "suffix"
+GLOB = "glob"
+REGEX = "regex"
+
+# Regex meta chars: a literal run ends here
+REGEX_META_CHARS = set(".^$*+?{}[]\\|()")
+
+# Escapes with fixed length arguments, e.g.: \x2e -> skip "2e"
+REGEX_ESCAPE_ARGUMENT_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def trigrams(text):
+    """
+    >>> sorted(trigrams("com.foo"))
+    ['.fo', 'com', 'foo', 'm.f', 'om.']
+    """
+    return set(text[no:no + 3] for no in range(len(text) - 2))
+
+
+def scan_regex(pattern):
+    """
+    Returns the literal parts, that every match must contain (or [] if unknown)
+    and the literal prefix of a anchored regex (or None): The first literal part,
+    if it starts right after the '^'.
+
+    >>> scan_regex(r"^com\\.google\\..*ads?$")
+    (['com.google.', 'ad'], 'com.google.')
+    >>> scan_regex(r"^comx?foo")
+    (['com', 'foo'], 'com')
+    """
+    if "|" in pattern or "(" in pattern:
+        # Alternatives or groups (maybe optional): no literal is required
+        return [], None
+
+    literals = []
+    prefix = None
+    current = []
+    current_start = None  # position of the first char in 'current'
+    pos = 0
+    while pos < len(pattern):
+        char_start = pos
+        char = pattern[pos]
+        pos += 1
+        if char == "\\":
+            escaped = pattern[pos:pos + 1]
+            pos += 1
+            if escaped and not escaped.isalnum():
+                if not current:
+                    current_start = char_start
+                current.append(escaped)  # e.g.: \\.
+                continue
+            # e.g.: \\d or \\w or a escape with a argument, that is not a literal: \\x2e \\N{...} \\12
+            if escaped in REGEX_ESCAPE_ARGUMENT_LENGTHS:
+                pos += REGEX_ESCAPE_ARGUMENT_LENGTHS[escaped]
+            elif escaped == "N":
+                pos = pattern.find("}", pos) + 1 or len(pattern)
+            elif escaped.isdigit():
+                while pos < len(pattern) and pattern[pos].isdigit():
+                    pos += 1  # Back reference or octal escape
+        elif char == "[":
+            pos = pattern.find("]", pos) + 1 or len(pattern)
+        elif char in "?*{":
+            # The char before is optional:
+            if current:
+                current.pop()
+            if char == "{":
+                pos = pattern.find("}", pos) + 1 or len(pattern)
+        elif char not in REGEX_META_CHARS:
+            if not current:
+                current_start = char_start
+            current.append(char)
+            continue
+
+        if current:
+            if not literals and current_start == 1 and pattern.startswith("^"):
+                prefix = "".join(current)
+            literals.append("".join(current))
+        current = []
+
+    if current:
+        if not literals and current_start == 1 and pattern.startswith("^"):
+            prefix = "".join(current)
+        literals.append("".join(current))
+    return literals, prefix
+
+
+def regex_literals(pattern):
+    """
+    Returns the literal parts, that every match must contain (or [] if unknown).
+
+    >>> regex_literals(r"^com\\.google\\..*ads?$")
+    ['com.google.', 'ad']
+    >>> regex_literals(r"[a-z]+\\d{2,3}x")
+    ['x']
+    >>> regex_literals(r"foo|bar")
+    []
+    >>> regex_literals(r"com\\x2egoogle\\u002Eads\\1")
+    ['com', 'google', 'ads']
+    """
+    return scan_regex(pattern)[0]
+
+
+def regex_prefix(pattern):
+    """
+    Returns the literal prefix of a anchored regex (or None)
+
+    >>> regex_prefix(r"^com\\.foo.*"), regex_prefix("^.*foo"), regex_prefix("foo")
+    ('com.foo', None, None)
+    >>> regex_prefix("^s?amsung"), regex_prefix(r"^c?om\\.samsung"), regex_prefix(r"^\\dfoo")
+    (None, None, None)
+    """
+    return scan_regex(pattern)[1]
+
+
+def parse_query(query):
+    """
+    Returns the mode, the compiled regex (or None), the literal parts and the prefix (or None) of the query.
+
+    >>> parse_query("Google")
+    ('substring', None, ['google'], None)
+    >>> parse_query("com.google.*"), parse_query("*google*")
+    (('prefix', None, ['com.google.'], 'com.google.'), ('substring', None, ['google'], None))
+    >>> mode, regex, literals, prefix = parse_query("com.*.ads")
+    >>> mode, literals, prefix, bool(regex.match("com.foo.ads")), bool(regex.match("com.foo.ads.bar"))
+    ('glob', ['com.', '.ads'], 'com.', True, False)
+    >>> parse_query("re:(")
+    Traceback (most recent call last):
+        ...
+    adb_uninstall.package_index.QueryError: Invalid regex: missing ), unterminated subpattern at position 0
+    """
+    query = query.strip()
+    if query[:len(REGEX_PREFIX)].lower() == REGEX_PREFIX:
+        # Not lowercased: e.g. \S is not \s
+        pattern = query[len(REGEX_PREFIX):]
+        if pattern in ("", "^"):
+            return SUBSTRING, None, [""], None  # matches all
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error as err:
+            raise QueryError("Invalid regex: %s" % err)
+        literals, prefix = scan_regex(pattern)
+        # The literals are looked up in the lowercase names:
+        literals = [literal.lower() for literal in literals]
+        return REGEX, regex, literals, None if prefix is None else prefix.lower()
+
+    query = query.lower()
+
+    if any(char in query for char in GLOB_CHARS):
+        stripped = query.strip("*")
+        if not stripped:
+            return SUBSTRING, None, [""], None  # matches all
+        if "?" not in query and "[" not in query and "*" not in stripped:
+            if query.startswith("*") and query.endswith("*"):
+                return SUBSTRING, None, [stripped], None
+            if query.endswith("*"):
+                return PREFIX, None, [stripped], stripped
+            if query.startswith("*"):
+                return SUFFIX, None, [stripped], None
+
+        regex = re.compile(fnmatch.translate(query))
+        literals = [part for part in re.split(r"[*?]|\[[^\]]*\]?", query) if part]
+        prefix = literals[0] if literals and query.startswith(literals[0]) else None
+        return GLOB, regex, literals, prefix
+
+    return SUBSTRING, None, [query], None
+
+
+class PackageIndex:
+    """
+    >>> index = PackageIndex(["com.google.ads", "com.google.maps", "org.mozilla.firefox", "com.foo.ads"])
+    >>> index.search("google")
+    ['com.google.ads', 'com.google.maps']
+    >>> index.search("*.ads")
+    ['com.foo.ads', 'com.google.ads']
+    >>> index.search("com.*.ads")
+    ['com.foo.ads', 'com.google.ads']
+    >>> index.search("COM.GOOGLE.*")
+    ['com.google.ads', 'com.google.maps']
+    >>> index.search("re:^(org|net)\\\\.")
+    ['org.mozilla.firefox']
+    >>> index.search("re:\\\\S+\\\\.MAPS$")
+    ['com.google.maps']
+    >>> samsung_index = PackageIndex(["com.samsung.app", "samsung.app", "amsung.x"])
+    >>> samsung_index.search("re:^s?amsung"), samsung_index.search("re:^c?om\\\\.samsung")
+    (['amsung.x', 'samsung.app'], ['com.samsung.app'])
+    >>> index.search("go")  # Shorter than a trigram
+    ['com.google.ads', 'com.google.maps']
+    >>> index.search("") is None
+    True
+    """
+
+    def __init__(self, package_names):
+        self.names = sorted(package_names, key=str.lower)
+        self.lower_names = [name.lower() for name in self.names]  # sorted, too
+
+        self.trigram_index = {}  # trigram -> set of positions in self.names
+        for position, name in enumerate(self.lower_names):
+            for trigram in trigrams(name):
+                positions = self.trigram_index.get(trigram)
+                if positions is None:
+                    self.trigram_index[trigram] = {position}
+                else:
+                    positions.add(position)
+
+        # Incremental search: a longer substring only filters the last result
+        self.last_substring = None
+        self.last_positions = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, literals):
+        """
+        Returns the set of positions that contain all trigrams of the literals (or None for all positions)
+        """
+        trigram_sets = []
+        for literal in literals:
+            for trigram in trigrams(literal):
+                positions = self.trigram_index.get(trigram)
+                if positions is None:
+                    return set()
+                trigram_sets.append(positions)
+
+        if not trigram_sets:
+            return None
+
+        # Start with the smallest set, so every intersection is cheap:
+        trigram_sets.sort(key=len)
+        result = set(trigram_sets[0])
+        for positions in trigram_sets[1:]:
+            result &= positions
+            if not result:
+                break
+        return result
+
+    def prefix_range(self, prefix):
+        """
+        Returns the positions of all names that start with the prefix: a binary search in the sorted names.
+        """
+        start = bisect.bisect_left(self.lower_names, prefix)
+        end = bisect.bisect_left(self.lower_names, prefix + "\U0010ffff", lo=start)
+        return range(start, end)
+
+    def search_positions(self, query):
+        """
+        Returns the sorted positions of all matching names (or None if the query is empty)
+        """
+        mode, regex, literals, prefix = parse_query(query)
+        if mode == SUBSTRING and not literals[0]:
+            return None
+
+        if mode == PREFIX:
+            self.last_substring = self.last_positions = None
+            return list(self.prefix_range(prefix))
+
+        substring = literals[0] if mode == SUBSTRING else None
+        if substring and self.last_substring and self.last_substring in substring:
+            candidates = self.last_positions
+        else:
+            candidates = self.candidates(literals)
+            if mode == SUBSTRING and len(substring) == 3:
+                # The trigram set is the exact result:
+                candidates = () if candidates is None else candidates
+                positions = sorted(candidates)
+                self.last_substring, self.last_positions = substring, positions
+                return positions
+
+        if prefix is not None:
+            prefix_range = self.prefix_range(prefix)
+            if candidates is None or len(prefix_range) < len(candidates):
+                candidates = prefix_range
+        if candidates is None:
+            candidates = range(len(self.names))
+
+        lower_names = self.lower_names
+        if mode == SUBSTRING:
+            positions = [position for position in candidates if substring in lower_names[position]]
+        elif mode == SUFFIX:
+            suffix = literals[0]
+            positions = [position for position in candidates if lower_names[position].endswith(suffix)]
+        else:
+            match = regex.match if mode == GLOB else regex.search
+            positions = [position for position in candidates if match(lower_names[position])]
+        positions.sort()
+
+        self.last_substring = substring
+        self.last_positions = positions if substring else None
+        return positions
+
+    def search(self, query):
+        """
+        Returns the sorted names of all matches (or None if the query is empty)
+        """
+        positions = self.search_positions(query)
+        if positions is None:
+            return None
+        return [self.names[position] for position in positions]
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,258 @@
+"""
+    Debloat profiles: Which packages should be uninstalled/disabled.
+
+    A profile is a JSON or TOML file with lists of package names or patterns per action, e.g.:
+
+        name = "my phone"
+        uninstall = ["com.facebook.*"]
+        disable = ["com.samsung.android.bixby.*", "re:com\\.sec\\.android\\.app\\.(sbrowser|shealth)"]
+        keep = ["com.samsung.android.bixby.wakeup"]
+
+    Patterns are exact names, prefixes "foo.*", globs or regular expressions "re:...".
+    An exact package name always wins, otherwise the most specific pattern (the longest
+    literal prefix) wins and on a tie "keep" wins. So "keep" exceptions can be added
+    below a broader uninstall/disable pattern, e.g. "com.foo.keep*" below "com.foo.*".
+    (TOML needs Python 3.11+ or the 'tomli' package)
+
+    The planner compares a profile with the current device state and returns only
+    the needed commands: packages that are already disabled/uninstalled or not
+    installed are skipped. So reapplying a profile costs one state query and no pm command.
+"""
+
+import fnmatch
+import json
+import logging
+import re
+
+from adb_uninstall.adb_inventory import PackageInfo
+from adb_uninstall.rules import literal_prefix
+
+log = logging.getLogger(__name__)
+
+UNINSTALL = "uninstall"
+DISABLE = "disable"
+KEEP = "keep"
+PROFILE_ACTIONS = (UNINSTALL, DISABLE, KEEP)
+
+REGEX_PREFIX = "re:"
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class Profile:
+    """
+    >>> profile = Profile.from_dict({
+    ...     "name": "doctest",
+    ...     "uninstall": ["com.facebook.*"],
+    ...     "disable": ["com.foo.*", "re:com\\\\.bar\\\\d"],
+    ...     "keep": ["com.foo.keep", "com.facebook.keep*", "com.bar?"],
+    ... })
+    >>> for package_name in (
+    ...     "com.facebook.katana", "com.facebook.keeper", "com.foo.app", "com.foo.keep", "com.bar1", "com.bar"
+    ... ):
+    ...     print(package_name, profile.action_for(package_name))
+    com.facebook.katana uninstall
+    com.facebook.keeper keep
+    com.foo.app disable
+    com.foo.keep keep
+    com.bar1 keep
+    com.bar None
+    """
+
+    def __init__(self, *, name=None, origin=None):
+        self.name = name
+        self.origin = origin
+        self.exact = {}  # package name -> action
+        self.patterns = []  # list of (compiled regex, action, pattern)
+        self.match_order = []  # The patterns, most specific first: list of (sort key, compiled regex, action)
+
+    def add(self, pattern, action):
+        if action not in PROFILE_ACTIONS:
+            raise ProfileError("Unknown action %r in %s" % (action, self.origin))
+
+        if pattern.startswith(REGEX_PREFIX):
+            regex = pattern[len(REGEX_PREFIX):]
+            prefix = literal_prefix(regex)
+        elif re.search(r"[*?\[]", pattern):
+            regex = fnmatch.translate(pattern)
+            prefix = re.split(r"[*?\[]", pattern, 1)[0]
+        else:
+            self.exact.setdefault(pattern, action)
+            return
+
+        try:
+            compiled_regex = re.compile(regex)
+        except re.error as err:
+            raise ProfileError("Invalid regex %r in %s: %s" % (pattern, self.origin, err))
+        self.patterns.append((compiled_regex, action, pattern))
+
+        # sort() is stable: Same prefix length and action -> the first entry wins
+        self.match_order.append(((-len(prefix), action != KEEP), compiled_regex, action))
+        self.match_order.sort(key=lambda item: item[0])
+
+    @classmethod
+    def from_dict(cls, data, origin=None):
+        if not isinstance(data, dict):
+            raise ProfileError("Profile %s must be a mapping" % origin)
+
+        profile = cls(name=data.get("name"), origin=origin)
+        for action in PROFILE_ACTIONS:
+            patterns = data.get(action, [])
+            if isinstance(patterns, str) or not isinstance(patterns, list):
+                raise ProfileError("%r in profile %s must be a list" % (action, origin))
+            for pattern in patterns:
+                profile.add(pattern, action)
+        return profile
+
+    def as_dict(self):
+        """
+        Only the exact package names, used to save a selection from the GUI.
+        """
+        data = {"name": self.name}
+        for action in PROFILE_ACTIONS:
+            package_names = sorted(name for name, name_action in self.exact.items() if name_action == action)
+            patterns = [pattern for regex, pattern_action, pattern in self.patterns if pattern_action == action]
+            if package_names or patterns:
+                data[action] = package_names + patterns
+        return data
+
+    def action_for(self, package_name):
+        """
+        Returns the profile action for this package or None.
+        A exact name wins, then the pattern with the longest literal prefix, then "keep".
+        """
+        action = self.exact.get(package_name)
+        if action is not None:
+            return action
+        for sort_key, regex, action in self.match_order:
+            if regex.fullmatch(package_name):
+                return action
+        return None
+
+    def __str__(self):
+        return "%s (%s)" % (self.name or "<unnamed>", self.origin)
+
+
+def load_profile(filepath):
+    """
+    Load a profile from a .json or .toml file.
+    """
+    if filepath.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ProfileError("TOML profiles needs Python 3.11+ or 'pip install tomli'")
+
+        with open(filepath, "rb") as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as err:
+                raise ProfileError("Can't parse %s: %s" % (filepath, err))
+    else:
+        with open(filepath, "r") as f:
+            try:
+                data = json.load(f)
+            except ValueError as err:
+                raise ProfileError("Can't parse %s: %s" % (filepath, err))
+
+    return Profile.from_dict(data, origin=filepath)
+
+
+def save_profile(profile, filepath):
+    """
+    Save as JSON (the standard library can't write TOML)
+    """
+    with open(filepath, "w") as f:
+        json.dump(profile.as_dict(), f, indent=4)
+
+
+class Plan:
+    def __init__(self, profile):
+        self.profile = profile
+        self.actions = {UNINSTALL: [], DISABLE: []}  # action -> package names
+        self.skipped = {}  # package name -> reason
+
+    @property
+    def command_count(self):
+        return sum(len(package_names) for package_names in self.actions.values())
+
+    def as_dict(self):
+        return {
+            "profile": str(self.profile),
+            "actions": self.actions,
+            "skipped": self.skipped,
+            "command_count": self.command_count,
+        }
+
+    def __str__(self):
+        lines = ["Plan for profile %s:" % self.profile]
+        for action, package_names in self.actions.items():
+            for package_name in package_names:
+                lines.append("\t%s %s" % (action, package_name))
+        lines.append("%i commands, %i packages skipped." % (self.command_count, len(self.skipped)))
+        return "\n".join(lines)
+
+
+def plan_profile(profile, infos, rule_set=None):
+    """
+    Compare the profile with the device state (dict: package name -> PackageInfo)
+    and returns a Plan with only the needed commands.
+
+    >>> def info(package_name, state):
+    ...     info = PackageInfo(package_name=package_name)
+    ...     info.state = state
+    ...     return info
+    >>> infos = {
+    ...     "com.foo.a": info("com.foo.a", PackageInfo.ENABLED),
+    ...     "com.foo.b": info("com.foo.b", PackageInfo.DISABLED),
+    ...     "com.foo.c": info("com.foo.c", PackageInfo.UNINSTALLED),
+    ...     "com.bar": info("com.bar", PackageInfo.DISABLED),
+    ... }
+    >>> profile = Profile.from_dict({"disable": ["com.foo.*"], "uninstall": ["com.bar", "com.gone"]})
+    >>> plan = plan_profile(profile, infos)
+    >>> print(plan.actions)
+    {'uninstall': ['com.bar'], 'disable': ['com.foo.a']}
+    >>> for package_name, reason in sorted(plan.skipped.items()):
+    ...     print(package_name, reason)
+    com.foo.b already disabled
+    com.foo.c already uninstalled
+    com.gone not installed
+    """
+    plan = Plan(profile)
+
+    # The exact names of the profile that are not on the device:
+    for package_name, action in profile.exact.items():
+        if action != KEEP and package_name not in infos:
+            plan.skipped[package_name] = "not installed"
+
+    for package_name in sorted(infos):
+        action = profile.action_for(package_name)
+        if action is None or action == KEEP:
+            continue
+
+        if rule_set is not None:
+            rule = rule_set.classify(package_name)
+            if rule is not None and rule.locked:
+                plan.skipped[package_name] = "locked by rule: %s" % rule
+                continue
+
+        state = infos[package_name].state
+        if state == PackageInfo.UNINSTALLED:
+            plan.skipped[package_name] = "already uninstalled"
+        elif action == DISABLE and state == PackageInfo.DISABLED:
+            plan.skipped[package_name] = "already disabled"
+        else:
+            plan.actions[action].append(package_name)
+
+    return plan
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -0,0 +1,332 @@
+"""
+    Rules for locked / protected packages.
+
+    Rules are loaded from the built-in LOCKED_APPS and from external rule files.
+    A rule file contains one rule per line: "<severity> <pattern>", e.g.:
+
+        # comments and empty lines are ignored
+        locked              com.android.phone
+        warn                com.samsung.android.*       # prefix
+        recommended-remove  com.facebook.*
+        warn                re:com\\.sec\\..+\\.provider  # regular expression
+        locked              com.google.android.?ms      # glob pattern
+
+    All rules are compiled into one dict for the exact names and one trie for the
+    prefixes. Regex and glob rules are attached to the trie node of their literal
+    prefix, so only the few regexes along the path of a name must be tried.
+    Regexes without a literal prefix are combined into one regex, that rejects
+    most names with one match; only for a match they are tried one by one.
+    So every package name is classified in one pass over its chars.
+
+    A 'locked' rule always wins. Otherwise the most specific rule wins:
+    the exact name, then the longest literal prefix (on a tie: a prefix rule
+    before a regex/glob rule), then the first added rule.
+"""
+
+import fnmatch
+import glob
+import logging
+import os
+import re
+
+from adb_uninstall.constants import LOCKED_APPS, RULES_ENV_NAME, RULES_PATHS
+
+log = logging.getLogger(__name__)
+
+LOCKED = "locked"
+WARN = "warn"
+RECOMMENDED_REMOVE = "recommended-remove"
+SEVERITIES = (LOCKED, WARN, RECOMMENDED_REMOVE)
+
+REGEX_PREFIX = "re:"
+
+# Trie node keys: None is never a char -> end of a prefix rule, "" is never a char -> regex rules
+TRIE_PREFIX_KEY = None
+TRIE_REGEX_KEY = ""
+
+COMMENT_RE = re.compile(r"(?:^|\s)#")
+
+
+def literal_prefix(regex):
+    """
+    Returns the literal prefix of a regex, that every match must start with.
+    A alternation may start with any branch, so it has no common prefix.
+
+    >>> literal_prefix(r"com\\.sec\\..+\\.provider")
+    'com.sec.'
+    >>> literal_prefix(r"com\\.fooX?bar")
+    'com.foo'
+    >>> literal_prefix(r"(com|org)\\.foo")
+    ''
+    >>> literal_prefix(r"com\\.foo|org\\.bar")
+    ''
+    """
+    if "|" in regex:
+        return ""
+
+    prefix = []
+    pos = 0
+    while pos < len(regex):
+        char = regex[pos]
+        if char == "\\" and pos + 1 < len(regex) and not regex[pos + 1].isalnum():
+            literal, pos = regex[pos + 1], pos + 2
+        elif char.isalnum() or char in "_-":
+            literal, pos = char, pos + 1
+        else:
+            break
+
+        if pos < len(regex) and regex[pos] in "*?{":
+            break  # The literal is optional/repeated
+        if pos < len(regex) and regex[pos] == "+":
+            prefix.append(literal)
+            break
+        prefix.append(literal)
+
+    return "".join(prefix)
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule:
+    def __init__(self, *, severity, pattern, origin=None):
+        if severity not in SEVERITIES:
+            raise RuleError(
+                "Unknown severity %r in %s (must be one of: %s)" % (severity, origin, ", ".join(SEVERITIES))
+            )
+        self.severity = severity
+        self.pattern = pattern
+        self.origin = origin
+
+    @property
+    def locked(self):
+        return self.severity == LOCKED
+
+    def __str__(self):
+        return "%s %s" % (self.severity, self.pattern)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+class RuleSet:
+    """
+    >>> rule_set = RuleSet()
+    >>> rule_set.add_lines([
+    ...     "locked com.android.phone",
+    ...     "warn com.samsung.android.*",
+    ...     "recommended-remove com.samsung.android.bixby.*",
+    ...     "locked com.samsung.android.bixby.core",
+    ...     "warn re:com\\\\.sec\\\\..+\\\\.provider",
+    ... ], origin="doctest")
+    >>> for package_name in (
+    ...     "com.android.phone", "com.android.phone.foo", "com.samsung.android.foo",
+    ...     "com.samsung.android.bixby.agent", "com.samsung.android.bixby.core", "com.sec.foo.provider",
+    ... ):
+    ...     print(package_name, rule_set.classify(package_name))
+    com.android.phone locked com.android.phone
+    com.android.phone.foo None
+    com.samsung.android.foo warn com.samsung.android.*
+    com.samsung.android.bixby.agent recommended-remove com.samsung.android.bixby.*
+    com.samsung.android.bixby.core locked com.samsung.android.bixby.core
+    com.sec.foo.provider warn re:com\\.sec\\..+\\.provider
+
+    A locked rule wins, also if a other pattern matched before. Otherwise the longest literal prefix wins:
+    >>> rule_set = RuleSet()
+    >>> rule_set.add_lines([
+    ...     "recommended-remove com.foo.b?r.gms",
+    ...     "locked com.foo.bar.g?s",
+    ...     "recommended-remove re:.*\\\\.gms",
+    ...     "locked re:(com|org)\\\\.foo\\\\.gms",
+    ...     "warn com.foo.*",
+    ...     "recommended-remove re:com\\\\.foo\\\\.baz.*",
+    ...     "warn re:com\\\\.foo#\\\\d+  # '#' in a pattern is not a comment",
+    ... ], origin="doctest")
+    >>> for package_name in ("com.foo.bar.gms", "com.foo.gms", "com.foo.bazz", "com.foo.x", "com.foo#1"):
+    ...     print(package_name, rule_set.classify(package_name))
+    com.foo.bar.gms locked com.foo.bar.g?s
+    com.foo.gms locked re:(com|org)\\.foo\\.gms
+    com.foo.bazz recommended-remove re:com\\.foo\\.baz.*
+    com.foo.x warn com.foo.*
+    com.foo#1 warn re:com\\.foo#\\d+
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.exact = {}
+        self.trie = {}
+        self.unprefixed = []  # list of (compiled regex, Rule) without a literal prefix
+        self.regex = None  # All 'unprefixed' regexes combined
+        self.regex_parts = []
+
+    def add(self, rule):
+        pattern = rule.pattern
+        if pattern.startswith(REGEX_PREFIX):
+            regex = pattern[len(REGEX_PREFIX):]
+            self._add_regex(regex, literal_prefix(regex), rule)
+        elif pattern.endswith("*") and not re.search(r"[*?\[]", pattern[:-1]):
+            self._trie_node(pattern[:-1])[TRIE_PREFIX_KEY] = rule
+        elif re.search(r"[*?\[]", pattern):
+            prefix = re.split(r"[*?\[]", pattern, 1)[0]
+            self._add_regex(fnmatch.translate(pattern), prefix, rule)
+        else:
+            self.exact[pattern] = rule
+
+        self.rules.append(rule)
+
+    def _trie_node(self, prefix):
+        node = self.trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        return node
+
+    def _add_regex(self, regex, prefix, rule):
+        try:
+            compiled_regex = re.compile(regex)
+        except re.error as err:
+            raise RuleError("Invalid regex %r in %s: %s" % (regex, rule.origin, err))
+
+        if prefix:
+            self._trie_node(prefix).setdefault(TRIE_REGEX_KEY, []).append((compiled_regex, rule))
+        else:
+            self.unprefixed.append((compiled_regex, rule))
+            self.regex_parts.append("(?:%s)" % regex)
+            self.regex = None  # recompile on next use
+
+    def add_lines(self, lines, origin):
+        for line_no, line in enumerate(lines, 1):
+            # A comment starts the line or follows a whitespace: '#' in a pattern is kept
+            line = COMMENT_RE.split(line, 1)[0].strip()
+            if not line:
+                continue
+            try:
+                severity, pattern = line.split()
+            except ValueError:
+                raise RuleError("Invalid rule line %r in %s line %i" % (line, origin, line_no))
+
+            self.add(Rule(severity=severity, pattern=pattern, origin="%s:%i" % (origin, line_no)))
+
+    def load_file(self, filepath):
+        log.debug("Load rules from: %s", filepath)
+        with open(filepath, "r") as f:
+            self.add_lines(f, origin=filepath)
+
+    def _match_trie(self, package_name):
+        """
+        Returns all prefix and regex rules along the trie path as a list of
+        (literal prefix length, is prefix rule, Rule)
+        """
+        matches = []
+        node = self.trie
+        for length, char in enumerate(package_name, 1):
+            node = node.get(char)
+            if node is None:
+                break
+
+            rule = node.get(TRIE_PREFIX_KEY)
+            if rule is not None:
+                matches.append((length, True, rule))
+
+            for compiled_regex, rule in node.get(TRIE_REGEX_KEY, ()):
+                if compiled_regex.fullmatch(package_name):
+                    matches.append((length, False, rule))
+
+        return matches
+
+    def _match_regex(self, package_name):
+        """
+        Returns all matching rules without a literal prefix, like _match_trie()
+        """
+        if not self.unprefixed:
+            return []
+
+        if self.regex is None:
+            self.regex = re.compile("|".join(self.regex_parts))
+
+        if self.regex.fullmatch(package_name) is None:
+            return []
+        return [
+            (0, False, rule) for compiled_regex, rule in self.unprefixed if compiled_regex.fullmatch(package_name)
+        ]
+
+    def classify(self, package_name):
+        """
+        Returns the Rule for the package name or None
+        """
+        exact_rule = self.exact.get(package_name)
+        if exact_rule is not None and exact_rule.locked:
+            return exact_rule
+
+        matches = self._match_trie(package_name) + self._match_regex(package_name)
+        locked_matches = [match for match in matches if match[2].locked]
+        if locked_matches:
+            matches = locked_matches
+        elif exact_rule is not None:
+            return exact_rule
+        elif not matches:
+            return None
+
+        # max() returns the first of equal matches: the first added rule
+        length, is_prefix, rule = max(matches, key=lambda match: match[:2])
+        return rule
+
+    def classify_all(self, package_names):
+        """
+        Returns a dict with package name -> Rule (only packages with a rule)
+        """
+        result = {}
+        for package_name in package_names:
+            rule = self.classify(package_name)
+            if rule is not None:
+                result[package_name] = rule
+        return result
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def iter_rule_files():
+    """
+    Yields all rule files from RULES_PATHS and the paths in the environment variable RULES_ENV_NAME.
+    A path can be a file or a directory with *.rules files.
+    """
+    paths = list(RULES_PATHS)
+    env_paths = os.environ.get(RULES_ENV_NAME)
+    if env_paths:
+        paths += env_paths.split(os.pathsep)
+
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "*.rules")))
+        elif os.path.isfile(path):
+            yield path
+
+
+def load_rules():
+    rule_set = RuleSet()
+    rule_set.add_lines(("%s %s" % (LOCKED, package_name) for package_name in LOCKED_APPS), origin="LOCKED_APPS")
+    for filepath in iter_rule_files():
+        rule_set.load_file(filepath)
+    log.info("%i package rules loaded.", len(rule_set))
+    return rule_set
+
+
+_RULES = None
+
+
+def get_rules():
+    """
+    Returns the RuleSet, loaded lazy on the first call.
+    """
+    global _RULES
+    if _RULES is None:
+        _RULES = load_rules()
+    return _RULES
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
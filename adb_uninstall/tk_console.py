@@ -0,0 +1,121 @@
+import collections
+import logging
+import os
+import threading
+import tkinter as tk
+from logging.handlers import RotatingFileHandler
+from tkinter.scrolledtext import ScrolledText
+
+log = logging.getLogger(__name__)
+
+CONSOLE_MAX_LINES = 5000
+CONSOLE_FLUSH_INTERVAL = 33  # ms, ~30 frames per second
+
+CONSOLE_LOG_MAX_BYTES = 1024 * 1024
+CONSOLE_LOG_BACKUP_COUNT = 3
+
+
+class TkConsole(ScrolledText):
+    """
+    A ScrolledText for output of many small writes.
+
+    write() can be called from any thread: The text is only buffered.
+    The buffer is flushed into the widget at most once per 'flush_interval'
+    with one insert() and one see() call, independent of the number of writes.
+
+    Only the last 'max_lines' lines are kept: Old lines are deleted in bulk,
+    if the widget contains 10% more lines.
+    All output can be mirrored to a rotating log file.
+    """
+
+    def __init__(
+        self, master, *, max_lines=CONSOLE_MAX_LINES, flush_interval=CONSOLE_FLUSH_INTERVAL, log_filepath=None, **kwargs
+    ):
+        super().__init__(master, **kwargs)
+        self.max_lines = max_lines
+        self.trim_lines = max(1, max_lines // 10)
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.line_count = 1  # A empty Text widget has one line
+
+        self.file_logger = None
+        if log_filepath:
+            self.file_logger = self._create_file_logger(log_filepath)
+
+        self.after_id = self.after(self.flush_interval, self._poll)
+
+    def _create_file_logger(self, log_filepath):
+        log_filepath = os.path.expanduser(log_filepath)
+        try:
+            os.makedirs(os.path.dirname(log_filepath), exist_ok=True)
+            handler = RotatingFileHandler(
+                log_filepath, maxBytes=CONSOLE_LOG_MAX_BYTES, backupCount=CONSOLE_LOG_BACKUP_COUNT
+            )
+        except OSError as err:
+            log.error("Can't create console log file %r: %s", log_filepath, err)
+            return None
+
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        file_logger = logging.getLogger("%s.file" % __name__)
+        file_logger.propagate = False
+        file_logger.setLevel(logging.INFO)
+        file_logger.addHandler(handler)
+        log.info("Mirror console output to: %s", log_filepath)
+        return file_logger
+
+    def write(self, text):
+        """
+        Thread safe: Buffer the text for the next flush.
+        """
+        with self.lock:
+            self.pending.append(text)
+
+    def _poll(self):
+        self.flush()
+        self.after_id = self.after(self.flush_interval, self._poll)
+
+    def flush(self):
+        """
+        Insert all buffered text. Must be called from the Tk main loop.
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            text = "".join(self.pending)
+            self.pending.clear()
+
+        if self.file_logger is not None:
+            self.file_logger.info(text.rstrip("\n"))
+
+        new_lines = text.count("\n")
+        if new_lines > self.max_lines:
+            # Don't insert lines that would be trimmed at once:
+            text = "\n".join(text.split("\n")[-(self.max_lines + 1):])
+            new_lines = text.count("\n")
+
+        self.insert(tk.END, text)
+        self.line_count += new_lines
+
+        if self.line_count > self.max_lines + self.trim_lines:
+            # Delete the old lines in one call:
+            delete_count = self.line_count - self.max_lines
+            self.delete("1.0", "%i.0" % (delete_count + 1))
+            self.line_count -= delete_count
+
+        self.see(tk.END)
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+        self.delete("1.0", tk.END)
+        self.line_count = 1
+
+    def destroy(self):
+        self.after_cancel(self.after_id)
+        if self.file_logger is not None:
+            for handler in list(self.file_logger.handlers):
+                handler.close()
+                self.file_logger.removeHandler(handler)
+        super().destroy()
@@ -0,0 +1,161 @@
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+from adb_uninstall.adb_package import Package
+from adb_uninstall.namespace_tree import NamespaceTree
+
+log = logging.getLogger(__name__)
+
+# iid suffix of the placeholder child, that makes a not materialized node expandable:
+PLACEHOLDER_SUFFIX = " (placeholder)"
+
+
+class NamespaceView(ttk.Frame):
+    """
+    Shows a NamespaceTree in a Treeview: Only the children of opened nodes are Treeview items.
+    The item id of a node is its dotted path.
+    'on_action_change' is called with the list of changed packages.
+    """
+
+    def __init__(self, parent, adb_packages, on_action_change=None, tags=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.adb_packages = adb_packages
+        self.on_action_change = on_action_change
+        self.namespace_tree = NamespaceTree()
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self, columns=("Action", "Packages", "Keep", "Remove", "Locked"))
+        self.tree.heading("#0", text="Namespace")
+        for column in ("Action", "Packages", "Keep", "Remove", "Locked"):
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=70, stretch=False, anchor=tk.CENTER)
+        for tag, config in (tags or {}).items():
+            self.tree.tag_configure(tag, **config)
+
+        self.scrollbar_y = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.scrollbar_y.set)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        self.scrollbar_y.grid(row=0, column=1, sticky=tk.NS)
+
+        self.tree.bind("<<TreeviewOpen>>", self._open)
+        self.tree.bind("<Double-1>", self._toggle_package)
+
+    def rebuild(self):
+        """
+        Build the prefix tree of all packages and show only the top level nodes.
+        """
+        self.namespace_tree = NamespaceTree(self.adb_packages.name2package.values())
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self._insert_children(self.namespace_tree.root)
+
+    ###########################################################################
+    # rendering
+
+    def _values(self, node):
+        action = "" if node.package is None else node.package.action
+        return (
+            action,
+            node.total,
+            node.counts[Package.KEEP],
+            node.counts[Package.REMOVE],
+            node.counts[Package.LOCKED],
+        )
+
+    def _tag(self, node):
+        if node.package is not None:
+            return node.package.action
+        if node.counts[Package.REMOVE]:
+            return Package.REMOVE
+        return Package.KEEP
+
+    def _insert_children(self, node):
+        parent_iid = node.path
+        for child in node.sorted_children():
+            self.tree.insert(
+                parent_iid, tk.END, iid=child.path, text=child.name,
+                values=self._values(child), tags=(self._tag(child),)
+            )
+            if child.children:
+                self.tree.insert(child.path, tk.END, iid=child.path + PLACEHOLDER_SUFFIX, text="...")
+
+    def _open(self, event=None):
+        iid = self.tree.focus()
+        placeholder = iid + PLACEHOLDER_SUFFIX
+        if not self.tree.exists(placeholder):
+            return  # Already materialized
+        self.tree.delete(placeholder)
+        self._insert_children(self.namespace_tree.node(iid))
+
+    def refresh_nodes(self, nodes):
+        """
+        Update the given nodes, if they are materialized.
+        """
+        for node in nodes:
+            if node.path and self.tree.exists(node.path):
+                self.tree.item(node.path, values=self._values(node), tags=(self._tag(node),))
+
+    def refresh_subtree(self, node):
+        """
+        Update all materialized nodes of the subtree and all ancestors.
+        """
+        iids = [node.path] if node.path else []
+        stack = list(self.tree.get_children(node.path))
+        while stack:
+            iid = stack.pop()
+            if not iid.endswith(PLACEHOLDER_SUFFIX):
+                iids.append(iid)
+                stack.extend(self.tree.get_children(iid))
+        nodes = [self.namespace_tree.node(iid) for iid in iids]
+        self.refresh_nodes(nodes + list(node.ancestors()))
+
+    ###########################################################################
+    # actions
+
+    def packages_changed(self, packages):
+        """
+        The actions of these packages were changed outside, e.g.: in the package table: O(depth) per package
+        """
+        for package in packages:
+            if package.package_name in self.namespace_tree.package_nodes:
+                self.refresh_nodes(self.namespace_tree.update(package))
+
+    def selected_node(self):
+        iid = self.tree.focus()
+        if not iid or iid.endswith(PLACEHOLDER_SUFFIX):
+            return None
+        return self.namespace_tree.node(iid)
+
+    def set_subtree_action(self, action):
+        """
+        Set keep/remove for all packages below the selected node in one bulk operation.
+        Returns the changed packages (or None if no node is selected)
+        """
+        node = self.selected_node()
+        if node is None:
+            return None
+        changed = self.namespace_tree.set_subtree_action(node, self.adb_packages, action)
+        self.refresh_subtree(node)
+        if changed and self.on_action_change is not None:
+            self.on_action_change(changed)
+        return changed
+
+    def _toggle_package(self, event):
+        node = self.selected_node()
+        if node is None or node.package is None:
+            return
+        package = node.package
+        if package.locked:
+            print("ignore locked app")
+            return
+        if package.keep:
+            package.set_remove()
+        else:
+            package.set_keep()
+        self.refresh_nodes(self.namespace_tree.update(package))
+        if self.on_action_change is not None:
+            self.on_action_change([package])
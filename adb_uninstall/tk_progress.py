@@ -0,0 +1,67 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class BatchProgressBar(ttk.Frame):
+    """
+    Progress of a running BatchExecutor with pause/resume and cancel buttons.
+    Hidden if no batch is running. All methods must be called from the Tk main loop.
+    """
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.executor = None
+
+        self.columnconfigure(1, weight=1)
+
+        self.title_label = ttk.Label(self)
+        self.title_label.grid(row=0, column=0, padx=5)
+
+        self.progress_bar = ttk.Progressbar(self, orient=tk.HORIZONTAL, mode="determinate", maximum=100)
+        self.progress_bar.grid(row=0, column=1, sticky=tk.EW, padx=5)
+
+        self.info_label = ttk.Label(self, width=60)
+        self.info_label.grid(row=0, column=2, padx=5)
+
+        self.pause_button = ttk.Button(self, text="pause", command=self.toggle_pause)
+        self.pause_button.grid(row=0, column=3, padx=5)
+
+        self.cancel_button = ttk.Button(self, text="cancel", command=self.cancel)
+        self.cancel_button.grid(row=0, column=4, padx=5)
+
+    def start(self, executor, title):
+        self.executor = executor
+        self.title_label.config(text=title)
+        self.progress_bar.config(value=0)
+        self.info_label.config(text="start...")
+        self.pause_button.config(text="pause", state=tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.grid()
+
+    def update_progress(self, progress):
+        self.progress_bar.config(value=progress.percent)
+        self.info_label.config(text=str(progress))
+
+    def toggle_pause(self):
+        if self.executor is None:
+            return
+        if self.executor.paused:
+            self.executor.resume()
+            self.pause_button.config(text="pause")
+            self.info_label.config(text="resume...")
+        else:
+            self.executor.pause()
+            self.pause_button.config(text="resume")
+            self.info_label.config(text="pause after the current chunk...")
+
+    def cancel(self):
+        if self.executor is None:
+            return
+        self.executor.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.info_label.config(text="cancel after the current chunk...")
+
+    def finish(self):
+        self.executor = None
+        self.grid_remove()
@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+
+    def __init__(self, *, name, func, args, on_done, on_error):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.state = self.QUEUED
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """
+        A queued task will never run, a running task can stop at the next check_cancelled() call.
+        """
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.state = self.CANCELLED
+
+    def __str__(self):
+        return "%s (%s)" % (self.name, self.state)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.__str__())
+
+
+class TaskRunner:
+    """
+    Run functions in worker threads and hand over the results to the Tk main loop.
+
+    Worker threads must never touch Tk widgets: They use call_in_main() and the
+    main loop drains the queue with after(), but only for 'max_poll_time' per tick,
+    so the GUI stays responsive even if the workers produce a lot of updates.
+    """
+
+    def __init__(self, root, *, max_workers=1, poll_interval=16, max_poll_time=0.008, on_busy_change=None):
+        self.root = root
+        self.poll_interval = poll_interval  # ms
+        self.max_poll_time = max_poll_time  # sec
+        self.on_busy_change = on_busy_change
+
+        self.main_thread = threading.current_thread()
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task")
+        self.local = threading.local()
+        self.tasks = []
+        self.busy = False
+
+        self.after_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, func, *args, on_done=None, on_error=None, name=None):
+        """
+        Run func(*args) in a worker thread.
+        on_done(result) / on_error(exception) will be called in the Tk main loop.
+        """
+        task = Task(name=name or func.__name__, func=func, args=args, on_done=on_done, on_error=on_error)
+        self.tasks.append(task)
+        task.future = self.executor.submit(self._run, task)
+        self._update_busy()
+        return task
+
+    def _run(self, task):
+        if task.cancel_event.is_set():
+            task.state = Task.CANCELLED
+            return
+
+        self.local.task = task
+        task.state = Task.RUNNING
+        log.debug("Start task: %s", task)
+        try:
+            result = task.func(*task.args)
+        except TaskCancelled:
+            task.state = Task.CANCELLED
+            self.call_in_main(log.info, "Task %s cancelled", task.name)
+        except Exception as err:
+            task.state = Task.ERROR
+            log.exception("Task %s failed", task.name)
+            if task.on_error is not None:
+                self.call_in_main(task.on_error, err)
+        else:
+            task.state = Task.DONE
+            if task.on_done is not None:
+                self.call_in_main(task.on_done, result)
+        finally:
+            self.local.task = None
+
+    def current_task(self):
+        return getattr(self.local, "task", None)
+
+    def check_cancelled(self):
+        """
+        Call this in the worker between the steps of a long running task.
+        """
+        task = self.current_task()
+        if task is not None and task.cancel_event.is_set():
+            raise TaskCancelled(task.name)
+
+    def is_cancelled(self):
+        task = self.current_task()
+        return task is not None and task.cancel_event.is_set()
+
+    def call_in_main(self, func, *args):
+        """
+        Call func(*args) in the Tk main loop. Direct call, if we are in the main thread.
+        """
+        if threading.current_thread() is self.main_thread:
+            func(*args)
+        else:
+            self.queue.put((func, args))
+
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+        self._update_busy()
+
+    def _update_busy(self):
+        self.tasks = [task for task in self.tasks if not (task.future and task.future.done())]
+        busy = bool(self.tasks)
+        if busy != self.busy:
+            self.busy = busy
+            if self.on_busy_change is not None:
+                self.on_busy_change(busy)
+
+    def _poll(self):
+        deadline = time.monotonic() + self.max_poll_time
+        while time.monotonic() < deadline:
+            try:
+                func, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception:
+                log.exception("Error in main loop call %r", func)
+
+        if self.queue.empty():
+            # Call on_busy_change() after all results are processed:
+            self._update_busy()
+
+        self.after_id = self.root.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        self.root.after_cancel(self.after_id)
+        for task in self.tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,263 @@
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ROW_HEIGHT = 20  # pixel, used until the real height can be measured
+
+
+def sort_key(value):
+    """
+    Sort key for column values of mixed types, e.g.: None, numbers and text
+
+    >>> sorted([None, "b", 10, "a", 2], key=sort_key)
+    [2, 10, 'a', 'b', None]
+    """
+    if value is None:
+        return (2, 0, "")
+    if isinstance(value, (int, float)):
+        return (0, value, "")
+    return (1, 0, str(value))
+
+
+class VirtualTreeview(ttk.Frame):
+    """
+    A Treeview that materialize only the visible rows.
+
+    The data is a plain list of row objects. The Treeview contains only as many
+    items ("slots") as rows are visible. Scrolling just changes the offset and
+    updates the text/values/tag of the slots, so inserting, sorting and
+    filtering is independent of the widget and costs no Tk calls per row.
+
+    filter_rows() shows only a subset of the rows: 'all_rows' are all rows in sort order,
+    'rows' are the shown rows (the same list, if no filter is set).
+
+    get_values(row) -> (text, value1, value2, ...)
+    get_sort_values(row) -> like get_values(), but e.g. numbers instead of formatted text (default: get_values)
+    get_tag(row) -> tag name, configured with the 'tags' dict: {tag name: tag_configure kwargs}
+    call_back(row, column) is called on a click
+    """
+
+    def __init__(self, *, parent, columns, get_values, get_tag, call_back, tags=None, get_sort_values=None, **kwargs):
+        self.parent = parent
+        self.columns = columns
+        self.get_values = get_values
+        self.get_sort_values = get_sort_values or get_values
+        self.get_tag = get_tag
+        self.call_back = call_back
+        super().__init__(parent, **kwargs)
+
+        self.all_rows = []
+        self.rows = self.all_rows
+        self.row_filter = None  # None or the set of id() of the shown rows
+        self.positions = None  # Cache: id(row) -> index in self.all_rows
+        self.offset = 0
+        self.slots = []
+        self.row_height = DEFAULT_ROW_HEIGHT
+        self.sort_column = None
+        self.sort_reverse = False
+
+        self.tree = ttk.Treeview(self, columns=columns[1:], selectmode=tk.NONE)
+        for no, column in enumerate(columns):
+            self.tree.column("#%i" % no, stretch=True, anchor=tk.CENTER)
+            self.tree.heading("#%i" % no, text=column, command=lambda no=no: self.sort_by_column(no))
+
+        for tag, config in (tags or {}).items():
+            self.tree.tag_configure(tag, **config)
+
+        self.scrollbar_x = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.scrollbar_y = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.tree.configure(xscrollcommand=self.scrollbar_x.set)
+
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        self.scrollbar_x.grid(row=1, column=0, sticky=tk.EW)
+        self.scrollbar_y.grid(row=0, column=1, sticky=tk.NS)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.tree.bind("<ButtonRelease-1>", self._call_back)
+        self.tree.bind("<Configure>", self._resize)
+        self.tree.bind("<MouseWheel>", self._mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", lambda event: self.scroll(-1))
+        self.tree.bind("<Down>", lambda event: self.scroll(1))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-len(self.slots)))
+        self.tree.bind("<Next>", lambda event: self.scroll(len(self.slots)))
+
+        self._set_slot_count(1)
+
+    ###########################################################################
+    # data
+
+    def _apply_filter(self):
+        self.positions = None
+        if self.row_filter is None:
+            self.rows = self.all_rows
+        else:
+            self.rows = [row for row in self.all_rows if id(row) in self.row_filter]
+
+    def set_rows(self, rows):
+        self.all_rows = list(rows)
+        self._apply_filter()
+        self.offset = 0
+        self.refresh()
+
+    def append_rows(self, rows):
+        """
+        Bulk insert: Only the visible slots will be touched.
+        New rows are hidden, while a filter is set.
+        """
+        self.positions = None
+        old_count = len(self.rows)
+        self.all_rows.extend(rows)
+        if self.row_filter is not None:
+            return
+        if old_count < self.offset + len(self.slots):
+            self.refresh()
+        else:
+            self._update_scrollbar()
+
+    def remove_rows(self, rows):
+        rows = set(id(row) for row in rows)
+        self.all_rows = [row for row in self.all_rows if id(row) not in rows]
+        if self.row_filter is not None:
+            self.row_filter -= rows
+        self._apply_filter()
+        self.refresh()
+
+    def clear(self):
+        self.row_filter = None
+        self.set_rows([])
+
+    def filter_rows(self, rows):
+        """
+        Show only the given rows (in the current sort order) or all rows if 'rows' is None.
+        Costs O(m log m) for m shown rows: all rows are only touched on the first call after a change.
+        """
+        if rows is None:
+            self.row_filter = None
+            self.rows = self.all_rows
+        else:
+            if self.positions is None:
+                self.positions = {id(row): index for index, row in enumerate(self.all_rows)}
+            positions = self.positions
+            self.rows = sorted(rows, key=lambda row: positions[id(row)])
+            self.row_filter = set(id(row) for row in self.rows)
+        self.offset = 0
+        self.refresh()
+
+    def sort(self, key, reverse=False):
+        self.all_rows.sort(key=key, reverse=reverse)
+        self._apply_filter()
+        self.refresh()
+
+    def sort_by_column(self, no):
+        if self.sort_column == no:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = no
+            self.sort_reverse = False
+        self.sort(key=lambda row: sort_key(self.get_sort_values(row)[no]), reverse=self.sort_reverse)
+
+    ###########################################################################
+    # rendering
+
+    def _set_slot_count(self, count):
+        while len(self.slots) < count:
+            slot = "slot_%i" % len(self.slots)
+            self.tree.insert("", tk.END, iid=slot, text="")
+            self.slots.append(slot)
+        while len(self.slots) > count:
+            self.tree.delete(self.slots.pop())
+
+    def _measure_row_height(self):
+        bbox = self.tree.bbox(self.slots[0])
+        if bbox:
+            self.row_height = bbox[3]
+
+    def _resize(self, event=None):
+        self._measure_row_height()
+        height = self.tree.winfo_height()
+        count = max(1, height // self.row_height)  # The heading needs one row, the last one is a partial one
+        if count != len(self.slots):
+            self._set_slot_count(count)
+            self.refresh()
+
+    def refresh(self):
+        """
+        Update all visible slots from the data.
+        """
+        max_offset = max(0, len(self.rows) - len(self.slots) + 1)
+        self.offset = max(0, min(self.offset, max_offset))
+
+        for no, slot in enumerate(self.slots):
+            index = self.offset + no
+            if index < len(self.rows):
+                row = self.rows[index]
+                values = self.get_values(row)
+                self.tree.item(slot, text=values[0], values=values[1:], tags=(self.get_tag(row),))
+            else:
+                self.tree.item(slot, text="", values=(), tags=())
+
+        self._update_scrollbar()
+
+    def refresh_row(self, row):
+        """
+        Update the slot of one row, if it's visible.
+        """
+        for no, slot in enumerate(self.slots):
+            index = self.offset + no
+            if index < len(self.rows) and self.rows[index] is row:
+                values = self.get_values(row)
+                self.tree.item(slot, text=values[0], values=values[1:], tags=(self.get_tag(row),))
+                return
+
+    def _update_scrollbar(self):
+        if not self.rows:
+            self.scrollbar_y.set(0, 1)
+            return
+        count = len(self.rows)
+        self.scrollbar_y.set(self.offset / count, min(1, (self.offset + len(self.slots)) / count))
+
+    ###########################################################################
+    # scrolling
+
+    def scroll(self, count):
+        self.offset += count
+        self.refresh()
+        return "break"
+
+    def yview(self, *args):
+        if args[0] == tk.MOVETO:
+            self.offset = int(float(args[1]) * len(self.rows))
+            self.refresh()
+        elif args[0] == tk.SCROLL:
+            count = int(args[1])
+            if args[2] == tk.PAGES:
+                count *= len(self.slots) - 1
+            self.scroll(count)
+
+    def _mouse_wheel(self, event):
+        if abs(event.delta) >= 120:  # Windows
+            return self.scroll(-event.delta // 40)
+        return self.scroll(-event.delta)  # macOS
+
+    ###########################################################################
+
+    def _call_back(self, event):
+        if self.tree.identify_region(event.x, event.y) not in ("cell", "tree"):
+            return  # e.g. click on the heading
+
+        slot = self.tree.identify_row(event.y)
+        if not slot:
+            return
+
+        index = self.offset + int(slot[5:])  # slot id is "slot_<no>"
+        if index >= len(self.rows):
+            return
+
+        column = self.tree.identify_column(event.x)
+        self.call_back(self.rows[index], column)
@@ -0,0 +1,272 @@
+"""
+    Offline tracker database: Which trackers Exodus Privacy found in which package.
+
+    A dump file (JSON, optional gzip compressed) is imported once into a local
+    SQLite index, keyed by package name. The index is opened lazily on the first
+    lookup and the tracker names are loaded once, so the lookup of a whole device
+    inventory are a few 'IN (...)' queries: no network access is needed.
+
+    The dump is a JSON object like the Exodus Privacy API returns it, e.g.:
+
+        {
+            "trackers": {"70": {"name": "Facebook Ads"}, "105": {"name": "Google Firebase Analytics"}},
+            "applications": [
+                {"handle": "com.foo", "reports": [{"version_code": "12", "trackers": [70, 105]}]},
+                {"handle": "com.bar", "trackers": ["Some Tracker"]}
+            ]
+        }
+
+    "applications" may be a list or a dict with the package name as key.
+    Per package the report with the highest version code is used. A tracker is a id
+    from "trackers", a name or a object with "name".
+"""
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+import urllib.parse
+
+from adb_uninstall.constants import TRACKER_DB_PATH
+
+log = logging.getLogger(__name__)
+
+# SQLite limits the number of query parameters (999 in old versions):
+LOOKUP_CHUNK_SIZE = 500
+
+SCHEMA = (
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE trackers (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    # The tracker ids of a package, comma separated:
+    "CREATE TABLE packages (package TEXT PRIMARY KEY, trackers TEXT NOT NULL) WITHOUT ROWID",
+)
+
+
+class TrackerDBError(ValueError):
+    pass
+
+
+def _version_code(report):
+    try:
+        return int(report.get("version_code") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_dump(data):
+    """
+    Returns the tracker names (id -> name) and the tracker ids per package (package name -> list of ids)
+
+    >>> tracker_names, packages = parse_dump({
+    ...     "trackers": {"70": {"name": "Facebook Ads"}, "105": {"name": "Google Firebase Analytics"}},
+    ...     "applications": [
+    ...         {"handle": "com.foo", "reports": [
+    ...             {"version_code": "12", "trackers": [70, 105]},
+    ...             {"version_code": "9", "trackers": [70]},
+    ...         ]},
+    ...         {"handle": "com.bar", "trackers": ["Some Tracker", {"name": "Facebook Ads"}]},
+    ...         {"handle": "com.clean", "reports": [{"trackers": []}]},
+    ...     ],
+    ... })
+    >>> sorted(tracker_names.items())
+    [(70, 'Facebook Ads'), (105, 'Google Firebase Analytics'), (106, 'Some Tracker')]
+    >>> sorted(packages.items())
+    [('com.bar', [106, 70]), ('com.clean', []), ('com.foo', [70, 105])]
+    >>> parse_dump([])
+    Traceback (most recent call last):
+        ...
+    adb_uninstall.tracker_db.TrackerDBError: Invalid dump: must be a JSON object with "applications"
+    """
+    if not isinstance(data, dict) or "applications" not in data:
+        raise TrackerDBError('Invalid dump: must be a JSON object with "applications"')
+
+    tracker_names = {}
+    for tracker_id, tracker in (data.get("trackers") or {}).items():
+        try:
+            tracker_names[int(tracker_id)] = tracker["name"] if isinstance(tracker, dict) else str(tracker)
+        except (KeyError, ValueError) as err:
+            raise TrackerDBError("Invalid tracker %r: %s" % (tracker_id, err))
+    name2id = {name: tracker_id for tracker_id, name in tracker_names.items()}
+
+    def get_tracker_id(tracker):
+        if isinstance(tracker, dict):
+            tracker = tracker.get("name") or tracker.get("id")
+        if isinstance(tracker, int) or (isinstance(tracker, str) and tracker.isdigit()):
+            tracker_id = int(tracker)
+            tracker_names.setdefault(tracker_id, "tracker #%i" % tracker_id)
+            return tracker_id
+        tracker_id = name2id.get(tracker)
+        if tracker_id is None:
+            tracker_id = name2id[tracker] = max(tracker_names, default=0) + 1
+            tracker_names[tracker_id] = tracker
+        return tracker_id
+
+    applications = data["applications"]
+    if isinstance(applications, dict):
+        applications = [dict(app, handle=handle) for handle, app in applications.items()]
+
+    packages = {}
+    for app in applications:
+        package_name = app.get("handle") or app.get("package")
+        if not package_name:
+            log.error("Skip application without handle: %r", app)
+            continue
+        if "trackers" in app:
+            trackers = app["trackers"]
+        else:
+            reports = app.get("reports") or []
+            if not reports:
+                continue  # Not analysed: unknown, not clean
+            trackers = max(reports, key=_version_code).get("trackers") or []
+
+        tracker_ids = []
+        for tracker in trackers:
+            tracker_id = get_tracker_id(tracker)
+            if tracker_id not in tracker_ids:
+                tracker_ids.append(tracker_id)
+        packages[package_name] = tracker_ids
+
+    return tracker_names, packages
+
+
+def load_dump(filepath):
+    opener = gzip.open if filepath.endswith(".gz") else open
+    try:
+        with opener(filepath, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError as err:  # json.JSONDecodeError or UnicodeDecodeError
+        raise TrackerDBError("Can't parse %s: %s" % (filepath, err))
+
+
+def import_dump(dump_path, db_path=TRACKER_DB_PATH):
+    """
+    Build a new index from the dump file and replace the old one atomically.
+    Returns a dict with the number of imported packages and trackers.
+    """
+    tracker_names, packages = parse_dump(load_dump(dump_path))
+
+    db_path = os.path.expanduser(db_path)
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    temp_path = "%s.tmp" % db_path
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    connection = sqlite3.connect(temp_path)
+    try:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany("INSERT INTO trackers VALUES (?, ?)", tracker_names.items())
+        connection.executemany(
+            "INSERT INTO packages VALUES (?, ?)",
+            (
+                (package_name, ",".join(str(tracker_id) for tracker_id in tracker_ids))
+                for package_name, tracker_ids in packages.items()
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            (("source", os.path.abspath(dump_path)), ("imported", time.strftime("%Y-%m-%d %H:%M:%S"))),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+
+    log.info("%i packages with %i trackers imported into %s", len(packages), len(tracker_names), db_path)
+    return {"packages": len(packages), "trackers": len(tracker_names), "path": db_path}
+
+
+class TrackerDB:
+    """
+    Lazy loaded, read only access to the index of import_dump()
+    Must be used in one thread only (the SQLite connection).
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as temp_path:
+    ...     dump_path = os.path.join(temp_path, "dump.json")
+    ...     with open(dump_path, "w") as f:
+    ...         json.dump({"applications": {"com.foo": {"trackers": ["A", "B"]}, "com.bar": {"trackers": []}}}, f)
+    ...     db = TrackerDB(path=os.path.join(temp_path, "trackers.sqlite"))
+    ...     print(db.lookup(["com.foo", "com.bar", "com.unknown"]))
+    ...     print(import_dump(dump_path, db.path)["packages"])
+    ...     db.reload()
+    ...     print(sorted(db.lookup(["com.foo", "com.bar", "com.unknown"]).items()))
+    ...     db.close()
+    {}
+    2
+    [('com.bar', ()), ('com.foo', ('A', 'B'))]
+    """
+
+    def __init__(self, *, path=TRACKER_DB_PATH):
+        self.path = os.path.expanduser(path)
+        self.connection = None
+        self.tracker_names = None  # id (as text) -> name, loaded on first use
+        self.decoded = None  # Cache: comma separated tracker ids -> tuple of tracker names
+
+    @property
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _connect(self):
+        """
+        Returns the connection (or None if nothing was imported)
+        """
+        if self.connection is None:
+            if not self.exists:
+                return None
+            self.connection = sqlite3.connect("file:%s?mode=ro" % urllib.parse.quote(self.path), uri=True)
+            self.tracker_names = dict(self.connection.execute("SELECT CAST(id AS TEXT), name FROM trackers"))
+            self.decoded = {"": ()}
+        return self.connection
+
+    def lookup(self, package_names):
+        """
+        Returns a dict: package name -> tuple of tracker names.
+        Packages without a report are missing: unknown is not the same as "no trackers".
+        """
+        try:
+            connection = self._connect()
+        except sqlite3.Error as err:
+            log.error("Can't open tracker database %s: %s", self.path, err)
+            return {}
+        if connection is None:
+            return {}
+
+        tracker_names = self.tracker_names
+        decoded = self.decoded  # Many packages have the same trackers
+        package_names = list(package_names)
+        result = {}
+        for start in range(0, len(package_names), LOOKUP_CHUNK_SIZE):
+            chunk = package_names[start:start + LOOKUP_CHUNK_SIZE]
+            rows = connection.execute(
+                "SELECT package, trackers FROM packages WHERE package IN (%s)" % ",".join("?" * len(chunk)), chunk
+            )
+            for package_name, tracker_ids in rows:
+                trackers = decoded.get(tracker_ids)
+                if trackers is None:
+                    trackers = decoded[tracker_ids] = tuple(
+                        [tracker_names.get(tracker_id, tracker_id) for tracker_id in tracker_ids.split(",")]
+                    )
+                result[package_name] = trackers
+        return result
+
+    def reload(self):
+        """
+        Use a new imported index on the next lookup.
+        """
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.tracker_names = None
+        self.decoded = None
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
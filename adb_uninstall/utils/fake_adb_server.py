@@ -0,0 +1,137 @@
+"""
+    A fake adb server that speaks the adb smart-socket protocol.
+
+    Useful to test the AdbClient without the adb binary and without a device.
+"""
+
+import logging
+import socketserver
+import subprocess
+import threading
+
+log = logging.getLogger(__name__)
+
+FAKE_ADB_VERSION = 41
+
+
+def run_local_shell(serial, command):
+    """
+    Default shell handler: Just run the command in the local shell.
+    """
+    completed_process = subprocess.run(
+        ["sh", "-c", command], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    return completed_process.stdout
+
+
+class FakeAdbRequestHandler(socketserver.BaseRequestHandler):
+    def read_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def read_request(self):
+        size = int(self.read_exactly(4), 16)
+        return self.read_exactly(size).decode("utf-8")
+
+    def okay(self, data=None):
+        self.request.sendall(b"OKAY")
+        if data is not None:
+            data = data.encode("utf-8")
+            self.request.sendall(b"%04x%s" % (len(data), data))
+
+    def fail(self, message):
+        message = message.encode("utf-8")
+        self.request.sendall(b"FAIL%04x%s" % (len(message), message))
+
+    def handle(self):
+        server = self.server
+        serial = None
+        while True:
+            try:
+                request = self.read_request()
+            except (EOFError, ValueError, ConnectionError):
+                return
+
+            server.requests.append(request)
+            log.debug("fake adb server request: %r", request)
+
+            if request == "host:version":
+                self.okay("%04x" % FAKE_ADB_VERSION)
+                return
+            elif request in ("host:devices", "host:devices-l"):
+                lines = []
+                for no, device_serial in enumerate(server.serials, 1):
+                    if request == "host:devices":
+                        lines.append("%s\tdevice\n" % device_serial)
+                    else:
+                        lines.append(
+                            "%-22s device product:fake model:Fake_%i device:fake transport_id:%i\n"
+                            % (device_serial, no, no)
+                        )
+                self.okay("".join(lines))
+                return
+            elif request == "host:transport-any":
+                if len(server.serials) != 1:
+                    self.fail("more than one device/emulator" if server.serials else "no devices/emulators found")
+                    return
+                serial = server.serials[0]
+                self.okay()
+            elif request.startswith("host:transport:"):
+                serial = request[15:]
+                if serial not in server.serials:
+                    self.fail("device '%s' not found" % serial)
+                    return
+                self.okay()
+            elif serial is not None and request.startswith(("shell:", "exec:")):
+                command = request.split(":", 1)[1]
+                self.okay()
+                self.request.sendall(server.shell_handler(serial, command))
+                return
+            else:
+                self.fail("unknown host service")
+                return
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """
+    >>> with FakeAdbServer(serials=["XYZ1234"]) as server:
+    ...     server.port > 0
+    True
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *, serials, shell_handler=run_local_shell, host="127.0.0.1", port=0):
+        self.serials = list(serials)
+        self.shell_handler = shell_handler
+        self.requests = []
+        super().__init__((host, port), FakeAdbRequestHandler)
+        self.host, self.port = self.server_address
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake adb server", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    print(doctest.testmod())
@@ -20,3 +20,25 @@ def human_duration(t):
     if t < 60:
         return "%.1f sec" % round(t, 1)
     return "%.1f min" % round(t / 60, 1)
+
+
+def human_filesize(size):
+    """
+    Converts a byte count into a friendly text representation.
+
+    >>> human_filesize(999)
+    '999 Bytes'
+    >>> human_filesize(1024)
+    '1.0 KB'
+    >>> human_filesize(15.5 * 1024 * 1024)
+    '15.5 MB'
+    >>> human_filesize(3 * 1024 ** 3)
+    '3.0 GB'
+    """
+    if size < 1024:
+        return "%i Bytes" % size
+    for unit in ("KB", "MB"):
+        size /= 1024
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+    return "%.1f GB" % (size / 1024)
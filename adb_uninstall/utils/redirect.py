@@ -1,69 +1,152 @@
+"""
+    Redirect the stdout/stderr output of the current task.
+
+    sys.stdout and sys.stderr are replaced only once by a ContextStream proxy.
+    The redirect target is stored in a context variable, so every thread
+    (and every asyncio task) has its own redirect and concurrent tasks
+    don't see the output of each other.
+"""
+
 import logging
 import sys
+import threading
 from io import StringIO
 
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
 log = logging.getLogger(__name__)
 
 
+class _ThreadLocalVar:
+    """
+    Minimal ContextVar replacement for Python < 3.7: one value per thread, no asyncio support.
+    """
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+        self.local = threading.local()
+
+    def get(self):
+        return getattr(self.local, "value", self.default)
+
+    def set(self, value):
+        token = self.get()
+        self.local.value = value
+        return token
+
+    def reset(self, token):
+        self.local.value = token
+
+
+if contextvars is None:
+    _stdout_target = _ThreadLocalVar("adb_uninstall_stdout", default=None)
+    _stderr_target = _ThreadLocalVar("adb_uninstall_stderr", default=None)
+else:
+    _stdout_target = contextvars.ContextVar("adb_uninstall_stdout", default=None)
+    _stderr_target = contextvars.ContextVar("adb_uninstall_stderr", default=None)
+
+_install_lock = threading.Lock()
+
+
+class ContextStream:
+    """
+    Proxy for sys.stdout/sys.stderr: write() goes to the target of the current context
+    (and to the original stream, if 'tee' is set) or to the original stream.
+    """
+
+    def __init__(self, original, target_var):
+        self.original = original
+        self.target_var = target_var
+
+    def write(self, text):
+        target = self.target_var.get()
+        if target is None:
+            return self.original.write(text)
+
+        write, tee = target
+        write(text)
+        if tee:
+            self.original.write(text)
+            self.original.flush()
+        return len(text)
+
+    def flush(self):
+        self.original.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+def install_context_streams():
+    """
+    Replace sys.stdout/sys.stderr with ContextStream proxies (only once)
+    """
+    with _install_lock:
+        if not isinstance(sys.stdout, ContextStream):
+            sys.stdout = ContextStream(sys.stdout, _stdout_target)
+        if not isinstance(sys.stderr, ContextStream):
+            sys.stderr = ContextStream(sys.stderr, _stderr_target)
+
+
 class RedirectStdoutStderr(object):
     """
-    Context manager to redirect stdout / stderr
+    Context manager to redirect stdout / stderr of the current thread/task
 
     >>> stdout_buffer = StringIO()
-    >>> with RedirectStdoutStderr(stdout=stdout_buffer, tee=True):
-    ...     print("output to **stdout** !")
-    ...     sys.stderr.write("output to **stderr** !")
-    >>>
+    >>> with RedirectStdoutStderr(stdout_write=stdout_buffer.write, tee=True):
+    ...     print("output to **stdout** !", end="")
+    output to **stdout** !
     >>> stdout_buffer.getvalue()
     'output to **stdout** !'
 
 
     >>> stdout_buffer = StringIO()
     >>> stderr_buffer = StringIO()
-    >>> with RedirectStdoutStderr(stdout=stdout_buffer, stderr=stderr_buffer):
-    ...     print("output to **stdout** !")
-    ...     sys.stderr.write("output to **stderr** !")
-    >>>
+    >>> with RedirectStdoutStderr(stdout_write=stdout_buffer.write, stderr_write=stderr_buffer.write, tee=False):
+    ...     print("output to **stdout** !", end="")
+    ...     _ = sys.stderr.write("output to **stderr** !")
     >>> stdout_buffer.getvalue()
     'output to **stdout** !'
     >>> stderr_buffer.getvalue()
     'output to **stderr** !'
+
+    Other threads are not affected:
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> def task(no):
+    ...     buffer = StringIO()
+    ...     with RedirectStdoutStderr(stdout_write=buffer.write, tee=False):
+    ...         for i in range(100):
+    ...             print(no, end="")
+    ...     return buffer.getvalue()
+    >>> with ThreadPoolExecutor(max_workers=4) as executor:
+    ...     results = list(executor.map(task, range(4)))
+    >>> results == ["0" * 100, "1" * 100, "2" * 100, "3" * 100]
+    True
     """
 
     def __init__(self, stdout_write=None, stderr_write=None, tee=True):
         self._stdout_write = stdout_write
         self._stderr_write = stderr_write
         self.tee = tee
-
-    def stdout_write(self, *args):
-        self._stdout_write(*args)
-        if self.tee:
-            self.old_stdout_write(*args)
-            sys.stdout.flush()
-
-    def stderr_write(self, *args):
-        self._stderr_write(*args)
-        if self.tee:
-            self.old_stderr_write(*args)
-            sys.stderr.flush()
+        self.tokens = []
 
     def __enter__(self):
+        install_context_streams()
         if self._stdout_write is not None:
-            log.debug("redirect sys.stdout (tee:%r)", self.tee)
-            self.old_stdout_write = sys.stdout.write
-            sys.stdout.write = self.stdout_write
-
+            self.tokens.append((_stdout_target, _stdout_target.set((self._stdout_write, self.tee))))
         if self._stderr_write is not None:
-            log.debug("redirect sys.stderr (tee:%r)", self.tee)
-            self.old_stderr_write = sys.stderr.write
-            sys.stderr.write = self.stderr_write
+            self.tokens.append((_stderr_target, _stderr_target.set((self._stderr_write, self.tee))))
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._stdout_write is not None:
-            sys.stdout.write = self.old_stdout_write
-
-        if self._stderr_write is not None:
-            sys.stderr.write = self.old_stderr_write
+        while self.tokens:
+            target_var, token = self.tokens.pop()
+            target_var.reset(token)
 
 
 if __name__ == "__main__":
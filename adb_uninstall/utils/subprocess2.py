@@ -1,6 +1,7 @@
 import logging
 import subprocess
 import sys
+import threading
 import time
 
 from adb_uninstall.utils.humanize import human_duration
@@ -36,6 +37,46 @@ def verbose_check_output(*popenargs, timeout=5, **kwargs):
     return output
 
 
+def verbose_iter_output(*popenargs, timeout=5, **kwargs):
+    """
+    'verbose' streaming version of subprocess.check_output():
+    Yields the output lines (without line endings) as soon as they arrive.
+    """
+    print("Call: %r..." % " ".join(popenargs), flush=True)
+
+    start_time = time.time()
+
+    process = subprocess.Popen(
+        popenargs, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, **kwargs
+    )
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        for line in process.stdout:
+            yield line.rstrip("\r\n")
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        exit_code = process.wait()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(popenargs, timeout)
+
+    duration = time.time() - start_time
+    print("Call: %r (exit code:%r after %s)" % (" ".join(popenargs), exit_code, human_duration(duration)))
+
+    if exit_code != 0:
+        raise subprocess.CalledProcessError(exit_code, popenargs)
+
+
 if __name__ == "__main__":
     if "stdout" in sys.argv:
         sys.stdout.write("output to **stdout** !")
@@ -47,3 +88,4 @@ if __name__ == "__main__":
 
     print(verbose_check_output("python3", __file__, "stdout"))
     print(verbose_check_output("python3", __file__, "stderr"))
+    print(list(verbose_iter_output("python3", __file__, "stdout")))